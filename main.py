@@ -2,10 +2,28 @@ import os
 import asyncio
 from dotenv import load_dotenv
 from src import poll_sqs_queue, process_file_event
+from src.file_processor import warn_if_skip_unchanged_inactive
+from src.metrics import METRICS_ENABLED, start_metrics_server
+from src.process_pool import shutdown_process_pool
+from src.utils import get_upsert_outbox, shutdown_upsert_outbox
+from src.warmup import prewarm
 
 load_dotenv()
 
 QUEUE_URL = os.getenv("QUEUE_URL")
+SQS_DAEMON = os.getenv("SQS_DAEMON", "false").lower() == "true"
+PREWARM = os.getenv("PREWARM", "false").lower() == "true"
 
 if __name__ == "__main__":
-    asyncio.run(poll_sqs_queue(QUEUE_URL, process_file_event))
+    if METRICS_ENABLED:
+        start_metrics_server()
+    if PREWARM:
+        prewarm()
+    # Starts replaying vectors a previous run left in the outbox, if enabled
+    get_upsert_outbox()
+    warn_if_skip_unchanged_inactive()
+    try:
+        asyncio.run(poll_sqs_queue(QUEUE_URL, process_file_event, daemon=SQS_DAEMON))
+    finally:
+        shutdown_process_pool()
+        shutdown_upsert_outbox()
@@ -2,17 +2,30 @@ from .utils import (
     chunk_documents,
     generate_document_embeddings,
     upsert_embeddings,
+    upsert_embeddings_batch,
     delete_embeddings,
+    list_embedding_ids,
+    fetch_embedding_metadata,
+    fetch_chunk_texts,
 )
 
 from .document_handler import process_file_event
 from .message_processor import poll_sqs_queue
+from .sqs_worker import SQSWorker, run_sqs_worker
+from .warmup import prewarm
 
 __all__ = [
     "chunk_documents",
     "generate_document_embeddings",
     "upsert_embeddings",
+    "upsert_embeddings_batch",
     "delete_embeddings",
+    "list_embedding_ids",
+    "fetch_embedding_metadata",
+    "fetch_chunk_texts",
     "process_file_event",
     "poll_sqs_queue",
+    "SQSWorker",
+    "run_sqs_worker",
+    "prewarm",
 ]
@@ -0,0 +1,259 @@
+import asyncio
+import collections
+import contextlib
+import os
+import threading
+import time
+from typing import AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+from .metrics import inc, set_gauge
+
+load_dotenv()
+
+# "false" keeps every limit fixed at its initial value
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+
+# A call slower than this multiple of the recent healthy latency is a spike
+LATENCY_SPIKE_FACTOR = float(os.getenv("ADAPTIVE_LATENCY_SPIKE_FACTOR", "3.0"))
+
+# Share of the limit kept after a 429, 5xx or latency spike
+BACKOFF_RATIO = float(os.getenv("ADAPTIVE_BACKOFF_RATIO", "0.5"))
+
+# Initial and largest number of calls in flight per service
+LIMITS = {
+    "openai": (
+        int(os.getenv("OPENAI_EMBEDDING_CONCURRENCY", "8")),
+        int(os.getenv("OPENAI_EMBEDDING_MAX_CONCURRENCY", "32")),
+    ),
+    "pinecone": (
+        int(os.getenv("PINECONE_CONCURRENCY", "8")),
+        # Calls beyond the pool size would only queue for a thread
+        int(os.getenv("PINECONE_POOL_SIZE", "16")),
+    ),
+}
+
+# gRPC status names that mean the server is overloaded
+_GRPC_THROTTLE_CODES = ("RESOURCE_EXHAUSTED", "UNAVAILABLE")
+
+
+def throttle_reason(error: BaseException) -> Optional[str]:
+    """Return why a failed call means the service is overloaded, or None."""
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        if status == 429:
+            return "rate_limit"
+        if status >= 500:
+            return "server_error"
+        return None
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return "connection"
+    message = str(error)
+    if any(code in message for code in _GRPC_THROTTLE_CODES):
+        return "server_error"
+    return None
+
+
+class AdaptiveLimiter:
+    """
+    Concurrency limit for one remote service, tuned by AIMD as calls complete.
+
+    Each successful call at a saturated limit adds 1/limit, so the limit grows
+    by about one per round of calls while latency stays healthy. A 429, a 5xx
+    or a call slower than LATENCY_SPIKE_FACTOR times the recent healthy
+    latency cuts the limit to BACKOFF_RATIO of its value, at most once per
+    cooldown so a burst of failures from one overload counts once.
+
+    Calls that pass a size (e.g. tokens sent) are judged against the healthy
+    latency of a call of average size, scaled up for larger calls, so a big
+    request isn't mistaken for a spike.
+
+    Slots are taken with `async with limiter.slot()` from the event loop or
+    `with limiter.sync_slot()` from threads; both share the same count.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        maximum: int,
+        minimum: int = 1,
+        adaptive: bool = ADAPTIVE_CONCURRENCY,
+        backoff_ratio: float = BACKOFF_RATIO,
+        latency_spike_factor: float = LATENCY_SPIKE_FACTOR,
+        cooldown: float = 1.0,
+    ):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.adaptive = adaptive
+        self.backoff_ratio = backoff_ratio
+        self.latency_spike_factor = latency_spike_factor
+        self.cooldown = cooldown
+        self.throttle_events = 0
+
+        self._limit = float(min(max(initial, self.minimum), self.maximum))
+        self._in_flight = 0
+        self._baseline: Optional[float] = None
+        self._baseline_size: Optional[float] = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = (
+            collections.deque()
+        )
+        set_gauge("concurrency_limit", self.limit, service=name)
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    async def acquire(self) -> None:
+        """Wait for a slot from the event loop; waiters are served in FIFO order."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if not self._waiters and self._in_flight < self.limit:
+                self._in_flight += 1
+                return
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await waiter[1]
+        except asyncio.CancelledError:
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+            raise
+
+    def acquire_sync(self) -> None:
+        """Block the calling thread until a slot is free."""
+        with self._available:
+            self._available.wait_for(
+                lambda: not self._waiters and self._in_flight < self.limit
+            )
+            self._in_flight += 1
+
+    def release(
+        self,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None,
+        size: Optional[float] = None,
+    ) -> None:
+        """Give back a slot and adjust the limit from the call's outcome."""
+        reason = throttle_reason(error) if error is not None else None
+        with self._lock:
+            saturated = self._in_flight >= self.limit
+            self._in_flight -= 1
+            if self.adaptive:
+                if reason is None and error is None and latency is not None:
+                    latency /= self._size_scale(size)
+                    if (
+                        self._baseline is not None
+                        and latency > self.latency_spike_factor * self._baseline
+                    ):
+                        reason = "latency"
+                    else:
+                        self._baseline = (
+                            latency
+                            if self._baseline is None
+                            else 0.9 * self._baseline + 0.1 * latency
+                        )
+                        if saturated:
+                            self._limit = min(
+                                self.maximum, self._limit + 1 / self._limit
+                            )
+            cut = False
+            if reason is not None:
+                self.throttle_events += 1
+                cut = self.adaptive and self._decrease()
+            self._grant()
+            limit = self.limit
+
+        set_gauge("concurrency_limit", limit, service=self.name)
+        if reason is not None:
+            inc("throttle_events_total", service=self.name, reason=reason)
+        if cut:
+            print(f"Throttling {self.name} ({reason}): concurrency limit now {limit}")
+
+    def _size_scale(self, size: Optional[float]) -> float:
+        """How many average-sized calls this call counts as, and at least one."""
+        if not size:
+            return 1.0
+        if self._baseline_size is None:
+            self._baseline_size = size
+        scale = max(1.0, size / self._baseline_size)
+        self._baseline_size = 0.9 * self._baseline_size + 0.1 * size
+        return scale
+
+    def _decrease(self) -> bool:
+        """Cut the limit unless it was already cut within the cooldown."""
+        now = time.monotonic()
+        if now - self._last_decrease < max(self.cooldown, self._baseline or 0.0):
+            return False
+        self._last_decrease = now
+        self._limit = max(self.minimum, self._limit * self.backoff_ratio)
+        return True
+
+    def _grant(self) -> None:
+        """Hand free slots to waiting coroutines first, then to waiting threads."""
+        while self._waiters and self._in_flight < self.limit:
+            loop, future = self._waiters.popleft()
+            self._in_flight += 1
+            loop.call_soon_threadsafe(self._resolve, future)
+        self._available.notify_all()
+
+    def _resolve(self, future: asyncio.Future) -> None:
+        if future.cancelled():
+            # The waiter was cancelled after being granted a slot
+            with self._lock:
+                self._in_flight -= 1
+                self._grant()
+        else:
+            future.set_result(None)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, size: Optional[float] = None) -> AsyncIterator[None]:
+        """Hold a slot for one call made from the event loop."""
+        await self.acquire()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.monotonic() - start, size=size)
+
+    @contextlib.contextmanager
+    def sync_slot(self, size: Optional[float] = None) -> Iterator[None]:
+        """Hold a slot for one blocking call made from a thread."""
+        self.acquire_sync()
+        start = time.monotonic()
+        try:
+            yield
+        except BaseException as e:
+            self.release(error=e)
+            raise
+        self.release(latency=time.monotonic() - start, size=size)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "limit": self.limit,
+            "in_flight": self._in_flight,
+            "throttle_events": self.throttle_events,
+        }
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_adaptive_limiter(service: str) -> AdaptiveLimiter:
+    """Return the process-wide limiter shared by every call site of a service."""
+    with _limiters_lock:
+        if service not in _limiters:
+            initial, maximum = LIMITS[service]
+            _limiters[service] = AdaptiveLimiter(service, initial, maximum)
+        return _limiters[service]
@@ -0,0 +1,21 @@
+from .corpus import generate_corpus
+from .fakes import (
+    FakeAsyncOpenAI,
+    FakePineconeIndex,
+    InMemorySQS,
+    LocalS3Client,
+    ServiceProfile,
+    install_fakes,
+)
+from .runner import run_benchmark
+
+__all__ = [
+    "generate_corpus",
+    "FakeAsyncOpenAI",
+    "FakePineconeIndex",
+    "InMemorySQS",
+    "LocalS3Client",
+    "ServiceProfile",
+    "install_fakes",
+    "run_benchmark",
+]
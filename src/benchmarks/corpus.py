@@ -0,0 +1,139 @@
+"""Deterministic synthetic documents of every supported type for benchmarks."""
+
+import csv
+import os
+import random
+from typing import Dict, List, Optional
+
+WORDS = (
+    "the invoice contract payment supplier quarterly revenue agreement party "
+    "shall terms delivery customer report total amount due within days of "
+    "receipt services provided according to schedule section clause liability "
+    "insurance confidential information obligations notice termination"
+).split()
+
+CUSTOMERS = ["Acme Corp", "Globex", "Initech", "Umbrella", "Hooli", "Stark Ltd"]
+PRODUCTS = ["Widget", "Gadget", "Sprocket", "Flange", "Gear", "Bracket"]
+
+# Words placed on each generated PDF page
+WORDS_PER_PDF_PAGE = 350
+
+DEFAULT_MIX = {"txt": 4, "pdf": 2, "csv": 2, "xlsx": 1}
+
+
+def sentences(rng: random.Random, words: int) -> List[str]:
+    """Return sentences of 8-30 words totalling the given number of words."""
+    result = []
+    while words > 0:
+        length = min(words, rng.randint(8, 30))
+        result.append(
+            " ".join(rng.choice(WORDS) for _ in range(length)).capitalize() + "."
+        )
+        words -= length
+    return result
+
+
+def paragraphs(rng: random.Random, words: int) -> str:
+    sents = sentences(rng, words)
+    return "\n\n".join(" ".join(sents[i : i + 6]) for i in range(0, len(sents), 6))
+
+
+def table_rows(rng: random.Random, rows: int) -> List[list]:
+    """Order-like rows with a free-text notes column."""
+    return [
+        [
+            i + 1,
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            rng.choice(CUSTOMERS),
+            rng.choice(PRODUCTS),
+            rng.randint(1, 500),
+            round(rng.uniform(5, 5000), 2),
+            " ".join(sentences(rng, rng.randint(6, 24))),
+        ]
+        for i in range(rows)
+    ]
+
+
+TABLE_HEADER = ["id", "date", "customer", "product", "quantity", "amount", "notes"]
+
+
+def write_txt(path: str, rng: random.Random, words: int) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(paragraphs(rng, words))
+
+
+def write_pdf(path: str, rng: random.Random, words: int) -> None:
+    import pymupdf
+
+    pdf = pymupdf.open()
+    try:
+        remaining = words
+        while remaining > 0:
+            page = pdf.new_page()
+            page_words = min(remaining, WORDS_PER_PDF_PAGE)
+            page.insert_textbox(
+                page.rect + (48, 48, -48, -48), paragraphs(rng, page_words), fontsize=9
+            )
+            remaining -= page_words
+        pdf.save(path)
+    finally:
+        pdf.close()
+
+
+def write_csv(path: str, rng: random.Random, rows: int) -> None:
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLE_HEADER)
+        writer.writerows(table_rows(rng, rows))
+
+
+def write_xlsx(path: str, rng: random.Random, rows: int, sheets: int = 2) -> None:
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for sheet in range(sheets):
+        worksheet = workbook.create_sheet(f"Orders {sheet + 1}")
+        worksheet.append(TABLE_HEADER)
+        for row in table_rows(rng, rows // sheets):
+            worksheet.append(row)
+    workbook.save(path)
+
+
+def generate_corpus(
+    directory: str,
+    mix: Optional[Dict[str, int]] = None,
+    words_per_doc: int = 3000,
+    rows_per_table: int = 400,
+    seed: int = 0,
+) -> List[str]:
+    """
+    Write a reproducible corpus into directory and return the relative keys.
+
+    Args:
+        directory: Destination, e.g. a LocalS3Client bucket directory
+        mix: Number of files per type, keyed by extension without the dot
+        words_per_doc: Words in each txt and pdf file
+        rows_per_table: Rows in each csv file and across each xlsx workbook
+        seed: Same seed, same files
+    """
+    mix = DEFAULT_MIX if mix is None else mix
+    writers = {
+        "txt": lambda path, rng: write_txt(path, rng, words_per_doc),
+        "pdf": lambda path, rng: write_pdf(path, rng, words_per_doc),
+        "csv": lambda path, rng: write_csv(path, rng, rows_per_table),
+        "xlsx": lambda path, rng: write_xlsx(path, rng, rows_per_table),
+    }
+    unknown = set(mix) - set(writers)
+    if unknown:
+        raise ValueError(f"Unsupported corpus file types: {sorted(unknown)}")
+
+    keys = []
+    for extension, count in mix.items():
+        os.makedirs(os.path.join(directory, extension), exist_ok=True)
+        for i in range(count):
+            key = f"{extension}/doc-{i:05d}.{extension}"
+            # Seed per file so changing the mix doesn't change the other files
+            rng = random.Random(f"{seed}:{key}")
+            writers[extension](os.path.join(directory, *key.split("/")), rng)
+            keys.append(key)
+    return keys
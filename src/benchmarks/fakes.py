@@ -0,0 +1,566 @@
+"""
+In-process stand-ins for S3, SQS, OpenAI embeddings and the Pinecone index.
+
+They implement only the calls the pipeline makes, with the same request and
+response shapes, so the real code paths run unchanged. The embeddings and
+vector-store fakes add configurable latency, rate limits and random failures.
+"""
+
+import asyncio
+import base64
+import hashlib
+import io
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, Iterator, List, Optional, Union
+import numpy as np
+
+
+def _client_error(code: str, operation: str, status: int = 404) -> Exception:
+    import botocore.exceptions
+
+    error: Exception = botocore.exceptions.ClientError(
+        {"Error": {"Code": code}, "ResponseMetadata": {"HTTPStatusCode": status}},
+        operation,
+    )
+    return error
+
+
+def _etag(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return f'"{digest.hexdigest()}"'
+
+
+class _Body(io.FileIO):
+    """File-backed stand-in for botocore's StreamingBody."""
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        return iter(lambda: self.read(chunk_size), b"")
+
+
+class _ListObjectsPaginator:
+    def __init__(self, s3: "LocalS3Client"):
+        self.s3 = s3
+
+    def paginate(
+        self, Bucket: str, Prefix: str = "", StartAfter: str = "", **kwargs: Any
+    ) -> Iterator[Dict[str, Any]]:
+        page_size = kwargs.get("PaginationConfig", {}).get("PageSize", 1000)
+        keys = [key for key in self.s3.keys(Bucket, Prefix) if key > StartAfter]
+        for i in range(0, len(keys), page_size):
+            yield {
+                "Contents": [
+                    self.s3._describe(Bucket, key) for key in keys[i : i + page_size]
+                ],
+                "KeyCount": len(keys[i : i + page_size]),
+            }
+
+
+class LocalS3Client:
+    """S3 client serving objects from files under root/<bucket>/<key>."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.gets = 0
+        self.bytes_read = 0
+        self._etags: Dict[str, tuple] = {}
+
+    def _path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split("/"))
+
+    def _describe(self, bucket: str, key: str) -> Dict[str, Any]:
+        path = self._path(bucket, key)
+        stat = os.stat(path)
+        cached = self._etags.get(path)
+        if cached is None or cached[0] != stat.st_mtime_ns:
+            cached = self._etags[path] = (stat.st_mtime_ns, _etag(path))
+        return {
+            "Key": key,
+            "Size": stat.st_size,
+            "ETag": cached[1],
+            "LastModified": stat.st_mtime,
+        }
+
+    def keys(self, bucket: str, prefix: str = "") -> List[str]:
+        base = os.path.join(self.root, bucket)
+        keys = []
+        for directory, _, files in os.walk(base):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), base)
+                key = key.replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def head_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        if not os.path.isfile(self._path(Bucket, Key)):
+            raise _client_error("404", "HeadObject")
+        info = self._describe(Bucket, Key)
+        return {"ContentLength": info["Size"], "ETag": info["ETag"]}
+
+    def get_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        path = self._path(Bucket, Key)
+        if not os.path.isfile(path):
+            raise _client_error("NoSuchKey", "GetObject")
+        info = self._describe(Bucket, Key)
+        if kwargs.get("IfNoneMatch") == info["ETag"]:
+            raise _client_error("304", "GetObject", status=304)
+        self.gets += 1
+        self.bytes_read += info["Size"]
+        return {
+            "Body": _Body(path),
+            "ContentLength": info["Size"],
+            "ETag": info["ETag"],
+        }
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs: Any) -> Dict:
+        path = self._path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(Body)
+        return {"ETag": self._describe(Bucket, Key)["ETag"]}
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict:
+        try:
+            os.remove(self._path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def delete_objects(
+        self, Bucket: str, Delete: Dict[str, Any], **kwargs: Any
+    ) -> Dict:
+        for obj in Delete["Objects"]:
+            self.delete_object(Bucket=Bucket, Key=obj["Key"])
+        return {}
+
+    def get_paginator(self, operation: str) -> _ListObjectsPaginator:
+        if operation != "list_objects_v2":
+            raise NotImplementedError(operation)
+        return _ListObjectsPaginator(self)
+
+
+class InMemorySQS:
+    """
+    Single-process SQS client with visibility timeouts.
+
+    Received messages become visible again once their visibility timeout
+    expires unless they are deleted first, like a real queue.
+    """
+
+    def __init__(self, default_visibility_timeout: int = 30):
+        self.default_visibility_timeout = default_visibility_timeout
+        self._lock = threading.Condition()
+        self._messages: Dict[str, Dict[str, Any]] = {}
+        self._order: deque = deque()
+        self.sent = 0
+        self.deleted = 0
+        self.redelivered = 0
+
+    def send_message(self, QueueUrl: str, MessageBody: str, **kwargs: Any) -> Dict:
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._messages[message_id] = {
+                "MessageId": message_id,
+                "Body": MessageBody,
+                "visible_at": 0.0,
+                "receipt_handle": None,
+                "receives": 0,
+            }
+            self._order.append(message_id)
+            self.sent += 1
+            self._lock.notify_all()
+        return {"MessageId": message_id}
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        WaitTimeSeconds: int = 0,
+        VisibilityTimeout: Optional[int] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        timeout = (
+            self.default_visibility_timeout
+            if VisibilityTimeout is None
+            else VisibilityTimeout
+        )
+        deadline = time.monotonic() + WaitTimeSeconds
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                received = []
+                for message_id in list(self._order):
+                    message = self._messages[message_id]
+                    if message["visible_at"] > now:
+                        continue
+                    if message["receives"]:
+                        self.redelivered += 1
+                    message["receives"] += 1
+                    message["visible_at"] = now + timeout
+                    message["receipt_handle"] = f"{message_id}:{message['receives']}"
+                    received.append(
+                        {
+                            "MessageId": message_id,
+                            "ReceiptHandle": message["receipt_handle"],
+                            "Body": message["Body"],
+                        }
+                    )
+                    if len(received) >= MaxNumberOfMessages:
+                        break
+                if received or now >= deadline:
+                    return {"Messages": received} if received else {}
+                self._lock.wait(min(0.05, deadline - now))
+
+    def _find(self, receipt_handle: str) -> Optional[str]:
+        message_id = receipt_handle.rsplit(":", 1)[0]
+        message = self._messages.get(message_id)
+        if message is None or message["receipt_handle"] != receipt_handle:
+            return None
+        return message_id
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str) -> Dict:
+        with self._lock:
+            message_id = self._find(ReceiptHandle)
+            if message_id is not None:
+                del self._messages[message_id]
+                self._order.remove(message_id)
+                self.deleted += 1
+        return {}
+
+    def delete_message_batch(self, QueueUrl: str, Entries: List[Dict]) -> Dict:
+        for entry in Entries:
+            self.delete_message(QueueUrl, entry["ReceiptHandle"])
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+    def change_message_visibility_batch(
+        self, QueueUrl: str, Entries: List[Dict]
+    ) -> Dict:
+        with self._lock:
+            now = time.monotonic()
+            for entry in Entries:
+                message_id = self._find(entry["ReceiptHandle"])
+                if message_id is not None:
+                    self._messages[message_id]["visible_at"] = (
+                        now + entry["VisibilityTimeout"]
+                    )
+            self._lock.notify_all()
+        return {"Successful": [{"Id": entry["Id"]} for entry in Entries]}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._messages)
+
+
+@dataclass
+class ServiceProfile:
+    """
+    Simulated behaviour of a remote service.
+
+    latency and per_item_latency are in seconds; requests_per_minute of 0
+    disables the rate limit; failure_rate is the probability that a request
+    fails with a retryable server error.
+    """
+
+    latency: float = 0.05
+    per_item_latency: float = 0.0
+    requests_per_minute: int = 0
+    failure_rate: float = 0.0
+    seed: int = 0
+
+
+class _RateWindow:
+    """Sliding one-minute request window shared by all callers."""
+
+    def __init__(self, requests_per_minute: int):
+        self.limit = requests_per_minute
+        self._times: deque = deque()
+        self._lock = threading.Lock()
+
+    def admit(self) -> bool:
+        if self.limit <= 0:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            while self._times and now - self._times[0] > 60:
+                self._times.popleft()
+            if len(self._times) >= self.limit:
+                return False
+            self._times.append(now)
+            return True
+
+
+class _Recorder:
+    """Request counters and latencies shared by the service fakes."""
+
+    def __init__(self, profile: ServiceProfile):
+        self.profile = profile
+        self.rate = _RateWindow(profile.requests_per_minute)
+        self.random = random.Random(profile.seed)
+        self.requests = 0
+        self.items = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def outcome(self, items: int) -> Optional[str]:
+        """Decide how a request ends: None, "rate_limited" or "failed"."""
+        with self._lock:
+            self.requests += 1
+            if not self.rate.admit():
+                self.rate_limited += 1
+                return "rate_limited"
+            if self.random.random() < self.profile.failure_rate:
+                self.failures += 1
+                return "failed"
+            self.items += items
+            return None
+
+    def delay(self, items: int) -> float:
+        return self.profile.latency + self.profile.per_item_latency * items
+
+    def record(self, seconds: float) -> None:
+        with self._lock:
+            self.latencies.append(seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "items": self.items,
+            "failures": self.failures,
+            "rate_limited": self.rate_limited,
+        }
+
+
+def _openai_error(status: int, message: str) -> Exception:
+    import httpx
+    import openai
+
+    response: Any = httpx.Response(
+        status,
+        headers={"retry-after": "1"} if status == 429 else {},
+        request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"),
+    )
+    error_type = {
+        400: openai.BadRequestError,
+        429: openai.RateLimitError,
+    }.get(status, openai.InternalServerError)
+    return error_type(message, response=response, body=None)
+
+
+class FakeEmbeddings:
+    """
+    The embeddings resource of an AsyncOpenAI client.
+
+    Vectors are deterministic per input text, so repeated runs and the
+    embedding cache behave like they do against the real API.
+    """
+
+    def __init__(self, profile: ServiceProfile):
+        self.recorder = _Recorder(profile)
+
+    @staticmethod
+    def vector(text: Union[str, List[int]], dimensions: int) -> np.ndarray:
+        if not isinstance(text, str):
+            # Token IDs, which the API accepts in place of text
+            text = " ".join(map(str, text))
+        seed = int.from_bytes(
+            hashlib.sha256(text.encode("utf-8")).digest()[:8], "little"
+        )
+        vector = np.random.default_rng(seed).standard_normal(dimensions)
+        vector /= np.linalg.norm(vector)
+        return vector.astype("<f4")
+
+    async def create(
+        self,
+        model: str,
+        input: List[Union[str, List[int]]],
+        dimensions: int = 1536,
+        encoding_format: str = "float",
+        **kwargs: Any,
+    ) -> SimpleNamespace:
+        if len({isinstance(item, str) for item in input}) > 1:
+            # Like the API, which takes strings or token arrays but not both
+            raise _openai_error(400, "'input' mixes strings and token arrays")
+        started = time.perf_counter()
+        outcome = self.recorder.outcome(len(input))
+        await asyncio.sleep(self.recorder.delay(len(input)))
+        self.recorder.record(time.perf_counter() - started)
+        if outcome == "rate_limited":
+            raise _openai_error(429, "Rate limit reached for requests")
+        if outcome == "failed":
+            raise _openai_error(500, "The server had an error processing the request")
+
+        data = []
+        for i, text in enumerate(input):
+            vector = self.vector(text, dimensions)
+            if encoding_format == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append(SimpleNamespace(index=i, embedding=embedding))
+        return SimpleNamespace(data=data, model=model)
+
+
+class FakeAsyncOpenAI:
+    """AsyncOpenAI stand-in exposing only the embeddings endpoint."""
+
+    def __init__(self, profile: Optional[ServiceProfile] = None):
+        self.embeddings = FakeEmbeddings(profile or ServiceProfile())
+
+
+class PineconeServiceError(Exception):
+    """Raised by FakePineconeIndex for injected failures and rate limits."""
+
+    def __init__(self, status: int, reason: str):
+        super().__init__(f"({status}) {reason}")
+        self.status = status
+
+
+class FakePineconeIndex:
+    """
+    Pinecone index holding vectors in a dict, enforcing the upsert limits.
+
+    Calls block for the simulated latency, like the real synchronous client.
+    """
+
+    def __init__(self, profile: Optional[ServiceProfile] = None):
+        self.recorder = _Recorder(profile or ServiceProfile(latency=0.02))
+        self.vectors: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _request(self, items: int) -> None:
+        started = time.perf_counter()
+        outcome = self.recorder.outcome(items)
+        time.sleep(self.recorder.delay(items))
+        self.recorder.record(time.perf_counter() - started)
+        if outcome == "rate_limited":
+            raise PineconeServiceError(429, "Too Many Requests")
+        if outcome == "failed":
+            raise PineconeServiceError(503, "Service Unavailable")
+
+    def upsert(
+        self, vectors: List[Dict[str, Any]], namespace: str = "", **kwargs: Any
+    ) -> Dict[str, int]:
+        if len(vectors) > 1000:
+            raise PineconeServiceError(400, "Upsert batch exceeds 1000 vectors")
+        self._request(len(vectors))
+        with self._lock:
+            for vector in vectors:
+                self.vectors[vector["id"]] = vector
+        return {"upserted_count": len(vectors)}
+
+    def fetch(
+        self, ids: List[str], namespace: str = "", **kwargs: Any
+    ) -> SimpleNamespace:
+        self._request(len(ids))
+        with self._lock:
+            found = {
+                vector_id: SimpleNamespace(
+                    id=vector_id,
+                    values=self.vectors[vector_id]["values"],
+                    metadata=self.vectors[vector_id].get("metadata"),
+                )
+                for vector_id in ids
+                if vector_id in self.vectors
+            }
+        return SimpleNamespace(vectors=found, namespace=namespace)
+
+    def list(
+        self, prefix: str = "", namespace: str = "", limit: int = 100, **kwargs: Any
+    ) -> Iterator[List[str]]:
+        with self._lock:
+            ids = sorted(vid for vid in self.vectors if vid.startswith(prefix))
+        for i in range(0, len(ids), limit):
+            self._request(0)
+            yield ids[i : i + limit]
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        delete_all: bool = False,
+        namespace: str = "",
+        filter: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        if ids and len(ids) > 1000:
+            raise PineconeServiceError(400, "Delete batch exceeds 1000 IDs")
+        self._request(len(ids or []))
+        with self._lock:
+            if delete_all:
+                self.vectors.clear()
+            for vector_id in ids or []:
+                self.vectors.pop(vector_id, None)
+            if filter:
+                for vector_id, vector in list(self.vectors.items()):
+                    metadata = vector.get("metadata") or {}
+                    if all(metadata.get(k) == v for k, v in filter.items()):
+                        del self.vectors[vector_id]
+        return {}
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.vectors)
+
+
+class WhitespaceEncoding:
+    """
+    Approximate tokenizer for fully offline runs.
+
+    Used only when the tiktoken encoding cannot be loaded (it is downloaded on
+    first use); splits on whitespace and counts 4/3 tokens per word.
+    """
+
+    def encode_ordinary_batch(self, texts: List[str]) -> List[List[int]]:
+        return [[0] * ((len(text.split()) * 4 + 2) // 3) for text in texts]
+
+
+def install_fakes(
+    s3: Optional[LocalS3Client] = None,
+    sqs: Optional[InMemorySQS] = None,
+    openai_client: Optional[FakeAsyncOpenAI] = None,
+    index: Optional[FakePineconeIndex] = None,
+) -> None:
+    """
+    Make the pipeline's lazy client getters return the given fakes.
+
+    Must be called before the first message is processed; the embedding
+    scheduler is rebuilt so it uses the fake OpenAI client.
+    """
+    from src.clients import aws, openai_embeddings, pinecone_client
+    from src.clients.openai_embeddings import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+    from src.utils import embedding_scheduler
+
+    if s3 is not None:
+        aws._clients["s3"] = s3
+    if sqs is not None:
+        aws._clients["sqs"] = sqs
+    if index is not None:
+        pinecone_client._index = index
+    if openai_client is not None:
+        # Duck-typed stand-in for AsyncOpenAI
+        client: Any = openai_client
+        openai_embeddings._async_client = client
+        try:
+            scheduler = embedding_scheduler.EmbeddingScheduler(
+                client, EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+            )
+        except Exception as e:
+            print(f"tiktoken encoding unavailable ({e}), approximating token counts")
+            scheduler = embedding_scheduler.EmbeddingScheduler(
+                client,
+                EMBEDDING_MODEL,
+                EMBEDDING_DIMENSIONS,
+                encoding=WhitespaceEncoding(),
+            )
+        embedding_scheduler._scheduler = scheduler
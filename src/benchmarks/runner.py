@@ -0,0 +1,335 @@
+"""Run the SQS-driven pipeline end to end against the fakes and report timings."""
+
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import resource
+import sys
+import time
+from collections import defaultdict
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+)
+import numpy as np
+from .corpus import generate_corpus
+from .fakes import (
+    FakeAsyncOpenAI,
+    FakePineconeIndex,
+    InMemorySQS,
+    LocalS3Client,
+    ServiceProfile,
+    install_fakes,
+)
+
+if TYPE_CHECKING:
+    from src.message_processor import ProcessFileCallback
+
+BUCKET = "bench"
+QUEUE_URL = "https://sqs.local/000000000000/bench"
+
+# Module attributes wrapped to time each pipeline stage: (module, name, stage)
+STAGES = [
+    ("src.document_handler", "download_and_process_file", "download+parse"),
+    ("src.document_handler", "run_cpu_bound", "chunk"),
+    ("src.embedding_manager", "generate_document_embeddings", "embed"),
+    ("src.embedding_manager", "upsert_embeddings_batch", "upsert"),
+]
+
+
+class StageTimings:
+    """Wall-clock durations per stage."""
+
+    def __init__(self) -> None:
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.samples[stage].append(seconds)
+
+    def wrap(
+        self, stage: str, func: Callable[..., Awaitable[Any]]
+    ) -> Callable[..., Awaitable[Any]]:
+        @functools.wraps(func)
+        async def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - start)
+
+        return timed
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        return {stage: percentiles(values) for stage, values in self.samples.items()}
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {
+        "count": len(values),
+        "p50_ms": p50 * 1000,
+        "p90_ms": p90 * 1000,
+        "p99_ms": p99 * 1000,
+        "max_ms": max(values) * 1000,
+    }
+
+
+@contextlib.contextmanager
+def instrument_stages(timings: StageTimings) -> Iterator[None]:
+    """Temporarily wrap the stage functions with timers."""
+    import importlib
+
+    originals = []
+    for module_name, name, stage in STAGES:
+        module = importlib.import_module(module_name)
+        original = getattr(module, name)
+        originals.append((module, name, original))
+        setattr(module, name, timings.wrap(stage, original))
+    try:
+        yield
+    finally:
+        for module, name, original in originals:
+            setattr(module, name, original)
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "process": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "largest_child": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+async def _run_daemon(
+    sqs: InMemorySQS,
+    callback: "ProcessFileCallback",
+    wait_time_seconds: int,
+    timeout: Optional[float],
+) -> bool:
+    """
+    Run the long-running worker until every message has been deleted.
+
+    Messages that keep failing are redelivered forever, so the worker is
+    also stopped once timeout seconds pass. Returns False if it timed out.
+    """
+    from src.sqs_worker import SQSWorker
+
+    worker = SQSWorker(QUEUE_URL, callback, wait_time_seconds=wait_time_seconds)
+    task = asyncio.ensure_future(worker.run())
+    deadline = None if timeout is None else time.monotonic() + timeout
+    timed_out = False
+    while len(sqs) and not task.done():
+        if deadline is not None and time.monotonic() >= deadline:
+            timed_out = True
+            break
+        await asyncio.sleep(0.05)
+    worker.stop()
+    await task
+    return not timed_out
+
+
+async def run_benchmark(
+    workdir: str,
+    mix: Optional[Dict[str, int]] = None,
+    words_per_doc: int = 3000,
+    rows_per_table: int = 400,
+    seed: int = 0,
+    mode: str = "daemon",
+    embeddings: Optional[ServiceProfile] = None,
+    pinecone: Optional[ServiceProfile] = None,
+    visibility_timeout: int = 10,
+    reuse_corpus: bool = False,
+    upsert_outbox: bool = False,
+    near_duplicates: bool = False,
+    chunk_store: bool = False,
+    timeout: Optional[float] = 600.0,
+) -> Dict[str, Any]:
+    """
+    Generate (or reuse) a corpus, enqueue a create event per file and process
+    the queue with the real pipeline wired to the fakes.
+
+    mode "daemon" runs the SQSWorker until the queue is empty or timeout
+    seconds pass; "poll" runs poll_sqs_queue once, which stops at the first
+    empty receive. Messages still queued at the end were never processed
+    successfully and are reported as failed_messages.
+
+    With upsert_outbox, vectors are spooled to an outbox in workdir and the
+    run also waits for it to drain; the elapsed time still ends at the last
+    finished message. near_duplicates reuses embeddings of near-identical
+    chunks through an index kept in workdir. chunk_store keeps chunk text in a
+    local store in workdir instead of vector metadata.
+    """
+    from src.document_handler import process_file_event
+    from src.message_processor import poll_sqs_queue
+    from src.utils import (
+        configure_chunk_store,
+        configure_document_manifest,
+        configure_embedding_cache,
+        configure_near_duplicate_index,
+        configure_upsert_outbox,
+        shutdown_upsert_outbox,
+    )
+
+    bucket_dir = os.path.join(workdir, "s3", BUCKET)
+    s3 = LocalS3Client(os.path.join(workdir, "s3"))
+    if reuse_corpus and os.path.isdir(bucket_dir):
+        keys = s3.keys(BUCKET)
+    else:
+        corpus_start = time.perf_counter()
+        keys = generate_corpus(bucket_dir, mix, words_per_doc, rows_per_table, seed)
+        print(
+            f"Generated {len(keys)} files in {time.perf_counter() - corpus_start:.1f}s"
+        )
+
+    sqs = InMemorySQS(default_visibility_timeout=visibility_timeout)
+    openai_client = FakeAsyncOpenAI(embeddings)
+    index = FakePineconeIndex(pinecone)
+    install_fakes(s3=s3, sqs=sqs, openai_client=openai_client, index=index)
+
+    # Start cold: no cached embeddings and no record of earlier runs
+    for name in (
+        "embeddings.sqlite3",
+        "manifest.sqlite3",
+        "outbox.sqlite3",
+        "near_duplicates.sqlite3",
+        "chunks.sqlite3",
+    ):
+        for suffix in ("", "-wal", "-shm"):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(os.path.join(workdir, name + suffix))
+    configure_embedding_cache(path=os.path.join(workdir, "embeddings.sqlite3"))
+    configure_document_manifest(path=os.path.join(workdir, "manifest.sqlite3"))
+    configure_near_duplicate_index(
+        path=os.path.join(workdir, "near_duplicates.sqlite3"), enabled=near_duplicates
+    )
+    configure_upsert_outbox(
+        path=os.path.join(workdir, "outbox.sqlite3"), enabled=upsert_outbox
+    )
+    configure_chunk_store(
+        "local" if chunk_store else "metadata",
+        path=os.path.join(workdir, "chunks.sqlite3"),
+    )
+
+    for key in keys:
+        sqs.send_message(
+            QueueUrl=QUEUE_URL,
+            MessageBody=json.dumps(
+                {"bucket": BUCKET, "key": key, "eventType": "s3:ObjectCreated:Put"}
+            ),
+        )
+
+    timings = StageTimings()
+    finished_at: List[float] = []
+
+    async def callback(file_info: Dict[str, Any], event_type: str) -> bool:
+        start = time.perf_counter()
+        try:
+            return await process_file_event(file_info, event_type)
+        finally:
+            timings.add("message", time.perf_counter() - start)
+            finished_at.append(time.perf_counter())
+
+    started = time.perf_counter()
+    timed_out = False
+    with instrument_stages(timings):
+        if mode == "daemon":
+            timed_out = not await _run_daemon(
+                sqs, callback, wait_time_seconds=1, timeout=timeout
+            )
+        else:
+            await poll_sqs_queue(QUEUE_URL, callback)
+    # Measure to the last finished message, not the final empty receive
+    elapsed = (max(finished_at) if finished_at else time.perf_counter()) - started
+    drained = elapsed
+    if upsert_outbox:
+        shutdown_upsert_outbox(timeout=None)
+        drained = max(elapsed, time.perf_counter() - started)
+
+    chunks = len(index)
+    return {
+        "files": len(keys),
+        "bytes": sum(
+            os.path.getsize(os.path.join(bucket_dir, *key.split("/"))) for key in keys
+        ),
+        "elapsed_s": elapsed,
+        "drained_s": drained,
+        "docs_per_s": len(keys) / elapsed if elapsed else 0.0,
+        "chunks": chunks,
+        "chunks_per_s": chunks / elapsed if elapsed else 0.0,
+        "metadata_bytes": sum(
+            len(json.dumps(vector.get("metadata") or {}))
+            for vector in index.vectors.values()
+        ),
+        "messages_left": len(sqs),
+        "failed_messages": len(sqs),
+        "timed_out": timed_out,
+        "redelivered": sqs.redelivered,
+        "stages": timings.summary(),
+        "services": {
+            "embeddings": {
+                **openai_client.embeddings.recorder.stats(),
+                **percentiles(openai_client.embeddings.recorder.latencies),
+            },
+            "pinecone": {
+                **index.recorder.stats(),
+                **percentiles(index.recorder.latencies),
+            },
+        },
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def print_report(result: Dict[str, Any]) -> None:
+    print(
+        f"\n{result['files']} files ({result['bytes'] / 1e6:.1f} MB) -> "
+        f"{result['chunks']} chunks in {result['elapsed_s']:.2f}s "
+        f"(index complete after {result['drained_s']:.2f}s)"
+    )
+    print(
+        f"Throughput: {result['docs_per_s']:.2f} docs/sec, "
+        f"{result['chunks_per_s']:.1f} chunks/sec "
+        f"({result['redelivered']} redeliveries, {result['messages_left']} left)"
+    )
+    if result["failed_messages"]:
+        reason = " (timed out)" if result["timed_out"] else ""
+        print(
+            f"FAILED: {result['failed_messages']} messages were never processed "
+            f"successfully{reason}"
+        )
+    if result["chunks"]:
+        print(
+            f"Index metadata: {result['metadata_bytes'] / 1e6:.2f} MB "
+            f"({result['metadata_bytes'] / result['chunks']:.0f} bytes/chunk)"
+        )
+    print(f"\n{'stage':<16}{'count':>7}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    rows = list(result["stages"].items()) + [
+        (f"{name} call", stats) for name, stats in result["services"].items()
+    ]
+    for stage, stats in rows:
+        if not stats.get("count"):
+            continue
+        print(
+            f"{stage:<16}{stats['count']:>7}{stats['p50_ms']:>10.1f}"
+            f"{stats['p90_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+        )
+    for name, stats in result["services"].items():
+        print(
+            f"{name}: {stats['requests']} requests, {stats['failures']} injected "
+            f"failures, {stats['rate_limited']} rate limited"
+        )
+    peak = result["peak_rss_mb"]
+    print(
+        f"Peak RSS: {peak['process']:.0f} MB (largest child process "
+        f"{peak['largest_child']:.0f} MB)"
+    )
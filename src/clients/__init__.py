@@ -1,8 +1,36 @@
-from .openai_embeddings import openai_embeddings_client
-from .pinecone_client import pinecone_client, pinecone_index
+from typing import Any
+from .aws import get_s3_client, get_sqs_client
+from .openai_embeddings import get_openai_async_client, get_openai_embeddings_client
+from .pinecone_client import (
+    call_pinecone_index,
+    submit_pinecone_task,
+    get_pinecone_client,
+    get_pinecone_executor,
+    get_pinecone_index,
+)
 
 __all__ = [
-    "openai_embeddings_client",
-    "pinecone_client",
-    "pinecone_index",
+    "get_s3_client",
+    "get_sqs_client",
+    "get_openai_embeddings_client",
+    "get_openai_async_client",
+    "get_pinecone_client",
+    "get_pinecone_index",
+    "get_pinecone_executor",
+    "call_pinecone_index",
+    "submit_pinecone_task",
 ]
+
+_LAZY_CLIENTS = {
+    "openai_embeddings_client": get_openai_embeddings_client,
+    "openai_async_client": get_openai_async_client,
+    "pinecone_client": get_pinecone_client,
+    "pinecone_index": get_pinecone_index,
+}
+
+
+def __getattr__(name: str) -> Any:
+    # Clients are only built when first accessed
+    if name in _LAZY_CLIENTS:
+        return _LAZY_CLIENTS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,25 @@
+import threading
+from typing import Any, Dict
+
+# boto3 is imported and clients are created on first use
+_clients: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def _get_client(service: str, **kwargs: Any) -> Any:
+    with _lock:
+        if service not in _clients:
+            import boto3
+
+            _clients[service] = boto3.client(service, **kwargs)
+        return _clients[service]
+
+
+def get_s3_client() -> Any:
+    """Return the shared S3 client."""
+    return _get_client("s3")
+
+
+def get_sqs_client() -> Any:
+    """Return the shared SQS client."""
+    return _get_client("sqs", region_name="us-east-1")
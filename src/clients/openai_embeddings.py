@@ -1,9 +1,51 @@
-from langchain_openai import OpenAIEmbeddings
 import os
+import threading
+from typing import Any
 from dotenv import load_dotenv
 
 load_dotenv()
 
-openai_embeddings_client = OpenAIEmbeddings(
-    api_key=os.getenv("OPENAI_API_KEY"), model="text-embedding-3-small", dimensions=1536
-)
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIMENSIONS = 1536
+
+# Clients are created on first use so importing src stays cheap
+_embeddings_client = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def get_openai_embeddings_client() -> Any:
+    """Return the shared LangChain OpenAIEmbeddings client."""
+    global _embeddings_client
+    with _lock:
+        if _embeddings_client is None:
+            from langchain_openai import OpenAIEmbeddings
+
+            _embeddings_client = OpenAIEmbeddings(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                model=EMBEDDING_MODEL,
+                dimensions=EMBEDDING_DIMENSIONS,
+            )
+        return _embeddings_client
+
+
+def get_openai_async_client() -> Any:
+    """Return the shared AsyncOpenAI client; the embedding scheduler handles retries."""
+    global _async_client
+    with _lock:
+        if _async_client is None:
+            from openai import AsyncOpenAI
+
+            _async_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"), max_retries=0
+            )
+        return _async_client
+
+
+def __getattr__(name: str) -> Any:
+    # Keep the old module-level client names working, built lazily
+    if name == "openai_embeddings_client":
+        return get_openai_embeddings_client()
+    if name == "openai_async_client":
+        return get_openai_async_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,10 +1,127 @@
+import asyncio
+import functools
 import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
 from dotenv import load_dotenv
-from pinecone import Pinecone
+from src.adaptive_limiter import get_adaptive_limiter
 
 load_dotenv()
 
-# Create an instance of the Pinecone client
-pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+# "rest" uses the HTTP index, "grpc" the gRPC index from pinecone[grpc], which
+# multiplexes concurrent requests over one HTTP/2 channel
+PINECONE_TRANSPORT = os.getenv("PINECONE_TRANSPORT", "rest").lower()
 
-pinecone_index = pinecone_client.Index(os.getenv("PINECONE_INDEX"))
+# Threads (and pooled connections) available for Pinecone calls in flight
+PINECONE_POOL_SIZE = int(os.getenv("PINECONE_POOL_SIZE", "16"))
+
+# The client and index are created on first use so importing src stays cheap
+# and does not need network access
+_client: Any = None
+_index: Any = None
+_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def get_pinecone_client() -> Any:
+    """Return the shared Pinecone client."""
+    global _client
+    with _lock:
+        if _client is None:
+            client_class: Any
+            if PINECONE_TRANSPORT == "grpc":
+                from pinecone.grpc import PineconeGRPC as client_class
+            elif PINECONE_TRANSPORT == "rest":
+                from pinecone import Pinecone as client_class
+            else:
+                raise ValueError(
+                    f"PINECONE_TRANSPORT must be 'rest' or 'grpc', "
+                    f"not {PINECONE_TRANSPORT!r}"
+                )
+
+            # Create an instance of the Pinecone client
+            _client = client_class(api_key=os.getenv("PINECONE_API_KEY"))
+        return _client
+
+
+def get_pinecone_index() -> Any:
+    """Return the shared handle to the PINECONE_INDEX index."""
+    global _index
+    if _index is None:
+        client = get_pinecone_client()
+        with _lock:
+            if _index is None:
+                _index = client.Index(
+                    os.getenv("PINECONE_INDEX"), pool_threads=PINECONE_POOL_SIZE
+                )
+    return _index
+
+
+def get_pinecone_executor() -> ThreadPoolExecutor:
+    """Return the thread pool dedicated to blocking Pinecone index calls."""
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=max(1, PINECONE_POOL_SIZE),
+                thread_name_prefix="pinecone",
+            )
+        return _executor
+
+
+async def call_pinecone_index(method: str, **kwargs: Any) -> Any:
+    """
+    Call a Pinecone index method from async code without blocking the event loop.
+
+    Calls run on the dedicated Pinecone pool rather than the default executor,
+    so index traffic can fan out to PINECONE_POOL_SIZE requests without
+    competing with S3 downloads for threads. How many run at once is set by
+    the adaptive "pinecone" limiter shared with submit_pinecone_task.
+    """
+    index = get_pinecone_index()
+    async with get_adaptive_limiter("pinecone").slot():
+        return await asyncio.get_running_loop().run_in_executor(
+            get_pinecone_executor(),
+            functools.partial(getattr(index, method), **kwargs),
+        )
+
+
+def submit_pinecone_task(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Future:
+    """
+    Run fn, which makes one Pinecone index call, on the Pinecone pool from a thread.
+
+    The adaptive "pinecone" limiter slot is taken in the calling thread before
+    fn is submitted and released when it finishes, so pool threads never wait
+    on the limiter: a blocked pool thread could starve the async callers whose
+    slots it is waiting for. Never call this from the event loop or from a
+    Pinecone pool thread.
+    """
+    limiter = get_adaptive_limiter("pinecone")
+    limiter.acquire_sync()
+
+    def _run() -> Any:
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            limiter.release(error=e)
+            raise
+        limiter.release(latency=time.monotonic() - start)
+        return result
+
+    try:
+        return get_pinecone_executor().submit(_run)
+    except BaseException:
+        limiter.release()
+        raise
+
+
+def __getattr__(name: str) -> Any:
+    # Keep the old module-level client names working, built lazily
+    if name == "pinecone_client":
+        return get_pinecone_client()
+    if name == "pinecone_index":
+        return get_pinecone_index()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
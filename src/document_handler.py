@@ -1,10 +1,21 @@
-from typing import Dict, Any
-from .file_processor import download_and_process_file
+import os
+from typing import Dict, Any, List
+from langchain_core.documents import Document
+from .file_processor import ChunkStream, download_and_process_file
 from .embedding_manager import (
     generate_and_upsert_embeddings,
     delete_document_embeddings,
+    record_indexed_version,
+    stream_document_embeddings,
+    sync_document_embeddings,
 )
+from .metrics import stage
+from .process_pool import run_cpu_bound
 from .utils import chunk_documents
+from .utils.document_processor import PRECHUNKED
+
+# "incremental" re-indexes only changed chunks, "replace" deletes and re-inserts
+INDEX_UPDATE_MODE = os.getenv("INDEX_UPDATE_MODE", "incremental").lower()
 
 
 async def process_file_event(file_info: Dict[str, Any], event_type: str) -> bool:
@@ -21,29 +32,87 @@ async def process_file_event(file_info: Dict[str, Any], event_type: str) -> bool
         # CREATE or UPDATE event
         print(f"Processing CREATE/UPDATE event for {object_key}")
 
-        # For PUT/POST events that update existing files, first delete old embeddings
-        if "Put" in event_type or "CompleteMultipartUpload" in event_type:
-            print(
-                f"File may be an update, deleting existing embeddings for {object_key}"
-            )
-            await delete_document_embeddings(file_info)
+        if INDEX_UPDATE_MODE == "incremental":
+            success = await _sync_file(file_info)
+        else:
+            success = await _replace_file(file_info, event_type)
+        if success and not file_info.get("unchanged"):
+            await record_indexed_version(file_info)
+        return success
 
-        # Process the file normally
-        docs, success = await download_and_process_file(file_info)
+    else:
+        # Unknown event type
+        print(f"Unsupported event type: {event_type} for {object_key}")
+        return False
 
-        if success and docs:
-            # Chunk the documents
-            chunked_docs = chunk_documents(docs)
 
-            # Generate and upsert embeddings
-            return await generate_and_upsert_embeddings(chunked_docs, file_info)
-        elif success:
-            return True
+async def _chunk(docs: List[Document]) -> List[Document]:
+    with stage("chunk") as record:
+        if all(doc.metadata.get(PRECHUNKED) for doc in docs):
+            # Tables arrive as row groups; skip the round trip to the pool
+            chunked_docs: List[Document] = docs
         else:
-            print(f"Failed to process file {object_key}")
-            return False
+            chunked_docs = await run_cpu_bound(chunk_documents, docs)
+        record.items = len(docs)
+        record.chunks = len(chunked_docs)
+    return chunked_docs
+
+
+async def _stream(
+    chunk_stream: ChunkStream, file_info: Dict[str, Any], incremental: bool
+) -> bool:
+    """Embed and upsert a large document batch by batch while it is still being parsed."""
+    try:
+        return await stream_document_embeddings(chunk_stream, file_info, incremental)
+    finally:
+        await chunk_stream.aclose()
+
+
+async def _replace_file(file_info: Dict[str, Any], event_type: str) -> bool:
+    """Delete a file's embeddings and insert them again from its current content."""
+    object_key = file_info["object_key"]
+
+    # Downloaded first, so an unchanged object keeps its embeddings
+    docs, success = await download_and_process_file(file_info, stream=True)
+    if file_info.get("unchanged"):
+        return True
 
+    # For PUT/POST events that update existing files, first delete old embeddings
+    if "Put" in event_type or "CompleteMultipartUpload" in event_type:
+        print(f"File may be an update, deleting existing embeddings for {object_key}")
+        await delete_document_embeddings(file_info)
+
+    if isinstance(docs, ChunkStream):
+        return await _stream(docs, file_info, incremental=False)
+    elif success and docs:
+        # Chunk the documents
+        chunked_docs = await _chunk(docs)
+
+        # Generate and upsert embeddings
+        return await generate_and_upsert_embeddings(chunked_docs, file_info)
+    elif success:
+        return True
     else:
-        # Unknown event type
-        print(f"Unsupported event type: {event_type} for {object_key}")
+        print(f"Failed to process file {object_key}")
+        return False
+
+
+async def _sync_file(file_info: Dict[str, Any]) -> bool:
+    """Create or update a file's embeddings, touching only changed chunks."""
+    object_key = file_info["object_key"]
+
+    docs, success = await download_and_process_file(file_info, stream=True)
+
+    if file_info.get("unchanged"):
+        return True
+    elif isinstance(docs, ChunkStream):
+        return await _stream(docs, file_info, incremental=True)
+    elif success and docs:
+        chunked_docs = await _chunk(docs)
+        return await sync_document_embeddings(chunked_docs, file_info)
+    elif success:
+        # Nothing to index any more (empty or missing file), drop any old chunks
+        return await delete_document_embeddings(file_info)
+    else:
+        print(f"Failed to process file {object_key}")
         return False
@@ -0,0 +1,288 @@
+import codecs
+import csv
+import io
+import os
+import re
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+from langchain_core.documents import Document
+from .utils.document_processor import PRECHUNKED, carry_chunk, iter_chunks
+
+# Pages extracted and tokenized together by chunk_pdf_pages
+PDF_PAGES_PER_PARSE = 16
+
+
+def load_text(stream: BinaryIO) -> List[Document]:
+    """Load a UTF-8 text file as a single Document."""
+    content = stream.read()
+    text = content.decode("utf-8-sig", errors="replace")
+    del content
+    return [Document(page_content=text, metadata={})]
+
+
+def open_pdf(content: Union[str, bytes]) -> Any:
+    """Open a PDF from memory or a file path; pages are only parsed when read."""
+    import pymupdf
+
+    if isinstance(content, str):
+        return pymupdf.open(content)
+    return pymupdf.open(stream=content, filetype="pdf")
+
+
+def iter_pdf_pages(
+    pdf: Any, start: int = 0, end: Optional[int] = None
+) -> Iterator[Document]:
+    """Yield one Document per page of an open PDF, extracting text lazily."""
+    doc_metadata = {key: value for key, value in (pdf.metadata or {}).items() if value}
+    total_pages = len(pdf)
+    for number in range(start, total_pages if end is None else min(end, total_pages)):
+        page = pdf[number]
+        yield Document(
+            page_content=page.get_text(),
+            metadata={
+                **doc_metadata,
+                "page": page.number,
+                "total_pages": total_pages,
+            },
+        )
+
+
+def chunk_pdf_pages(
+    path: str, start_page: int, carry: Dict, min_chunks: int
+) -> Tuple[List[Document], int, Dict]:
+    """
+    Extract and chunk the pages of a PDF file from start_page on.
+
+    Pages are read PDF_PAGES_PER_PARSE at a time until at least min_chunks
+    chunks are ready or the document ends. Chunking continues from carry (see
+    iter_chunks), so a document can be chunked in consecutive calls, each in
+    any worker process; the last call also returns the final chunk.
+
+    Returns:
+        (chunks, next page to read, updated carry)
+    """
+    pdf = open_pdf(path)
+    try:
+        total_pages = len(pdf)
+        chunks: List[Document] = []
+        page = start_page
+        while page < total_pages and len(chunks) < min_chunks:
+            end = min(total_pages, page + PDF_PAGES_PER_PARSE)
+            chunks.extend(iter_chunks(iter_pdf_pages(pdf, page, end), carry=carry))
+            page = end
+        if page >= total_pages:
+            last = carry_chunk(carry)
+            if last is not None:
+                chunks.append(last)
+            carry = {}
+        return chunks, page, carry
+    finally:
+        pdf.close()
+
+
+def load_pdf(stream: BinaryIO) -> List[Document]:
+    """Load a PDF from memory with PyMuPDF, one Document per page."""
+    pdf = open_pdf(stream.read())
+    try:
+        return list(iter_pdf_pages(pdf))
+    finally:
+        pdf.close()
+
+
+# Token budget of a row group; matches chunk_documents' default chunk_size
+TABLE_CHUNK_TOKENS = int(os.getenv("TABLE_CHUNK_TOKENS", "700"))
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def _estimate_tokens(text: str) -> int:
+    """Approximate the spaCy token count of text without running spaCy."""
+    return len(_TOKEN_RE.findall(text))
+
+
+def _format_row(values: Iterable[Any]) -> str:
+    """Render one row as a CSV line."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator="").writerow(
+        "" if value is None else str(value).strip() for value in values
+    )
+    return buffer.getvalue()
+
+
+def _split_line(line: str, budget: int) -> List[str]:
+    """Split a line longer than the budget into pieces of at most budget tokens."""
+    tokens = list(_TOKEN_RE.finditer(line))
+    if len(tokens) <= budget:
+        return [line]
+    pieces = []
+    for i in range(0, len(tokens), budget):
+        start = tokens[i].start()
+        end = tokens[min(i + budget, len(tokens)) - 1].end()
+        pieces.append(line[start:end])
+    return pieces
+
+
+def iter_row_groups(
+    rows: Iterable[Sequence], prefix: str = "", budget: Optional[int] = None
+) -> Iterator[Tuple[str, int, int]]:
+    """
+    Group table rows into chunks of about budget tokens.
+
+    The first row is taken as the header and repeated at the top of every
+    group (after prefix, e.g. the sheet name), so each chunk can be read on its
+    own. Only the group being built is held in memory.
+
+    Yields:
+        (text, first_row, last_row), with rows numbered from 0 after the header
+    """
+    budget = budget or TABLE_CHUNK_TOKENS
+    rows = iter(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    header_line = prefix + _format_row(header)
+    header_tokens = _estimate_tokens(header_line)
+    # Leave room for at least a row of content even under a very wide header
+    row_budget = max(budget - header_tokens, budget // 2)
+
+    lines: List[str] = []
+    tokens = 0
+    first_row = last_row = 0
+    for row_index, row in enumerate(rows):
+        if not any(value not in (None, "") for value in row):
+            continue
+        for line in _split_line(_format_row(row), row_budget):
+            line_tokens = _estimate_tokens(line)
+            if lines and tokens + line_tokens > row_budget:
+                yield "\n".join([header_line, *lines]), first_row, last_row
+                lines, tokens = [], 0
+            if not lines:
+                first_row = row_index
+            last_row = row_index
+            lines.append(line)
+            tokens += line_tokens
+    if lines:
+        yield "\n".join([header_line, *lines]), first_row, last_row
+
+
+def _row_group_document(
+    text: str, first_row: int, last_row: int, **metadata: Any
+) -> Document:
+    # Row groups are already sized to the chunk budget; the chunker passes
+    # them through instead of re-splitting them by sentence
+    return Document(
+        page_content=text,
+        metadata={
+            **metadata,
+            "first_row": first_row,
+            "last_row": last_row,
+            PRECHUNKED: True,
+        },
+    )
+
+
+def iter_csv(stream: BinaryIO) -> Generator[Document, None, None]:
+    """
+    Yield a CSV file as row groups sized to the chunk budget, header repeated.
+
+    Rows are decoded and grouped as the stream is read, so neither the raw
+    file nor a Document per row is ever held in memory.
+    """
+    reader = codecs.getreader("utf-8-sig")(stream, "replace")
+    for text, first_row, last_row in iter_row_groups(csv.reader(reader)):
+        yield _row_group_document(text, first_row, last_row)
+
+
+def load_csv(stream: BinaryIO) -> List[Document]:
+    """Load a CSV file as a list of row groups; see iter_csv."""
+    return list(iter_csv(stream))
+
+
+def _xlsx_rows(stream: BinaryIO) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """Yield (sheet name, row iterator) from a read-only openpyxl workbook."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield worksheet.title, worksheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _xls_rows(stream: BinaryIO) -> Iterator[Tuple[str, Iterator[tuple]]]:
+    """Yield (sheet name, row iterator) from a legacy .xls workbook via pandas."""
+    import pandas as pd
+
+    sheets = pd.read_excel(io.BytesIO(stream.read()), sheet_name=None, header=None)
+    for sheet_name, df in sheets.items():
+        yield str(sheet_name), (
+            tuple(None if pd.isna(value) else value for value in row)
+            for row in df.itertuples(index=False, name=None)
+        )
+
+
+def _excel_row_groups(
+    stream: BinaryIO,
+    rows_by_sheet: Callable[[BinaryIO], Iterator[Tuple[str, Iterator[tuple]]]],
+) -> Generator[Document, None, None]:
+    for sheet_name, rows in rows_by_sheet(stream):
+        groups = iter_row_groups(rows, prefix=f"Sheet: {sheet_name}\n")
+        for text, first_row, last_row in groups:
+            yield _row_group_document(text, first_row, last_row, sheet_name=sheet_name)
+
+
+def iter_excel(stream: BinaryIO) -> Generator[Document, None, None]:
+    """
+    Yield every sheet of an .xlsx workbook as row groups, header repeated.
+
+    The workbook is opened read-only so rows are streamed from the sheet XML
+    rather than loaded into a DataFrame. The stream must be seekable.
+    """
+    return _excel_row_groups(stream, _xlsx_rows)
+
+
+def load_excel(stream: BinaryIO) -> List[Document]:
+    """Load an .xlsx workbook as a list of row groups; see iter_excel."""
+    return list(iter_excel(stream))
+
+
+def load_xls(stream: BinaryIO) -> List[Document]:
+    """Load a legacy .xls workbook as row groups; openpyxl can't read this format."""
+    return list(_excel_row_groups(stream, _xls_rows))
+
+
+# Loaders by file extension; each reads from a binary stream
+LOADERS: Dict[str, Callable[[BinaryIO], List[Document]]] = {
+    ".txt": load_text,
+    ".pdf": load_pdf,
+    ".csv": load_csv,
+    ".xlsx": load_excel,
+    ".xls": load_xls,
+}
+
+
+# Row group iterators of the table formats that can be streamed; legacy .xls
+# is left out as pandas reads the whole workbook anyway
+# Generators, so a stream stopped early can close() its file
+TABLE_ITERATORS: Dict[str, Callable[[BinaryIO], Generator[Document, None, None]]] = {
+    ".csv": iter_csv,
+    ".xlsx": iter_excel,
+}
+
+
+def load_document_bytes(content: bytes, file_extension: str) -> List[Document]:
+    """Parse a downloaded file; used where a stream can't be passed (other processes)."""
+    return LOADERS[file_extension](io.BytesIO(content))
@@ -1,58 +1,197 @@
+import asyncio
+import hashlib
 import os
-from typing import List, Dict, Any
-from langchain.schema import Document
+import re
+import time
+from typing import AsyncIterator, Callable, List, Dict, Any, Optional, Set
+from langchain_core.documents import Document
 from .utils import (
     generate_document_embeddings,
-    upsert_embeddings,
+    upsert_embeddings_batch,
     delete_embeddings,
+    list_embedding_ids,
+    fetch_embedding_metadata,
+    chunk_vector_ids,
+    get_chunk_store,
+    get_document_manifest,
+    get_upsert_outbox,
 )
 
+# Extra attempts for chunks whose upsert batch failed
+UPSERT_RETRIES = int(os.getenv("PINECONE_UPSERT_RETRIES", "2"))
+
+# Set when every indexed object went through the manifest, so an object without
+# an entry is known to have no vectors and needs no delete or listing
+MANIFEST_AUTHORITATIVE = (
+    os.getenv("DOCUMENT_MANIFEST_AUTHORITATIVE", "false").lower() == "true"
+)
+
+
+def chunk_hash(text: str) -> str:
+    """Return the content hash stored with each chunk's vector."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+async def _in_executor(fn: Callable[..., Any], *args: Any) -> Any:
+    # Manifest and store calls do SQLite or S3 I/O; keep it off the event loop
+    return await asyncio.get_running_loop().run_in_executor(None, fn, *args)
+
+
+async def known_chunk_count(file_info: Dict[str, Any]) -> Optional[int]:
+    """
+    Return how many chunks the object may have in the index, or None if unknown.
+
+    Without a manifest entry the count is unknown and callers list the index
+    by prefix, unless the manifest is authoritative and the object is new.
+    """
+    manifest = get_document_manifest()
+    if manifest is None:
+        return None
+    count: Optional[int] = await _in_executor(
+        manifest.get_chunk_count, file_info["bucket_name"], file_info["object_key"]
+    )
+    if count is None and MANIFEST_AUTHORITATIVE:
+        return 0
+    return count
+
+
+async def record_indexed_version(file_info: Dict[str, Any]) -> None:
+    """Record the downloaded version (file_info["etag"]) as fully indexed."""
+    manifest = get_document_manifest()
+    if manifest is not None and file_info.get("etag"):
+        await _in_executor(
+            manifest.record_indexed,
+            file_info["bucket_name"],
+            file_info["object_key"],
+            file_info["etag"],
+            file_info.get("content_length"),
+        )
+
 
 async def generate_and_upsert_embeddings(
-    chunked_docs: List[Document], file_info: Dict[str, Any]
+    chunked_docs: List[Document],
+    file_info: Dict[str, Any],
+    chunk_indices: Optional[List[int]] = None,
+    start_index: int = 0,
 ) -> bool:
-    """Generate embeddings for document chunks and upsert them to the database."""
+    """
+    Generate embeddings for document chunks and upsert them to the database.
+
+    When chunk_indices is given only those chunks are embedded and upserted;
+    their vector IDs still reflect their position in chunked_docs. start_index
+    is the position of chunked_docs[0] in the whole document, for callers
+    that write a document in consecutive slices.
+    """
     bucket_name = file_info["bucket_name"]
     object_key = file_info["object_key"]
 
-    print(f"Generating embeddings for {len(chunked_docs)} chunks from {object_key}")
+    manifest = get_document_manifest()
+    if chunk_indices is None:
+        chunk_indices = list(range(len(chunked_docs)))
+        # Writing the whole document: record its chunks before any of them land
+        # so a later delete covers them even if this write fails part way. An
+        # unknown object may have older chunks past this count, so it stays
+        # unknown and is cleaned up by listing.
+        if manifest is not None and await known_chunk_count(file_info) is not None:
+            await _in_executor(
+                manifest.raise_chunk_count,
+                bucket_name,
+                object_key,
+                start_index + len(chunked_docs),
+            )
+
+    print(f"Generating embeddings for {len(chunk_indices)} chunks from {object_key}")
 
     # Extract content from chunks
-    chunk_contents = [doc.page_content for doc in chunked_docs]
+    chunk_contents = [chunked_docs[idx].page_content for idx in chunk_indices]
 
     # Generate embeddings
-    embeddings = await generate_document_embeddings(chunk_contents)
+    result = await generate_document_embeddings(chunk_contents)
 
-    if not embeddings:
-        print(f"Failed to generate embeddings for {object_key}")
-        return False
+    if result.failed_indices:
+        first_error = result.errors[result.failed_indices[0]]
+        print(
+            f"Failed to generate embeddings for {len(result.failed_indices)} chunks "
+            f"from {object_key}: {first_error}"
+        )
+        if len(result.failed_indices) == len(chunk_indices):
+            return False
+
+    chunk_store = get_chunk_store()
+    vectors = []
+    texts = {}
+    for idx, vector, error in zip(chunk_indices, result.embeddings, result.errors):
+        # Chunks without an embedding are left for a retry of the whole message
+        if error is not None:
+            continue
+        vector_id = f"{object_key}-chunk-{start_index + idx}"
+        text = chunked_docs[idx].page_content
+        metadata = {
+            "bucketName": bucket_name,
+            "objectKey": object_key,
+            "chunkIndex": start_index + idx,
+            "chunkHash": chunk_hash(text),
+            "file_type": chunked_docs[idx].metadata.get("file_type", "unknown"),
+        }
+        if chunk_store is None:
+            metadata["chunk_text"] = text  # Store full text
+            metadata["source"] = f"s3://{bucket_name}/{object_key}"
+            metadata["title"] = os.path.basename(object_key)
+        else:
+            # Kept out of metadata; source and title follow from the key
+            texts[vector_id] = text
+        vectors.append({"id": vector_id, "values": vector, "metadata": metadata})
 
-    # Upsert embeddings for each chunk
+    if chunk_store is not None and texts:
+        # Text lands before its vector, so every indexed chunk can be read back
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, chunk_store.put_many, object_key, texts
+            )
+        except Exception as e:
+            print(f"Error storing chunk text for {object_key}: {e}")
+            return False
+
+    outbox = get_upsert_outbox()
+    if outbox is not None:
+        # Spool the vectors durably and let the outbox flusher upsert them, so
+        # a slow or throttling index never holds up embedding
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, outbox.put_many, vectors
+            )
+        except Exception as e:
+            print(f"Error spooling embeddings for {object_key}: {e}")
+            return False
+        print(
+            f"Spooled {len(vectors)}/{len(chunk_indices)} embeddings for {object_key}"
+        )
+        return len(vectors) == len(chunk_indices)
+
+    # Upsert in batches, retrying only the chunks whose batch failed
     try:
-        results = []
-        for idx, vector in enumerate(embeddings):
-            result = upsert_embeddings(
-                id=f"{object_key}-chunk-{idx}",
-                vector=vector,
-                metadata={
-                    "bucketName": bucket_name,
-                    "objectKey": object_key,
-                    "chunkIndex": idx,
-                    "chunk_text": chunked_docs[idx].page_content,  # Store full text
-                    "source": f"s3://{bucket_name}/{object_key}",
-                    "file_type": chunked_docs[idx].metadata.get("file_type", "unknown"),
-                    "title": os.path.basename(object_key),
-                },
+        results = await upsert_embeddings_batch(vectors)
+        for attempt in range(UPSERT_RETRIES):
+            failed = [v for v in vectors if not results.get(v["id"])]
+            if not failed:
+                break
+            print(
+                f"Retrying {len(failed)} failed chunks for {object_key} "
+                f"(attempt {attempt + 1}/{UPSERT_RETRIES})"
             )
-            results.append(result)
+            results.update(await upsert_embeddings_batch(failed))
 
-        success_count = results.count(True)
+        failed_ids = [v["id"] for v in vectors if not results.get(v["id"])]
         print(
-            f"Upserted {success_count}/{len(chunked_docs)} embeddings for {object_key}"
+            f"Upserted {len(vectors) - len(failed_ids)}/{len(chunk_indices)} "
+            f"embeddings for {object_key}"
         )
+        if failed_ids:
+            print(f"Failed to upsert chunks for {object_key}: {failed_ids}")
 
-        # Consider the operation successful if at least one chunk was upserted
-        return success_count > 0
+        # Only succeed when every chunk was embedded and landed, so the message
+        # is redelivered otherwise
+        return not failed_ids and len(vectors) == len(chunk_indices)
     except Exception as e:
         print(f"Error upserting embeddings: {e}")
         import traceback
@@ -62,18 +201,55 @@ async def generate_and_upsert_embeddings(
 
 
 async def delete_document_embeddings(file_info: Dict[str, Any]) -> bool:
-    """Delete all embeddings associated with a specific file from Pinecone."""
-    object_key = file_info["object_key"]
+    """
+    Delete all embeddings associated with a specific file from Pinecone.
 
-    print(f"Deleting embeddings for {object_key}")
+    When the manifest knows the object's chunk count the exact IDs are deleted
+    in parallel batches; otherwise the index is listed by ID prefix.
+    """
+    object_key = file_info["object_key"]
+    loop = asyncio.get_running_loop()
 
     try:
-        # The ID prefix used when upserting embeddings
-        id_prefix = f"{object_key}-chunk-"
+        manifest = get_document_manifest()
+        if manifest is not None:
+            await _in_executor(
+                manifest.forget_indexed, file_info["bucket_name"], object_key
+            )
+
+        outbox = get_upsert_outbox()
+        if outbox is not None:
+            # Drop vectors not sent yet so they can't land after the delete
+            await loop.run_in_executor(
+                None, outbox.discard_object, file_info["bucket_name"], object_key
+            )
+
+        chunk_count = await known_chunk_count(file_info)
+        if chunk_count == 0:
+            print(f"No embeddings to delete for {object_key}")
+            return True
+
+        print(f"Deleting embeddings for {object_key}")
+        if chunk_count is not None:
+            ids = chunk_vector_ids(object_key, chunk_count)
+            result = await loop.run_in_executor(
+                None, lambda: delete_embeddings(ids=ids)
+            )
+        else:
+            # The ID prefix used when upserting embeddings
+            id_prefix = f"{object_key}-chunk-"
+            result = await loop.run_in_executor(
+                None, lambda: delete_embeddings(id_prefix=id_prefix)
+            )
 
-        # Call the delete_embeddings function from src
-        result = delete_embeddings(id_prefix=id_prefix)
+        chunk_store = get_chunk_store()
+        if result and chunk_store is not None:
+            await loop.run_in_executor(None, chunk_store.delete_object, object_key)
 
+        if result and manifest is not None:
+            await _in_executor(
+                manifest.set_chunk_count, file_info["bucket_name"], object_key, 0
+            )
         return result
     except Exception as e:
         print(f"Error deleting embeddings for {object_key}: {e}")
@@ -81,3 +257,212 @@ async def delete_document_embeddings(file_info: Dict[str, Any]) -> bool:
 
         traceback.print_exc()
         return False
+
+
+async def sync_document_embeddings(
+    chunked_docs: List[Document], file_info: Dict[str, Any]
+) -> bool:
+    """
+    Incrementally re-index a document against the vectors already in Pinecone.
+
+    Each chunk's content hash is compared with the chunkHash stored in the
+    metadata of the vector at the same position. Only new or changed chunks are
+    embedded and upserted, and only chunk IDs past the new end of the document
+    are deleted, so the document is never left without vectors.
+
+    With a manifest entry the existing IDs are derived from the recorded chunk
+    count instead of listing the index, and a known new object skips the
+    lookup entirely.
+    """
+    bucket_name = file_info["bucket_name"]
+    object_key = file_info["object_key"]
+    manifest = get_document_manifest()
+    new_ids = chunk_vector_ids(object_key, len(chunked_docs))
+
+    try:
+        chunk_count = await known_chunk_count(file_info)
+        existing_ids = await _existing_chunk_ids(file_info, chunk_count)
+        changed = await _changed_chunk_indices(chunked_docs, new_ids, existing_ids)
+    except Exception as e:
+        print(f"Error reading existing embeddings for {object_key}: {e}")
+        import traceback
+
+        traceback.print_exc()
+        return False
+
+    stale_ids = sorted(existing_ids - set(new_ids))
+
+    print(
+        f"Incremental update for {object_key}: {len(changed)} new/changed, "
+        f"{len(chunked_docs) - len(changed)} unchanged, {len(stale_ids)} stale chunks"
+    )
+
+    success = True
+    if changed:
+        if manifest is not None and chunk_count is not None:
+            await _in_executor(
+                manifest.raise_chunk_count, bucket_name, object_key, len(chunked_docs)
+            )
+        success = await generate_and_upsert_embeddings(
+            chunked_docs, file_info, chunk_indices=changed
+        )
+
+    # Only drop stale chunks once their replacements are in place
+    if success and stale_ids:
+        success = await _delete_ids(stale_ids)
+
+    # Every chunk past the new end is gone, so the count can shrink
+    if success and manifest is not None:
+        await _in_executor(
+            manifest.set_chunk_count, bucket_name, object_key, len(chunked_docs)
+        )
+
+    return success
+
+
+async def _existing_chunk_ids(
+    file_info: Dict[str, Any], chunk_count: Optional[int]
+) -> Set[str]:
+    """Return the chunk IDs the object has in the index, listing it if unknown."""
+    object_key = file_info["object_key"]
+    if chunk_count is not None:
+        return set(chunk_vector_ids(object_key, chunk_count))
+
+    id_prefix = f"{object_key}-chunk-"
+    loop = asyncio.get_running_loop()
+    existing_ids = await loop.run_in_executor(None, list_embedding_ids, id_prefix)
+    outbox = get_upsert_outbox()
+    if outbox is not None:
+        # Include chunks spooled but not sent yet, so stale ones are dropped too
+        existing_ids.extend(
+            await loop.run_in_executor(
+                None, outbox.pending_ids, file_info["bucket_name"], object_key
+            )
+        )
+    # Ignore IDs of other objects whose key happens to share the prefix
+    chunk_id = re.compile(re.escape(id_prefix) + r"\d+$")
+    return {vid for vid in existing_ids if chunk_id.match(vid)}
+
+
+async def _changed_chunk_indices(
+    chunked_docs: List[Document], ids: List[str], existing_ids: Set[str]
+) -> List[int]:
+    """Return the positions of chunks whose stored chunkHash is missing or differs."""
+    loop = asyncio.get_running_loop()
+    existing_metadata = {}
+    if existing_ids:
+        existing_metadata = await loop.run_in_executor(
+            None, fetch_embedding_metadata, [vid for vid in ids if vid in existing_ids]
+        )
+    outbox = get_upsert_outbox()
+    if outbox is not None:
+        # Vectors still waiting in the outbox are newer than the index
+        existing_metadata.update(
+            await loop.run_in_executor(None, outbox.pending_metadata, ids)
+        )
+    return [
+        idx
+        for idx, doc in enumerate(chunked_docs)
+        if existing_metadata.get(ids[idx], {}).get("chunkHash")
+        != chunk_hash(doc.page_content)
+    ]
+
+
+async def _delete_ids(ids: List[str]) -> bool:
+    loop = asyncio.get_running_loop()
+    outbox = get_upsert_outbox()
+    if outbox is not None:
+        await loop.run_in_executor(None, outbox.discard_ids, ids)
+    result = await loop.run_in_executor(None, lambda: delete_embeddings(ids=ids))
+    chunk_store = get_chunk_store()
+    if result and chunk_store is not None:
+        await loop.run_in_executor(None, chunk_store.delete_ids, ids)
+    return result
+
+
+async def stream_document_embeddings(
+    chunk_batches: AsyncIterator[List[Document]],
+    file_info: Dict[str, Any],
+    incremental: bool = True,
+) -> bool:
+    """
+    Embed and upsert a document that arrives as consecutive batches of chunks.
+
+    Each batch is written as soon as it arrives, so the first vectors land
+    while the rest of the document is still being parsed and only one batch
+    is embedded at a time. With incremental, each batch is compared against
+    the stored chunk hashes as in sync_document_embeddings, and chunks past
+    the document's final end are deleted once every batch has landed.
+
+    Stops at the first batch that fails so the message is redelivered; the
+    chunks that already landed are then skipped as unchanged.
+    """
+    bucket_name = file_info["bucket_name"]
+    object_key = file_info["object_key"]
+    manifest = get_document_manifest()
+    started_at = time.monotonic()
+
+    try:
+        chunk_count = await known_chunk_count(file_info)
+        existing_ids = set()
+        if incremental:
+            existing_ids = await _existing_chunk_ids(file_info, chunk_count)
+    except Exception as e:
+        print(f"Error reading existing embeddings for {object_key}: {e}")
+        import traceback
+
+        traceback.print_exc()
+        return False
+
+    success = True
+    total = 0
+    written = 0
+    async for batch in chunk_batches:
+        ids = [f"{object_key}-chunk-{total + idx}" for idx in range(len(batch))]
+        changed = list(range(len(batch)))
+        if incremental:
+            try:
+                changed = await _changed_chunk_indices(batch, ids, existing_ids)
+            except Exception as e:
+                print(f"Error reading existing embeddings for {object_key}: {e}")
+                success = False
+                break
+
+        if changed:
+            if manifest is not None and chunk_count is not None:
+                await _in_executor(
+                    manifest.raise_chunk_count,
+                    bucket_name,
+                    object_key,
+                    total + len(batch),
+                )
+            success = await generate_and_upsert_embeddings(
+                batch, file_info, chunk_indices=changed, start_index=total
+            )
+            if success and not written:
+                print(
+                    f"First vectors for {object_key} landed after "
+                    f"{time.monotonic() - started_at:.2f}s"
+                )
+            written += len(changed)
+
+        total += len(batch)
+        if not success:
+            break
+
+    print(
+        f"Streamed {total} chunks for {object_key}: {written} written, "
+        f"{total - written} unchanged, in {time.monotonic() - started_at:.2f}s"
+    )
+    if not success or not incremental:
+        return success
+
+    # Only drop stale chunks once the whole document has been written
+    stale_ids = sorted(existing_ids - set(chunk_vector_ids(object_key, total)))
+    if stale_ids:
+        print(f"Deleting {len(stale_ids)} stale chunks for {object_key}")
+        success = await _delete_ids(stale_ids)
+
+    if success and manifest is not None:
+        await _in_executor(manifest.set_chunk_count, bucket_name, object_key, total)
+    return success
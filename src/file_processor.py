@@ -1,95 +1,429 @@
+import abc
+import asyncio
+import itertools
 import os
+import shutil
 import tempfile
-import pandas as pd
-import boto3
-from typing import List, Tuple, Dict, Any
-from langchain.schema import Document
-from langchain_community.document_loaders import (
-    PyMuPDFLoader,
-    TextLoader,
-    CSVLoader,
+from typing import BinaryIO, Callable, List, Optional, Tuple, Dict, Any, Union
+from langchain_core.documents import Document
+import botocore.exceptions
+from .clients import get_s3_client
+from .metrics import inc, stage
+from .document_loaders import (
+    LOADERS,
+    TABLE_ITERATORS,
+    chunk_pdf_pages,
+    load_document_bytes,
+    open_pdf,
 )
-import botocore
+from .process_pool import get_process_pool, run_cpu_bound
+from .utils.document_manifest import DocumentManifest, get_document_manifest
 
-# Initialize AWS clients
-s3 = boto3.client("s3")
+# PDFs with at least this many pages are chunked, embedded and upserted in
+# micro-batches while they are parsed; 0 always loads them whole
+PDF_STREAM_MIN_PAGES = int(os.getenv("PDF_STREAM_MIN_PAGES", "100"))
+
+# Chunks per embed-and-upsert micro-batch of a streamed PDF
+PDF_STREAM_BATCH_CHUNKS = int(os.getenv("PDF_STREAM_BATCH_CHUNKS", "128"))
+
+# CSV and .xlsx files of at least this many bytes are embedded and upserted
+# in micro-batches of row groups while they are read; 0 always loads them whole
+TABLE_STREAM_MIN_BYTES = int(os.getenv("TABLE_STREAM_MIN_BYTES", str(16 * 1024 * 1024)))
+
+# Row groups per embed-and-upsert micro-batch of a streamed table
+TABLE_STREAM_BATCH_CHUNKS = int(os.getenv("TABLE_STREAM_BATCH_CHUNKS", "128"))
+
+# Skip objects whose ETag matches the version recorded as indexed in the
+# document manifest; "false" always downloads and re-indexes
+SKIP_UNCHANGED_OBJECTS = os.getenv("SKIP_UNCHANGED_OBJECTS", "true").lower() == "true"
+
+
+class ChunkStream(abc.ABC):
+    """
+    Chunks of a large document, produced in micro-batches while it is parsed.
+
+    Iterate with `async for`. The next batch is prepared while the caller
+    embeds and upserts the current one, so at most two batches of chunks are
+    held in memory at a time. Call aclose() once done, also after stopping
+    early, to release the underlying file.
+    """
+
+    def __init__(self, metadata: Dict[str, Any]):
+        self.chunk_count = 0
+        self._metadata = metadata
+        self._pending: Optional[asyncio.Future] = None
+
+    @abc.abstractmethod
+    async def _produce(self) -> Optional[List[Document]]:
+        """Return the next batch of chunks, or None at the end of the document."""
+
+    def _close(self) -> None:
+        """Release the document once no batch is being produced."""
+
+    async def _next_batch(self) -> Optional[List[Document]]:
+        batch = await self._produce()
+        if batch is not None:
+            for doc in batch:
+                doc.metadata.update(self._metadata)
+            self.chunk_count += len(batch)
+        return batch
+
+    def __aiter__(self) -> "ChunkStream":
+        return self
+
+    async def __anext__(self) -> List[Document]:
+        pending, self._pending = self._pending, None
+        batch = await (pending or self._next_batch())
+        while batch is not None and not batch:
+            # Pages without text; keep reading until chunks or the end
+            batch = await self._next_batch()
+        if batch is None:
+            raise StopAsyncIteration
+        # Parse the next batch while the caller works on this one
+        self._pending = asyncio.ensure_future(self._next_batch())
+        return batch
+
+    async def aclose(self) -> None:
+        """Wait for any batch still being parsed, then release the document."""
+        if self._pending is not None:
+            try:
+                await self._pending
+            except Exception:
+                # Nobody is waiting for this batch any more
+                pass
+            self._pending = None
+        self._close()
+
+
+class PdfChunkStream(ChunkStream):
+    """
+    Chunks of a large PDF, extracted and chunked batch by batch.
+
+    The PDF is read from a temporary file, and each batch of pages is
+    extracted and chunked by chunk_pdf_pages in the process pool (a thread
+    when it is disabled). Chunk overlap is handed from one task to the next,
+    so it carries across batches. The file is removed by aclose().
+    """
+
+    def __init__(
+        self,
+        path: str,
+        page_count: int,
+        metadata: Dict[str, Any],
+        batch_size: Optional[int] = None,
+    ):
+        super().__init__(metadata)
+        self.page_count = page_count
+        self._path = path
+        self._batch_size = batch_size or PDF_STREAM_BATCH_CHUNKS
+        self._next_page = 0
+        self._carry: Dict[str, Any] = {}
+
+    async def _produce(self) -> Optional[List[Document]]:
+        if self._next_page >= self.page_count:
+            return None
+        batch: List[Document]
+        with stage("chunk", mode="stream") as record:
+            batch, self._next_page, self._carry = await run_cpu_bound(
+                chunk_pdf_pages,
+                self._path,
+                self._next_page,
+                self._carry,
+                self._batch_size,
+            )
+            record.chunks = len(batch)
+        return batch
+
+    def _close(self) -> None:
+        _remove_file(self._path)
+
+
+class TableChunkStream(ChunkStream):
+    """
+    Row groups of a large CSV or .xlsx file, read batch by batch.
+
+    The file is spooled to an anonymous temporary file rather than held in
+    memory or read over a long-lived S3 connection. Row groups are already
+    chunks, so producing a batch is only CSV/XML decoding and a token count
+    per row; that runs in a thread, which also keeps the open file and its
+    row iterator in this process. The file is closed by aclose().
+    """
+
+    def __init__(
+        self,
+        file: BinaryIO,
+        file_extension: str,
+        metadata: Dict[str, Any],
+        batch_size: Optional[int] = None,
+    ):
+        super().__init__(metadata)
+        self._file = file
+        self._row_groups = TABLE_ITERATORS[file_extension](file)
+        self._batch_size = batch_size or TABLE_STREAM_BATCH_CHUNKS
+
+    def _take(self) -> Optional[List[Document]]:
+        with stage("parse", mode="stream") as record:
+            batch = list(itertools.islice(self._row_groups, self._batch_size))
+            record.items = len(batch)
+        return batch or None
+
+    async def _produce(self) -> Optional[List[Document]]:
+        return await asyncio.get_running_loop().run_in_executor(None, self._take)
+
+    def _close(self) -> None:
+        self._row_groups.close()
+        self._file.close()
+
+
+def _write_temp_file(content: bytes, suffix: str) -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    return path
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _pdf_page_count(content: bytes) -> int:
+    # Opening only reads the page tree; text is extracted per page
+    pdf = open_pdf(content)
+    try:
+        return len(pdf)
+    finally:
+        pdf.close()
+
+
+def _get_object(
+    bucket_name: str, object_key: str, if_none_match: Optional[str]
+) -> Dict[str, Any]:
+    # A matching ETag makes S3 answer 304 Not Modified without a body
+    params = {"Bucket": bucket_name, "Key": object_key}
+    if if_none_match:
+        params["IfNoneMatch"] = if_none_match
+    response: Dict[str, Any] = get_s3_client().get_object(**params)
+    return response
+
+
+def _read_body(response: Dict[str, Any]) -> bytes:
+    with stage("download") as record:
+        body = response["Body"]
+        try:
+            content: bytes = body.read()
+        finally:
+            body.close()
+        record.bytes = len(content)
+        return content
+
+
+def _download_bytes(
+    bucket_name: str, object_key: str, if_none_match: Optional[str] = None
+) -> Tuple[bytes, Optional[str]]:
+    response = _get_object(bucket_name, object_key, if_none_match)
+    return _read_body(response), response.get("ETag")
+
+
+def _load_body(response: Dict[str, Any], loader: Callable) -> List[Document]:
+    # Load straight from the S3 response body, no temporary file needed
+    body = response["Body"]
+    try:
+        # The body is streamed while parsing, so this includes the transfer
+        with stage("parse") as record:
+            docs: List[Document] = loader(body)
+            record.items = len(docs)
+            return docs
+    finally:
+        body.close()
+
+
+def _download_and_load(
+    bucket_name: str,
+    object_key: str,
+    loader: Callable,
+    if_none_match: Optional[str] = None,
+) -> Tuple[List[Document], Optional[str]]:
+    with stage("download") as record:
+        response = _get_object(bucket_name, object_key, if_none_match)
+        record.bytes = response.get("ContentLength", 0)
+    return _load_body(response, loader), response.get("ETag")
+
+
+def _spool_body(response: Dict[str, Any]) -> BinaryIO:
+    # Removed by the OS once closed, even if the process dies first
+    file = tempfile.TemporaryFile()
+    body = response["Body"]
+    try:
+        with stage("download", mode="stream") as record:
+            shutil.copyfileobj(body, file, 1024 * 1024)
+            record.bytes = file.tell()
+        file.seek(0)
+        return file
+    except BaseException:
+        file.close()
+        raise
+    finally:
+        body.close()
+
+
+def warn_if_skip_unchanged_inactive(
+    skip_unchanged: bool = SKIP_UNCHANGED_OBJECTS,
+) -> None:
+    """Warn at startup when skip_unchanged is set but has no manifest to use."""
+    if skip_unchanged and get_document_manifest() is None:
+        print(
+            "Warning: SKIP_UNCHANGED_OBJECTS has no effect without "
+            "DOCUMENT_MANIFEST_ENABLED=true; every object will be downloaded "
+            "and re-indexed"
+        )
+
+
+def _unchanged(file_info: Dict[str, Any]) -> Tuple[List[Document], bool]:
+    print(f"Skipping unchanged object {file_info['object_key']}")
+    inc("objects_unchanged_total")
+    file_info["unchanged"] = True
+    return [], True
+
+
+def _file_metadata(
+    bucket_name: str, object_key: str, file_extension: str
+) -> Dict[str, Any]:
+    return {
+        "bucketName": bucket_name,
+        "objectKey": object_key,
+        "source": f"s3://{bucket_name}/{object_key}",
+        "file_type": file_extension[1:],  # Remove the dot
+    }
+
+
+async def _downloaded(
+    file_info: Dict[str, Any],
+    etag: Optional[str],
+    manifest: Optional[DocumentManifest],
+    indexed_etag: Optional[str],
+) -> None:
+    """Remember the downloaded version and forget the indexed one it replaces."""
+    file_info["etag"] = etag
+    if manifest is not None and indexed_etag not in (None, etag):
+        await asyncio.get_running_loop().run_in_executor(
+            None,
+            manifest.forget_indexed,
+            file_info["bucket_name"],
+            file_info["object_key"],
+        )
 
 
 async def download_and_process_file(
     file_info: Dict[str, Any],
-) -> Tuple[List[Document], bool]:
-    """Download a file from S3 and process it based on its type using Langchain loaders."""
+    stream: bool = False,
+    skip_unchanged: bool = SKIP_UNCHANGED_OBJECTS,
+) -> Tuple[Union[List[Document], ChunkStream], bool]:
+    """
+    Download a file from S3 and process it based on its type.
+
+    Files are parsed directly from memory; only streamed documents are kept
+    in a temporary file. The download runs in a thread; parsing runs in the
+    process pool when it is enabled, otherwise it streams from the response
+    body in the same thread.
+
+    With stream, a PDF of at least PDF_STREAM_MIN_PAGES pages or a CSV or
+    .xlsx file of at least TABLE_STREAM_MIN_BYTES bytes is returned as a
+    ChunkStream of already chunked Documents instead of a list; the caller
+    must aclose() it.
+
+    With skip_unchanged, an object whose ETag matches the version recorded as
+    indexed in the document manifest is not downloaded: either file_info
+    already carries that ETag (from HeadObject or a listing) or the GET is
+    made conditional with IfNoneMatch. Such objects return ([], True) with
+    file_info["unchanged"] set. Otherwise file_info["etag"] is set to the
+    downloaded version's ETag, to be recorded once it is indexed.
+    """
     bucket_name = file_info["bucket_name"]
     object_key = file_info["object_key"]
 
     print(f"Processing file: {bucket_name}/{object_key}")
 
-    try:
-        # Download file from S3
-        response = s3.get_object(Bucket=bucket_name, Key=object_key)
-        file_content = response["Body"].read()
-
-        # Determine file type from object key
-        file_extension = os.path.splitext(object_key)[1].lower()
+    # Determine file type from object key
+    file_extension = os.path.splitext(object_key)[1].lower()
+    loader = LOADERS.get(file_extension)
+    if loader is None:
+        # Unsupported file type
+        print(f"Unsupported file type: {file_extension} for {object_key}")
+        return [], False
 
-        # Create a temporary file to use with Langchain loaders
-        with tempfile.NamedTemporaryFile(
-            suffix=file_extension, delete=False
-        ) as temp_file:
-            temp_file.write(file_content)
-            temp_path = temp_file.name
+    manifest = get_document_manifest()
+    indexed_etag = None
+    if manifest is not None:
+        indexed_etag = await asyncio.get_running_loop().run_in_executor(
+            None, manifest.get_indexed_etag, bucket_name, object_key
+        )
+    if_none_match = indexed_etag if skip_unchanged else None
+    if if_none_match is not None and file_info.get("etag") == if_none_match:
+        return _unchanged(file_info)
 
-        docs = []
-        try:
-            # Process file based on its type using Langchain loaders
-            if file_extension == ".txt":
-                loader = TextLoader(temp_path)
-                docs = loader.load()
-
-            elif file_extension == ".pdf":
-                loader = PyMuPDFLoader(temp_path)
-                docs = loader.load()
-
-            elif file_extension == ".csv":
-                loader = CSVLoader(temp_path)
-                docs = loader.load()
-
-            elif file_extension in [".xlsx", ".xls"]:
-                sheets = pd.read_excel(temp_path, sheet_name=None)
-                for sheet_name, df in sheets.items():
-                    text = f"Sheet: {sheet_name}\n" + df.to_csv(index=False)
-                    docs.append(
-                        Document(
-                            page_content=text,
-                            metadata={"sheet_name": sheet_name},
-                        )
-                    )
+    try:
+        loop = asyncio.get_running_loop()
+        metadata = _file_metadata(bucket_name, object_key, file_extension)
+        streamed = stream and file_extension == ".pdf" and PDF_STREAM_MIN_PAGES > 0
+        response = None
+        if stream and file_extension in TABLE_ITERATORS and TABLE_STREAM_MIN_BYTES > 0:
+            # The size decides between streaming and loading, so GET first
+            with stage("download") as record:
+                response = await loop.run_in_executor(
+                    None, _get_object, bucket_name, object_key, if_none_match
+                )
+                record.bytes = size = response.get("ContentLength", 0)
+            await _downloaded(file_info, response.get("ETag"), manifest, indexed_etag)
+            if size >= TABLE_STREAM_MIN_BYTES:
+                print(f"Streaming {size} bytes of rows from {object_key}")
+                file = await loop.run_in_executor(None, _spool_body, response)
+                return TableChunkStream(file, file_extension, metadata), True
 
-            else:
-                # Unsupported file type
-                print(f"Unsupported file type: {file_extension} for {object_key}")
-                return [], False
-
-            # Add metadata to all documents
-            for doc in docs:
-                doc.metadata.update(
-                    {
-                        "bucketName": bucket_name,
-                        "objectKey": object_key,
-                        "source": f"s3://{bucket_name}/{object_key}",
-                        "file_type": file_extension[1:],  # Remove the dot
-                    }
+        if get_process_pool() is not None or streamed:
+            if response is None:
+                content, etag = await loop.run_in_executor(
+                    None, _download_bytes, bucket_name, object_key, if_none_match
                 )
+                await _downloaded(file_info, etag, manifest, indexed_etag)
+            else:
+                content = await loop.run_in_executor(None, _read_body, response)
+            if streamed:
+                page_count = await loop.run_in_executor(None, _pdf_page_count, content)
+                if page_count >= PDF_STREAM_MIN_PAGES:
+                    # Pool workers open the PDF by path rather than receiving
+                    # the whole document with every batch of pages
+                    path = await loop.run_in_executor(
+                        None, _write_temp_file, content, file_extension
+                    )
+                    print(f"Streaming {page_count} pages from {object_key}")
+                    return PdfChunkStream(path, page_count, metadata), True
+            with stage("parse") as record:
+                docs = await run_cpu_bound(load_document_bytes, content, file_extension)
+                record.bytes = len(content)
+                record.items = len(docs)
+            del content
+        elif response is None:
+            docs, etag = await loop.run_in_executor(
+                None, _download_and_load, bucket_name, object_key, loader, if_none_match
+            )
+            await _downloaded(file_info, etag, manifest, indexed_etag)
+        else:
+            docs = await loop.run_in_executor(None, _load_body, response, loader)
 
-            print(f"Extracted {len(docs)} documents from {object_key}")
-            return docs, True
+        # Add metadata to all documents
+        for doc in docs:
+            doc.metadata.update(metadata)
 
-        finally:
-            # Clean up the temporary file
-            os.unlink(temp_path)
+        print(f"Extracted {len(docs)} documents from {object_key}")
+        return docs, True
 
     except botocore.exceptions.ClientError as e:
         error_code = e.response.get("Error", {}).get("Code", "")
+        if error_code in ("304", "NotModified"):
+            return _unchanged(file_info)
         if error_code == "NoSuchKey":
             # File doesn't exist in S3, but we got a message about it
             # This is likely because the file was deleted directly from S3
@@ -1,12 +1,59 @@
+import asyncio
+import contextlib
+import functools
 import json
-import boto3
-from typing import List, Dict, Any
+import os
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+)
+from .clients import get_s3_client, get_sqs_client
+from .metrics import inc, stage
+from .sqs_settings import (
+    SQS_BATCH_LIMIT,
+    SQS_HEARTBEAT_INTERVAL,
+    SQS_VISIBILITY_TIMEOUT,
+)
 
-# Initialize AWS clients
-sqs = boto3.client("sqs", region_name="us-east-1")
+# Maximum number of file events processed at the same time
+MAX_CONCURRENT_MESSAGES = int(os.getenv("MAX_CONCURRENT_MESSAGES", "4"))
 
+# Objects at least this large (after weighting by type) are processed in the
+# large lane so they don't hold up small files; 0 disables the size check
+LARGE_OBJECT_BYTES = int(os.getenv("LARGE_OBJECT_BYTES", str(16 * 1024 * 1024)))
 
-def parse_message(message: Dict[str, Any]) -> Dict[str, Any]:
+# Large objects processed at the same time, across all batches in the process
+MAX_CONCURRENT_LARGE_MESSAGES = int(os.getenv("MAX_CONCURRENT_LARGE_MESSAGES", "1"))
+
+# Compressed formats hold far more content than their size suggests
+_SIZE_WEIGHTS = {".xlsx": 5}
+
+# Lane semaphores by (lane, limit) and the event loop they belong to
+_lanes: Optional[
+    Tuple[asyncio.AbstractEventLoop, Dict[Tuple[str, int], asyncio.Semaphore]]
+] = None
+
+# Run only the last event per object in a batch; earlier ones are superseded
+COALESCE_EVENTS = os.getenv("COALESCE_EVENTS", "true").lower() == "true"
+
+# Process-wide count of events received and of those that were superseded
+_coalesce_stats = {"events": 0, "operations": 0, "superseded": 0}
+
+# Per-object locks shared by all batches in this process
+_object_locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+_object_lock_users: Dict[Tuple[str, str], int] = {}
+
+# Processes one file event: (file_info, event_type) -> success
+ProcessFileCallback = Callable[[Dict[str, Any], str], Awaitable[bool]]
+
+
+def parse_message(message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Parse a single SQS message and extract file information and event type."""
     message_id = message.get("MessageId", "unknown")
     try:
@@ -30,48 +77,274 @@ def parse_message(message: Dict[str, Any]) -> Dict[str, Any]:
         return None
 
 
+def _is_object_event(event_type: str) -> bool:
+    return "ObjectCreated" in event_type or "ObjectRemoved" in event_type
+
+
+def _event_kind(event_type: str) -> str:
+    """Map an S3 event name to a low-cardinality metric label."""
+    if "ObjectCreated" in event_type:
+        return "created"
+    if "ObjectRemoved" in event_type:
+        return "removed"
+    return "other"
+
+
+def coalesce_file_events(
+    file_infos: List[Tuple[int, Dict[str, Any]]],
+) -> List[Tuple[int, Dict[str, Any], List[int]]]:
+    """
+    Reduce create and delete events to the last one per (bucket_name, object_key).
+
+    Both handlers act on the object's current state (a create re-reads the
+    object, a delete removes all of its vectors), so the final event alone
+    has the effect of applying every event in order. Other event types are
+    kept as they are so they never absorb a real event. Returns
+    (index, file_info, superseded_indices) for each event left to run, in
+    arrival order.
+    """
+    latest: Dict[Tuple[str, str], Tuple[int, Dict[str, Any], List[int]]] = {}
+    operations: List[Tuple[int, Dict[str, Any], List[int]]] = []
+    for index, file_info in file_infos:
+        if not _is_object_event(file_info.get("event_type", "")):
+            operations.append((index, file_info, []))
+            continue
+        key = (file_info["bucket_name"], file_info["object_key"])
+        superseded = []
+        if key in latest:
+            previous_index, _, previous_superseded = latest[key]
+            superseded = previous_superseded + [previous_index]
+        latest[key] = (index, file_info, superseded)
+
+    operations.extend(latest.values())
+    return sorted(operations, key=lambda operation: operation[0])
+
+
+def get_coalescing_stats() -> Dict[str, int]:
+    """Return how many events were received and how many were skipped as superseded."""
+    return dict(_coalesce_stats)
+
+
+async def classify_file_event(file_info: Dict[str, Any]) -> str:
+    """
+    Return the lane an event is processed in: "large" or "small".
+
+    Create events are sized with HeadObject, and ContentLength weighted by
+    file type is compared with LARGE_OBJECT_BYTES; the size and ETag are kept in
+    file_info["content_length"] and file_info["etag"]. Deletes, and objects that can't be sized
+    (e.g. already deleted), take the small lane.
+    """
+    if LARGE_OBJECT_BYTES <= 0 or "ObjectCreated" not in file_info.get(
+        "event_type", ""
+    ):
+        return "small"
+    object_key = file_info["object_key"]
+    try:
+        response = await asyncio.get_running_loop().run_in_executor(
+            None,
+            functools.partial(
+                get_s3_client().head_object,
+                Bucket=file_info["bucket_name"],
+                Key=object_key,
+            ),
+        )
+    except Exception:
+        # Missing objects and errors are handled by the regular processing
+        return "small"
+    size = response.get("ContentLength", 0)
+    file_info["content_length"] = size
+    # Lets an unchanged object be skipped without even a conditional GET
+    file_info["etag"] = response.get("ETag")
+    weight = _SIZE_WEIGHTS.get(os.path.splitext(object_key)[1].lower(), 1)
+    return "large" if size * weight >= LARGE_OBJECT_BYTES else "small"
+
+
+def _lane_semaphore(lane: str, limit: int) -> asyncio.Semaphore:
+    """Return a lane's semaphore, shared by every batch on this event loop."""
+    global _lanes
+    loop = asyncio.get_running_loop()
+    if _lanes is None or _lanes[0] is not loop:
+        _lanes = (loop, {})
+    key = (lane, max(1, limit))
+    semaphore = _lanes[1].get(key)
+    if semaphore is None:
+        semaphore = _lanes[1][key] = asyncio.Semaphore(key[1])
+    return semaphore
+
+
+@contextlib.asynccontextmanager
+async def _object_lock(bucket_name: str, object_key: str) -> AsyncIterator[None]:
+    """Serialize work on one object; waiters are granted the lock in FIFO order."""
+    key = (bucket_name, object_key)
+    lock = _object_locks.get(key)
+    if lock is None:
+        lock = _object_locks[key] = asyncio.Lock()
+        _object_lock_users[key] = 0
+    _object_lock_users[key] += 1
+    try:
+        async with lock:
+            yield
+    finally:
+        _object_lock_users[key] -= 1
+        if not _object_lock_users[key]:
+            del _object_locks[key]
+            del _object_lock_users[key]
+
+
 async def process_messages(
-    messages: List[Dict[str, Any]], process_file_callback
+    messages: List[Dict[str, Any]],
+    process_file_callback: ProcessFileCallback,
+    max_concurrency: Optional[int] = None,
+    on_result: Optional[Callable[[int, bool], None]] = None,
+    coalesce: Optional[bool] = None,
 ) -> List[bool]:
-    """Process multiple messages from SQS based on their event types."""
-    results = []
+    """
+    Process multiple messages from SQS based on their event types.
+
+    Messages for different objects are processed concurrently, up to
+    max_concurrency at a time across all batches on the event loop that use
+    the same limit, so overlapping batches don't multiply it. Large objects (see classify_file_event) run in
+    a separate lane limited to MAX_CONCURRENT_LARGE_MESSAGES across all
+    batches, so they neither take nor wait for the slots small files use.
+    Messages for the same object are processed one after another in arrival
+    order. The returned results line up with messages,
+    and on_result, if given, is called with (index, success) as soon as each
+    message finishes so it can be acknowledged without waiting for the batch.
 
-    # Parse all messages
+    With coalesce (COALESCE_EVENTS by default) only the last message for each
+    object is processed; the messages it supersedes share its result, so they
+    are acknowledged, or redelivered, together with it.
+    """
+    if max_concurrency is None:
+        max_concurrency = MAX_CONCURRENT_MESSAGES
+    if coalesce is None:
+        coalesce = COALESCE_EVENTS
+    results = [False] * len(messages)
+
+    # Parse all messages, remembering which message each file_info came from
     file_infos = []
-    for message in messages:
+    for i, message in enumerate(messages):
         file_info = parse_message(message)
         if file_info:
-            file_infos.append(file_info)
-            results.append(True)  # Placeholder, will update based on processing result
-        else:
-            results.append(False)
+            file_infos.append((i, file_info))
+        elif on_result:
+            on_result(i, False)
 
     print(f"Parsed {len(file_infos)} of {len(messages)} messages")
 
-    # Process each file based on event type
-    for i, file_info in enumerate(file_infos):
+    if coalesce:
+        operations = coalesce_file_events(file_infos)
+    else:
+        operations = [(i, file_info, []) for i, file_info in file_infos]
+    superseded_count = len(file_infos) - len(operations)
+    _coalesce_stats["events"] += len(file_infos)
+    _coalesce_stats["operations"] += len(operations)
+    _coalesce_stats["superseded"] += superseded_count
+    inc("events_total", len(file_infos))
+    inc("events_superseded_total", superseded_count)
+    if superseded_count:
+        print(
+            f"Coalesced {len(file_infos)} events into {len(operations)} operations "
+            f"({superseded_count} superseded)"
+        )
+
+    async def _process(
+        index: int, file_info: Dict[str, Any], superseded: List[int]
+    ) -> None:
         event_type = file_info.get("event_type", "")
         object_key = file_info["object_key"]
 
-        try:
-            # Call the appropriate callback to process the file
-            success = await process_file_callback(file_info, event_type)
-            results[i] = success
+        # Take the per-object lock before a worker slot so queued events for a
+        # busy object don't hold slots other objects could use
+        async with _object_lock(file_info["bucket_name"], object_key):
+            # Size the object in a small-lane slot so a large batch doesn't
+            # send every HeadObject request at once
+            async with _lane_semaphore("small", max_concurrency):
+                lane = await classify_file_event(file_info)
+            if lane == "large":
+                lane_semaphore = _lane_semaphore(lane, MAX_CONCURRENT_LARGE_MESSAGES)
+            else:
+                lane_semaphore = _lane_semaphore(lane, max_concurrency)
+            async with lane_semaphore:
+                with stage(
+                    "message", event=_event_kind(event_type), lane=lane
+                ) as record:
+                    try:
+                        # Call the appropriate callback to process the file
+                        results[index] = await process_file_callback(
+                            file_info, event_type
+                        )
+                        if not results[index]:
+                            record.fail("Unsuccessful")
 
-        except Exception as e:
-            print(f"Error processing {event_type} event for {object_key}: {str(e)}")
-            import traceback
+                    except Exception as e:
+                        print(
+                            f"Error processing {event_type} event for {object_key}: {str(e)}"
+                        )
+                        import traceback
 
-            traceback.print_exc()
-            results[i] = False
+                        traceback.print_exc()
+                        results[index] = False
+                        record.fail(e)
+
+        for i in superseded:
+            results[i] = results[index]
+        if on_result:
+            for i in (*superseded, index):
+                on_result(i, results[index])
+
+    # Tasks start in arrival order, so same-object events queue in that order
+    await asyncio.gather(
+        *(_process(i, file_info, superseded) for i, file_info, superseded in operations)
+    )
 
     success_count = results.count(True)
     print(f"Processed messages: {success_count}/{len(messages)} successful")
     return results
 
 
-async def poll_sqs_queue(queue_url: str, process_file_callback) -> None:
-    """Poll and process messages from SQS queue."""
+async def _heartbeat(queue_url: str, receipt_handles: Dict[int, str]) -> None:
+    """Periodically extend the visibility timeout of messages still being processed."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SQS_HEARTBEAT_INTERVAL)
+        handles = list(receipt_handles.values())
+        for i in range(0, len(handles), SQS_BATCH_LIMIT):
+            entries = [
+                {
+                    "Id": str(j),
+                    "ReceiptHandle": handle,
+                    "VisibilityTimeout": SQS_VISIBILITY_TIMEOUT,
+                }
+                for j, handle in enumerate(handles[i : i + SQS_BATCH_LIMIT])
+            ]
+            try:
+                await loop.run_in_executor(
+                    None,
+                    functools.partial(
+                        get_sqs_client().change_message_visibility_batch,
+                        QueueUrl=queue_url,
+                        Entries=entries,
+                    ),
+                )
+            except Exception as e:
+                print(f"Error changing visibility of {len(entries)} messages: {e}")
+
+
+async def poll_sqs_queue(
+    queue_url: str, process_file_callback: ProcessFileCallback, daemon: bool = False
+) -> None:
+    """
+    Poll and process messages from SQS queue.
+
+    By default polling ends once the queue is empty. With daemon=True a
+    long-running SQSWorker keeps polling until SIGTERM/SIGINT.
+    """
+    if daemon:
+        from .sqs_worker import run_sqs_worker
+
+        return await run_sqs_worker(queue_url, process_file_callback)
+
     print("Starting SQS message polling...")
     try:
         has_more_messages = True
@@ -80,11 +353,12 @@ async def poll_sqs_queue(queue_url: str, process_file_callback) -> None:
 
         while has_more_messages:
             # Receive messages from SQS
-            response = sqs.receive_message(
-                QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=10
-            )
-
-            messages = response.get("Messages", [])
+            with stage("receive") as record:
+                response = get_sqs_client().receive_message(
+                    QueueUrl=queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=10
+                )
+                messages = response.get("Messages", [])
+                record.items = len(messages)
 
             if not messages:
                 print("No messages received, ending polling")
@@ -94,17 +368,29 @@ async def poll_sqs_queue(queue_url: str, process_file_callback) -> None:
             print(f"Received {len(messages)} messages from SQS")
             message_count += len(messages)
 
-            # Process all messages in batch
-            successfully_processed = await process_messages(
-                messages, process_file_callback
-            )
+            # Process all messages in batch, keeping the ones still running
+            # (typically large files) invisible to other consumers
+            unfinished = {i: m["ReceiptHandle"] for i, m in enumerate(messages)}
+            heartbeat = asyncio.ensure_future(_heartbeat(queue_url, unfinished))
+            try:
+                successfully_processed = await process_messages(
+                    messages,
+                    process_file_callback,
+                    on_result=lambda index, success: unfinished.pop(index, None),
+                )
+            finally:
+                heartbeat.cancel()
 
             # Delete successfully processed messages
             success_count = 0  # Reset success_count for this batch
             for message, success in zip(messages, successfully_processed):
                 receipt_handle = message.get("ReceiptHandle")
                 if receipt_handle and success:
-                    sqs.delete_message(QueueUrl=queue_url, ReceiptHandle=receipt_handle)
+                    with stage("ack") as record:
+                        record.items = 1
+                        get_sqs_client().delete_message(
+                            QueueUrl=queue_url, ReceiptHandle=receipt_handle
+                        )
                     success_count += 1
 
             print(
@@ -0,0 +1,301 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from types import TracebackType
+from typing import Any, Dict, List, Optional, Tuple, Type
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+METRICS_JSON_LOGS = os.getenv("METRICS_JSON_LOGS", "false").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9102"))
+
+PREFIX = "embedding_forge_"
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_HELP = {
+    "stage_duration_seconds": "Time spent in each pipeline stage",
+    "stage_total": "Completed pipeline stage runs by outcome",
+    "stage_errors_total": "Failed pipeline stage runs by error class",
+    "stage_bytes_total": "Bytes handled by each pipeline stage",
+    "stage_items_total": "Messages, documents or vectors handled by each stage",
+    "stage_chunks_total": "Chunks handled by each pipeline stage",
+    "stage_tokens_total": "Tokens handled by each pipeline stage",
+}
+
+_enabled = METRICS_ENABLED or METRICS_JSON_LOGS
+_json_logs = METRICS_JSON_LOGS
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class _Registry:
+    """Thread-safe counters, gauges and histograms keyed by name and labels."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        self.gauges: Dict[str, Dict[LabelKey, float]] = defaultdict(dict)
+        # name -> labels -> [bucket counts..., sum, count]
+        self.histograms: Dict[str, Dict[LabelKey, List[float]]] = defaultdict(dict)
+
+    def inc(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            series = self.counters[name]
+            series[labels] = series.get(labels, 0.0) + value
+
+    def set(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            self.gauges[name][labels] = value
+
+    def observe(self, name: str, value: float, labels: LabelKey) -> None:
+        with self._lock:
+            series = self.histograms[name]
+            state = series.get(labels)
+            if state is None:
+                state = series[labels] = [0.0] * (len(DURATION_BUCKETS) + 2)
+            for i, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self) -> str:
+        """Render all series in the Prometheus text exposition format."""
+        lines: List[str] = []
+        with self._lock:
+            for kind, store in (("counter", self.counters), ("gauge", self.gauges)):
+                for name in sorted(store):
+                    _header(lines, name, kind)
+                    for labels, value in sorted(store[name].items()):
+                        lines.append(f"{PREFIX}{name}{_labels(labels)} {value:g}")
+            for name in sorted(self.histograms):
+                _header(lines, name, "histogram")
+                for labels, state in sorted(self.histograms[name].items()):
+                    for bound, count in zip(DURATION_BUCKETS, state):
+                        le = (("le", f"{bound:g}"),)
+                        lines.append(
+                            f"{PREFIX}{name}_bucket{_labels(labels + le)} {count:g}"
+                        )
+                    inf = (("le", "+Inf"),)
+                    lines.append(
+                        f"{PREFIX}{name}_bucket{_labels(labels + inf)} {state[-1]:g}"
+                    )
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {state[-2]:g}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {state[-1]:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _header(lines: List[str], name: str, kind: str) -> None:
+    if name in _HELP:
+        lines.append(f"# HELP {PREFIX}{name} {_HELP[name]}")
+    lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: LabelKey) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+_registry = _Registry()
+
+
+class Stage:
+    """
+    Times one run of a pipeline stage; use as a context manager.
+
+    Set bytes, items, chunks or tokens on the record inside the block to count
+    what the stage handled. An exception leaving the block, or fail(), marks
+    the run as failed with the error's class name.
+    """
+
+    __slots__ = (
+        "name",
+        "labels",
+        "bytes",
+        "items",
+        "chunks",
+        "tokens",
+        "error",
+        "_start",
+    )
+
+    def __init__(self, name: str, labels: Dict[str, object]):
+        self.name = name
+        self.labels = labels
+        self.bytes = 0
+        self.items = 0
+        self.chunks = 0
+        self.tokens = 0
+        self.error: Optional[str] = None
+        self._start = 0.0
+
+    def fail(self, error: Any) -> None:
+        """Mark the run as failed without raising."""
+        self.error = error if isinstance(error, str) else type(error).__name__
+
+    def __enter__(self) -> "Stage":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc: Optional[BaseException],
+        tb: Optional[TracebackType],
+    ) -> None:
+        duration = time.perf_counter() - self._start
+        if exc_type is not None and self.error is None:
+            self.error = exc_type.__name__
+        _record_stage(self, duration)
+
+
+class _NoopStage(Stage):
+    """
+    Returned while metrics are disabled; records nothing.
+
+    One instance is shared by every caller, so after construction it ignores
+    writes such as `record.items += n` and fail() instead of leaking them
+    between concurrent stages.
+    """
+
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if not hasattr(self, name):
+            object.__setattr__(self, name, value)
+
+    def fail(self, error: Any) -> None:
+        pass
+
+    def __enter__(self) -> "Stage":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+_NOOP_STAGE = _NoopStage("noop", {})
+
+
+def stage(name: str, **labels: object) -> Stage:
+    """Return a timer for one run of a stage, or a shared no-op when disabled."""
+    if not _enabled:
+        return _NOOP_STAGE
+    return Stage(name, labels)
+
+
+def _record_stage(record: Stage, duration: float) -> None:
+    labels = {"stage": record.name, **record.labels}
+    key = _label_key(labels)
+    outcome = "error" if record.error else "ok"
+    _registry.observe("stage_duration_seconds", duration, key)
+    _registry.inc("stage_total", 1, _label_key({**labels, "outcome": outcome}))
+    if record.error:
+        _registry.inc(
+            "stage_errors_total", 1, _label_key({**labels, "error": record.error})
+        )
+    for field in ("bytes", "items", "chunks", "tokens"):
+        value = getattr(record, field)
+        if value:
+            _registry.inc(f"stage_{field}_total", value, key)
+
+    if _json_logs:
+        entry = {
+            "ts": round(time.time(), 3),
+            "event": "stage",
+            **labels,
+            "duration_ms": round(duration * 1000, 3),
+            "outcome": outcome,
+        }
+        if record.error:
+            entry["error"] = record.error
+        for field in ("bytes", "items", "chunks", "tokens"):
+            value = getattr(record, field)
+            if value:
+                entry[field] = value
+        sys.stdout.write(json.dumps(entry) + "\n")
+
+
+def inc(name: str, value: float = 1, **labels: object) -> None:
+    """Add to a counter; name is used without the embedding_forge_ prefix."""
+    if _enabled:
+        _registry.inc(name, value, _label_key(labels))
+
+
+def set_gauge(name: str, value: float, **labels: object) -> None:
+    """Set a gauge; name is used without the embedding_forge_ prefix."""
+    if _enabled:
+        _registry.set(name, value, _label_key(labels))
+
+
+def metrics_enabled() -> bool:
+    return _enabled
+
+
+def configure_metrics(enabled: bool = True, json_logs: bool = False) -> None:
+    """Enable or disable recording (and JSON stage logs) for this process."""
+    global _enabled, _json_logs
+    _enabled = enabled or json_logs
+    _json_logs = json_logs
+
+
+def render_metrics() -> str:
+    """Return the current metrics in the Prometheus text format."""
+    return _registry.render()
+
+
+_server: Any = None
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Any:
+    """
+    Serve /metrics for Prometheus from a background thread.
+
+    Metrics are read straight from the in-process registry, so scraping never
+    waits on the event loop.
+    """
+    global _server
+    if _server is not None:
+        return _server
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = render_metrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            # Scrapes are frequent; keep them out of the worker's output
+            pass
+
+    _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    _server.daemon_threads = True
+    threading.Thread(
+        target=_server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    print(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+    return _server
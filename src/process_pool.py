@@ -0,0 +1,72 @@
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+# Number of worker processes for CPU-bound parsing and chunking.
+# 0 runs that work in a thread instead, which keeps the event loop free but
+# shares one core with everything else.
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(os.cpu_count() or 1)))
+
+# "spawn" avoids forking a process that already has boto3/executor threads
+PROCESS_POOL_START_METHOD = os.getenv("PROCESS_POOL_START_METHOD", "spawn")
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def _init_worker() -> None:
+    """Load the spaCy model once when each worker process starts."""
+    from src.utils.document_processor import get_nlp
+
+    get_nlp()
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared process pool, or None when it is disabled."""
+    global _pool
+    if _pool is None and PROCESS_POOL_WORKERS > 0:
+        _pool = ProcessPoolExecutor(
+            max_workers=PROCESS_POOL_WORKERS,
+            mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD),
+            initializer=_init_worker,
+        )
+        print(f"Started process pool with {PROCESS_POOL_WORKERS} workers")
+    return _pool
+
+
+def shutdown_process_pool() -> None:
+    """Stop the worker processes, waiting for running tasks to finish."""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True)
+        _pool = None
+
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a CPU-bound function off the event loop.
+
+    The function runs in the process pool when it is enabled, otherwise in the
+    default thread executor. func and its arguments must be picklable.
+
+    Metrics are kept per process, so anything func records in a worker is
+    never exported; time and count the work around this call instead, as the
+    parse and chunk stages do.
+    """
+    global _pool
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    try:
+        return await loop.run_in_executor(
+            pool, functools.partial(func, *args, **kwargs)
+        )
+    except BrokenProcessPool:
+        # A worker died (e.g. out of memory); start a fresh pool for the next call
+        print("Process pool is broken, restarting it on next use")
+        if pool is not None and _pool is pool:
+            pool.shutdown(wait=False)
+            _pool = None
+        raise
@@ -0,0 +1,122 @@
+import argparse
+import random
+import time
+from typing import Any, Callable, List
+
+import spacy
+from langchain_core.documents import Document
+
+from src.utils.document_processor import chunk_documents, get_nlp
+
+WORDS = (
+    "the invoice contract payment supplier quarterly revenue agreement party "
+    "shall terms delivery customer report total amount due within days of "
+    "receipt services provided according to schedule section clause liability "
+    "insurance confidential information obligations notice termination"
+).split()
+
+
+def generate_corpus(num_docs: int, words_per_doc: int, seed: int = 0) -> List[Document]:
+    """Generate deterministic business-like documents of short sentences."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(num_docs):
+        sentences = []
+        remaining = words_per_doc
+        while remaining > 0:
+            length = min(remaining, rng.randint(8, 30))
+            words = [rng.choice(WORDS) for _ in range(length)]
+            sentences.append(" ".join(words).capitalize() + ".")
+            remaining -= length
+        paragraphs = [
+            " ".join(sentences[j : j + 6]) for j in range(0, len(sentences), 6)
+        ]
+        docs.append(Document(page_content="\n\n".join(paragraphs), metadata={"doc": i}))
+    return docs
+
+
+def legacy_chunk_documents(
+    docs: List[Document],
+    legacy_nlp: Any,
+    chunk_size: int = 700,
+    overlap_ratio: float = 0.3,
+) -> List[Document]:
+    """The previous chunker: full pipeline, three parses per document."""
+    all_chunks: List[Document] = []
+    for doc in docs:
+        cleaned_content = " ".join(t.text for t in legacy_nlp(doc.page_content))
+        spacy_doc = legacy_nlp(cleaned_content)
+        sentences = [s.text.strip() for s in spacy_doc.sents if s.text.strip()]
+
+        chunks = []
+        current_chunk: List[str] = []
+        current_tokens = 0
+        overlap_size = int(chunk_size * overlap_ratio)
+        for sent in sentences:
+            sent_tokens = [token.text for token in legacy_nlp(sent)]
+            sent_len = len(sent_tokens)
+            if current_tokens + sent_len > chunk_size and current_chunk:
+                chunks.append(" ".join(current_chunk))
+                current_chunk = (
+                    current_chunk[-overlap_size:]
+                    if overlap_size < len(current_chunk)
+                    else current_chunk
+                )
+                current_tokens = len(current_chunk)
+            current_chunk.extend(sent_tokens)
+            current_tokens += sent_len
+        if current_chunk:
+            chunks.append(" ".join(current_chunk))
+        all_chunks.extend(
+            Document(page_content=c, metadata=doc.metadata.copy()) for c in chunks
+        )
+    return all_chunks
+
+
+def run(
+    label: str,
+    func: Callable[[List[Document]], List[Document]],
+    docs: List[Document],
+    total_tokens: int,
+) -> float:
+    start = time.perf_counter()
+    chunks = func(docs)
+    elapsed = time.perf_counter() - start
+    print(
+        f"{label:<8} {elapsed:8.2f}s {total_tokens / elapsed:12,.0f} tokens/sec "
+        f"{len(chunks):8} chunks"
+    )
+    return elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark chunk_documents against the previous three-parse chunker"
+    )
+    parser.add_argument("--docs", type=int, default=200, help="Number of documents")
+    parser.add_argument(
+        "--words-per-doc", type=int, default=5000, help="Words per document"
+    )
+    parser.add_argument(
+        "--skip-legacy", action="store_true", help="Only time the current chunker"
+    )
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.docs, args.words_per_doc)
+    total_tokens = sum(
+        sum(1 for t in d if not t.is_space)
+        for d in get_nlp().pipe(doc.page_content for doc in corpus)
+    )
+    print(f"Corpus: {len(corpus)} documents, {total_tokens:,} tokens")
+
+    current = run("current", chunk_documents, corpus, total_tokens)
+    if not args.skip_legacy:
+        legacy_nlp = spacy.load("en_core_web_sm")
+        legacy_nlp.max_length = get_nlp().max_length
+        legacy = run(
+            "legacy",
+            lambda docs: legacy_chunk_documents(docs, legacy_nlp),
+            corpus,
+            total_tokens,
+        )
+        print(f"Speedup: {legacy / current:.1f}x")
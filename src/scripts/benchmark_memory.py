@@ -0,0 +1,139 @@
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from src.clients.openai_embeddings import EMBEDDING_DIMENSIONS
+
+UPSERT_BATCH_SIZE = 100
+
+
+def peak_memory_mb(func: Callable[..., Any], *args: Any) -> float:
+    """Peak memory allocated while func runs, excluding what existed before."""
+    # ru_maxrss would also count reading the response body, which is the same
+    # for both paths, so trace only the allocations made by the path itself
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def fake_response(chunks: int, dimensions: int, encoding: str) -> str:
+    """Build an embeddings response body like the API returns for one document."""
+    rng = np.random.default_rng(0)
+    items = []
+    for i in range(chunks):
+        vector = rng.standard_normal(dimensions).astype("<f4")
+        if encoding == "base64":
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        items.append(json.dumps({"index": i, "embedding": embedding}))
+    return '{"data": [' + ", ".join(items) + "]}"
+
+
+def run_lists(body: str) -> int:
+    """Previous path: float embeddings kept as lists until every vector is built."""
+    response = json.loads(body)
+    del body
+    embeddings = [item["embedding"] for item in response["data"]]
+    vectors = [
+        {"id": f"doc-chunk-{i}", "values": values, "metadata": {}}
+        for i, values in enumerate(embeddings)
+    ]
+    return len(vectors)
+
+
+def run_float32(body: str, dimensions: int) -> int:
+    """Current path: base64 decoded into one float32 matrix, lists only per batch."""
+    response = json.loads(body)
+    del body
+    matrix = np.zeros((len(response["data"]), dimensions), dtype=np.float32)
+    for item in response["data"]:
+        matrix[item["index"]] = np.frombuffer(
+            base64.b64decode(item["embedding"]), dtype="<f4"
+        )
+    del response
+    vectors: List[Dict[str, Any]] = [
+        {"id": f"doc-chunk-{i}", "values": row, "metadata": {}}
+        for i, row in enumerate(matrix)
+    ]
+    sent = 0
+    for start in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        payload = [
+            {**v, "values": v["values"].tolist()}
+            for v in vectors[start : start + UPSERT_BATCH_SIZE]
+        ]
+        sent += len(payload)
+    return sent
+
+
+def measure(mode: str, body_path: str, dimensions: int) -> None:
+    """Run one mode in this process and print the peak memory it allocated."""
+    with open(body_path) as f:
+        body = f.read()
+    if mode == "float32":
+        peak = peak_memory_mb(run_float32, body, dimensions)
+    else:
+        peak = peak_memory_mb(run_lists, body)
+    print(json.dumps({"mode": mode, "peak_mb": peak}))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare peak memory of list-of-floats and float32 embedding paths"
+    )
+    parser.add_argument(
+        "--chunks",
+        type=int,
+        default=5000,
+        help="Chunks in the simulated document (a large PDF yields thousands)",
+    )
+    parser.add_argument("--dimensions", type=int, default=EMBEDDING_DIMENSIONS)
+    parser.add_argument("--mode", choices=["lists", "float32"], help=argparse.SUPPRESS)
+    parser.add_argument("--body", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        measure(args.mode, args.body, args.dimensions)
+        sys.exit(0)
+
+    print(f"Simulated document: {args.chunks} chunks x {args.dimensions} dimensions")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ("lists", "float32"):
+            # The response body is built here and measured in a fresh interpreter,
+            # so neither building it nor the other mode affects the peak
+            body_path = os.path.join(tmp, f"{mode}.json")
+            encoding = "base64" if mode == "float32" else "float"
+            with open(body_path, "w") as f:
+                f.write(fake_response(args.chunks, args.dimensions, encoding))
+
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    "-m",
+                    "src.scripts.benchmark_memory",
+                    "--mode",
+                    mode,
+                    "--body",
+                    body_path,
+                    "--dimensions",
+                    str(args.dimensions),
+                ],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            results[mode] = json.loads(output.strip().splitlines()[-1])["peak_mb"]
+            print(f"{mode:<8} peak memory {results[mode]:8.1f} MB")
+    print(f"Reduction: {results['lists'] / max(results['float32'], 1e-6):.1f}x")
@@ -0,0 +1,151 @@
+import argparse
+import asyncio
+import json
+import sys
+import tempfile
+from typing import Any, Dict
+
+from src.benchmarks import ServiceProfile, run_benchmark
+from src.benchmarks.corpus import DEFAULT_MIX
+from src.benchmarks.runner import print_report
+from src.process_pool import shutdown_process_pool
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    """Parse "txt=4,pdf=2" into {"txt": 4, "pdf": 2}."""
+    mix = {}
+    for part in value.split(","):
+        extension, _, count = part.partition("=")
+        mix[extension.strip().lstrip(".")] = int(count)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the pipeline offline with local S3/SQS and fake "
+        "OpenAI/Pinecone services"
+    )
+    parser.add_argument(
+        "--mix",
+        type=parse_mix,
+        default=DEFAULT_MIX,
+        help="Files per type, e.g. txt=40,pdf=20,csv=20,xlsx=10",
+    )
+    parser.add_argument("--words-per-doc", type=int, default=3000)
+    parser.add_argument("--rows-per-table", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--mode",
+        choices=["daemon", "poll"],
+        default="daemon",
+        help="Run the long-lived SQS worker or a single poll_sqs_queue pass",
+    )
+    parser.add_argument(
+        "--workdir",
+        default=None,
+        help="Directory for the corpus and caches (defaults to a temporary one)",
+    )
+    parser.add_argument(
+        "--reuse-corpus",
+        action="store_true",
+        help="Reuse the corpus already in --workdir instead of regenerating it",
+    )
+    parser.add_argument("--embedding-latency", type=float, default=0.15)
+    parser.add_argument(
+        "--embedding-latency-per-input",
+        type=float,
+        default=0.0005,
+        help="Extra seconds per input text in an embeddings request",
+    )
+    parser.add_argument("--embedding-rpm", type=int, default=0)
+    parser.add_argument("--embedding-failure-rate", type=float, default=0.0)
+    parser.add_argument("--pinecone-latency", type=float, default=0.03)
+    parser.add_argument(
+        "--pinecone-latency-per-vector",
+        type=float,
+        default=0.0001,
+        help="Extra seconds per vector in a Pinecone request",
+    )
+    parser.add_argument("--pinecone-rpm", type=int, default=0)
+    parser.add_argument("--pinecone-failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--visibility-timeout",
+        type=int,
+        default=10,
+        help="Seconds before a failed message is redelivered",
+    )
+    parser.add_argument(
+        "--upsert-outbox",
+        action="store_true",
+        help="Spool vectors to a local outbox drained by a background flusher",
+    )
+    parser.add_argument(
+        "--near-duplicates",
+        action="store_true",
+        help="Reuse embeddings of near-identical chunks (NEAR_DUPLICATE_THRESHOLD)",
+    )
+    parser.add_argument(
+        "--chunk-store",
+        action="store_true",
+        help="Keep chunk text in a local compressed store instead of metadata",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=600.0,
+        help="Seconds before the daemon run stops and reports the messages left "
+        "as failed",
+    )
+    parser.add_argument("--json", default=None, help="Also write results to this file")
+    args = parser.parse_args()
+
+    embeddings = ServiceProfile(
+        latency=args.embedding_latency,
+        per_item_latency=args.embedding_latency_per_input,
+        requests_per_minute=args.embedding_rpm,
+        failure_rate=args.embedding_failure_rate,
+        seed=args.seed,
+    )
+    pinecone = ServiceProfile(
+        latency=args.pinecone_latency,
+        per_item_latency=args.pinecone_latency_per_vector,
+        requests_per_minute=args.pinecone_rpm,
+        failure_rate=args.pinecone_failure_rate,
+        seed=args.seed + 1,
+    )
+
+    def run(workdir: str) -> Dict[str, Any]:
+        return asyncio.run(
+            run_benchmark(
+                workdir,
+                mix=args.mix,
+                words_per_doc=args.words_per_doc,
+                rows_per_table=args.rows_per_table,
+                seed=args.seed,
+                mode=args.mode,
+                embeddings=embeddings,
+                pinecone=pinecone,
+                visibility_timeout=args.visibility_timeout,
+                reuse_corpus=args.reuse_corpus,
+                upsert_outbox=args.upsert_outbox,
+                near_duplicates=args.near_duplicates,
+                chunk_store=args.chunk_store,
+                timeout=args.timeout,
+            )
+        )
+
+    try:
+        if args.workdir:
+            result = run(args.workdir)
+        else:
+            with tempfile.TemporaryDirectory() as workdir:
+                result = run(workdir)
+    finally:
+        shutdown_process_pool()
+
+    print_report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if result["failed_messages"]:
+        sys.exit(1)
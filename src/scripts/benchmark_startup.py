@@ -0,0 +1,81 @@
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+from typing import List, Tuple
+
+IMPORT_SNIPPET = "import src"
+PREWARM_SNIPPET = "import src; src.prewarm(clients=False)"
+
+
+def time_snippet(snippet: str, runs: int) -> List[float]:
+    """Wall-clock time of a fresh interpreter running snippet, one sample per run."""
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", snippet], check=True)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def slowest_imports(snippet: str, top: int) -> List[Tuple[int, str]]:
+    """Return the top modules by cumulative import time from python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", snippet],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line[len("import time:") :].split("|")
+        rows.append((int(cumulative), module.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def report(label: str, samples: List[float]) -> None:
+    print(
+        f"{label:<16} median {statistics.median(samples):.3f}s  "
+        f"min {min(samples):.3f}s  max {max(samples):.3f}s"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure import time and cold start of the worker"
+    )
+    parser.add_argument("--runs", type=int, default=5, help="Samples per measurement")
+    parser.add_argument(
+        "--top", type=int, default=15, help="Slowest imports to list for `import src`"
+    )
+    parser.add_argument(
+        "--prewarm",
+        action="store_true",
+        help="Also time import plus loading the spaCy model and parsers",
+    )
+    parser.add_argument(
+        "--max-import-seconds",
+        type=float,
+        default=None,
+        help="Exit non-zero when the median `import src` time exceeds this",
+    )
+    args = parser.parse_args()
+
+    import_samples = time_snippet(IMPORT_SNIPPET, args.runs)
+    report("import src", import_samples)
+    if args.prewarm:
+        report("import+prewarm", time_snippet(PREWARM_SNIPPET, args.runs))
+
+    print("\nSlowest imports (cumulative):")
+    for cumulative, module in slowest_imports(IMPORT_SNIPPET, args.top):
+        print(f"{cumulative / 1e6:8.3f}s  {module}")
+
+    median = statistics.median(import_samples)
+    if args.max_import_seconds is not None and median > args.max_import_seconds:
+        print(
+            f"\nImport time regression: {median:.3f}s > {args.max_import_seconds:.3f}s"
+        )
+        sys.exit(1)
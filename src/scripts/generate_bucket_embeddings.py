@@ -1,89 +1,386 @@
 import asyncio
-import boto3
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from dotenv import load_dotenv
 import argparse
 
-from src.utils import chunk_documents
-from src.embedding_manager import generate_and_upsert_embeddings
-from src.file_processor import download_and_process_file
+from src.clients import get_s3_client
+from src.utils import (
+    chunk_documents,
+    configure_embedding_cache,
+    configure_near_duplicate_index,
+    configure_upsert_outbox,
+    get_document_manifest,
+    get_embedding_cache,
+    get_near_duplicate_index,
+    get_upsert_outbox,
+    shutdown_upsert_outbox,
+)
+from src.embedding_manager import (
+    delete_document_embeddings,
+    record_indexed_version,
+    stream_document_embeddings,
+    sync_document_embeddings,
+)
+from src.file_processor import (
+    SKIP_UNCHANGED_OBJECTS,
+    ChunkStream,
+    download_and_process_file,
+    warn_if_skip_unchanged_inactive,
+)
+from src.metrics import METRICS_ENABLED, start_metrics_server
+from src.process_pool import run_cpu_bound, shutdown_process_pool
 
 load_dotenv()
 
-s3_client = boto3.client(
-    "s3",
-)
+DEFAULT_CONCURRENCY = 10
+CHECKPOINT_INTERVAL = 30  # seconds
+REPORT_INTERVAL = 10  # seconds
 
 
-async def download_file_from_s3(bucket_name, object_key):
-    """Download a file from S3 to a local path."""
-    try:
-        s3_client.get_object(Bucket=bucket_name, Key=object_key)
+class BackfillCheckpoint:
+    """
+    Resumable progress of a bucket backfill, saved as a JSON manifest.
+
+    S3 lists keys in lexicographic order, so progress is a single watermark:
+    every key up to and including start_after has been handled and a resumed
+    run lists from there. Keys that failed are kept so they can be retried.
+    """
+
+    def __init__(self, path: str, bucket_name: str, prefix: str) -> None:
+        self.path = path
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.start_after = ""
+        self.failed: List[str] = []
+        self.processed = 0
+        self.unchanged = 0
+        self.chunks = 0
+
+        # Keys in listing order -> whether they have finished
+        self._outstanding: "OrderedDict[str, bool]" = OrderedDict()
+
+    def load(self) -> bool:
+        """Load a previous run's progress; returns False if there is none."""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            state = json.load(f)
+        if (
+            state.get("bucket") != self.bucket_name
+            or state.get("prefix") != self.prefix
+        ):
+            raise ValueError(
+                f"Checkpoint {self.path} belongs to s3://{state.get('bucket')}/"
+                f"{state.get('prefix')}"
+            )
+        self.start_after = state.get("start_after", "")
+        self.failed = state.get("failed", [])
+        self.processed = state.get("processed", 0)
+        self.unchanged = state.get("unchanged", 0)
+        self.chunks = state.get("chunks", 0)
         return True
-    except Exception as e:
-        print(f"Error downloading {object_key}: {e}")
-        return False
 
+    def save(self) -> None:
+        """Atomically write the current progress."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        state = {
+            "bucket": self.bucket_name,
+            "prefix": self.prefix,
+            "start_after": self.start_after,
+            "failed": self.failed,
+            "processed": self.processed,
+            "unchanged": self.unchanged,
+            "chunks": self.chunks,
+            "updated_at": time.time(),
+        }
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
 
-async def process_s3_object(bucket_name, object_key):
-    """Process a single S3 object - download, extract text, create embeddings, and add to index."""
+    def started(self, object_key: str) -> None:
+        self._outstanding[object_key] = False
 
-    try:
-        success = await download_file_from_s3(bucket_name, object_key)
+    def finished(self, object_key: str, success: bool, chunks: int) -> None:
+        self._outstanding[object_key] = True
+        self.processed += 1
+        self.chunks += chunks
         if not success:
-            return False
+            self.failed.append(object_key)
+
+        # Advance the watermark past every leading key that has finished
+        while self._outstanding:
+            key, done = next(iter(self._outstanding.items()))
+            if not done:
+                break
+            self._outstanding.popitem(last=False)
+            self.start_after = key
+
 
+def default_checkpoint_path(bucket_name: str, prefix: str) -> str:
+    digest = hashlib.sha256(prefix.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(".cache", f"backfill-{bucket_name}-{digest}.json")
+
+
+async def process_s3_object(
+    bucket_name: str,
+    object_key: str,
+    etag: Optional[str] = None,
+    skip_unchanged: bool = SKIP_UNCHANGED_OBJECTS,
+) -> Tuple[bool, int]:
+    """
+    Process a single S3 object - download, extract text, create embeddings, and add to index.
+
+    etag is the object's ETag from the listing, if known. Returns a
+    (success, chunk_count) tuple.
+    """
+
+    try:
         file_info = {"bucket_name": bucket_name, "object_key": object_key}
+        if etag:
+            file_info["etag"] = etag
 
-        docs, success = await download_and_process_file(file_info)
+        docs, success = await download_and_process_file(
+            file_info, stream=True, skip_unchanged=skip_unchanged
+        )
+        chunk_count = 0
+
+        if file_info.get("unchanged"):
+            return True, 0
+
+        # An object indexed before may have changed: only re-embed changed
+        # chunks, drop those past its new end and record its chunk count
+        if isinstance(docs, ChunkStream):
+            # Large PDFs and tables are embedded and upserted while they are parsed
+            try:
+                success = await stream_document_embeddings(
+                    docs, file_info, incremental=True
+                )
+            finally:
+                await docs.aclose()
+            chunk_count = docs.chunk_count
 
-        if success and docs:
+        elif success and docs:
             # Chunk the documents
-            chunked_docs = chunk_documents(docs)
+            chunked_docs = await run_cpu_bound(chunk_documents, docs)
 
-            # Generate and upsert embeddings
-            return await generate_and_upsert_embeddings(chunked_docs, file_info)
+            success = await sync_document_embeddings(chunked_docs, file_info)
+            chunk_count = len(chunked_docs)
 
-        print(f"Successfully processed: {object_key}")
-        return True
+        elif success:
+            # Nothing to index any more (empty file), drop any old chunks
+            success = await delete_document_embeddings(file_info)
+
+        if success:
+            await record_indexed_version(file_info)
+        return success, chunk_count
 
     except Exception as e:
         print(f"Error processing {object_key}: {e}")
-        return False
+        return False, 0
+
+
+async def list_objects(
+    bucket_name: str,
+    prefix: str,
+    start_after: str,
+    queue: "asyncio.Queue[Optional[Tuple[str, Optional[str]]]]",
+    checkpoint: BackfillCheckpoint,
+    workers: int,
+    skip_unchanged: bool,
+) -> None:
+    """
+    Stream keys from the list_objects_v2 paginator into the bounded queue.
+
+    With skip_unchanged, objects whose listed ETag matches the version the
+    document manifest records as indexed are counted as done without being
+    queued, so a run over an unchanged bucket costs little more than listing.
+    """
+    loop = asyncio.get_running_loop()
+    manifest = get_document_manifest() if skip_unchanged else None
+    paginator = get_s3_client().get_paginator("list_objects_v2")
+    params = {"Bucket": bucket_name, "Prefix": prefix}
+    if start_after:
+        params["StartAfter"] = start_after
+    pages = iter(paginator.paginate(**params))
+
+    try:
+        while True:
+            # Each page is a blocking HTTP call, so fetch it off the event loop
+            page = await loop.run_in_executor(None, next, pages, None)
+            if page is None:
+                break
+            objects = page.get("Contents", [])
+            indexed: Dict[str, str] = {}
+            if manifest is not None:
+                indexed = await loop.run_in_executor(
+                    None,
+                    manifest.get_indexed_etags,
+                    bucket_name,
+                    [obj["Key"] for obj in objects],
+                )
+            for obj in objects:
+                object_key = obj["Key"]
+                # Skip folders (objects that end with '/')
+                if object_key.endswith("/"):
+                    continue
+                checkpoint.started(object_key)
+                if indexed.get(object_key) == obj.get("ETag"):
+                    checkpoint.unchanged += 1
+                    checkpoint.finished(object_key, True, 0)
+                    continue
+                await queue.put((object_key, obj.get("ETag")))
+    finally:
+        # One sentinel per worker so they all stop once the queue drains
+        for _ in range(workers):
+            await queue.put(None)
 
 
-async def process_s3_bucket(bucket_name, prefix=""):
-    """Process all objects in an S3 bucket and add embeddings to the specified index."""
+async def worker(
+    bucket_name: str,
+    queue: "asyncio.Queue[Optional[Tuple[str, Optional[str]]]]",
+    checkpoint: BackfillCheckpoint,
+    skip_unchanged: bool,
+) -> None:
+    while True:
+        item = await queue.get()
+        if item is None:
+            return
+        object_key, etag = item
+        success, chunks = await process_s3_object(
+            bucket_name, object_key, etag, skip_unchanged
+        )
+        checkpoint.finished(object_key, success, chunks)
+
+
+async def report_progress(
+    checkpoint: BackfillCheckpoint,
+    started_at: float,
+    initial_processed: int,
+    initial_chunks: int,
+) -> None:
+    """Periodically print throughput and save the checkpoint."""
+    last_save = time.monotonic()
+    while True:
+        await asyncio.sleep(REPORT_INTERVAL)
+        elapsed = time.monotonic() - started_at
+        processed = checkpoint.processed - initial_processed
+        chunks = checkpoint.chunks - initial_chunks
+        print(
+            f"Progress: {checkpoint.processed} objects ({checkpoint.unchanged} "
+            f"unchanged), {checkpoint.chunks} chunks, "
+            f"{len(checkpoint.failed)} failed | {processed / elapsed:.1f} objects/sec, "
+            f"{chunks / elapsed:.1f} chunks/sec | at {checkpoint.start_after!r}"
+        )
+        if time.monotonic() - last_save >= CHECKPOINT_INTERVAL:
+            checkpoint.save()
+            last_save = time.monotonic()
+
+
+async def process_s3_bucket(
+    bucket_name: str,
+    prefix: str = "",
+    concurrency: int = DEFAULT_CONCURRENCY,
+    checkpoint_path: Optional[str] = None,
+    resume: bool = True,
+    retry_failed: bool = False,
+    skip_unchanged: bool = SKIP_UNCHANGED_OBJECTS,
+) -> None:
+    """
+    Process all objects in an S3 bucket and add embeddings to the specified index.
+
+    Keys are streamed from the listing into a bounded queue consumed by
+    `concurrency` workers, and progress is checkpointed so an interrupted run
+    resumes after the last fully processed key. With skip_unchanged, objects
+    whose ETag matches the version already indexed are not downloaded again.
+    """
 
     print(f"Processing bucket: {bucket_name} with prefix: {prefix}")
 
-    # List all objects in the bucket with the given prefix
-    paginator = s3_client.get_paginator("list_objects_v2")
-    page_iterator = paginator.paginate(Bucket=bucket_name, Prefix=prefix)
-
-    tasks = []
-    for page in page_iterator:
-        if "Contents" not in page:
-            continue
-
-        for obj in page["Contents"]:
-            object_key = obj["Key"]
-            # Skip folders (objects that end with '/')
-            if object_key.endswith("/"):
-                continue
-
-            task = process_s3_object(bucket_name, object_key)
-            tasks.append(task)
-
-    # Process files in batches to avoid overwhelming the system
-    batch_size = 10
-    for i in range(0, len(tasks), batch_size):
-        batch = tasks[i : i + batch_size]
-        results = await asyncio.gather(*batch)
+    checkpoint = BackfillCheckpoint(
+        checkpoint_path or default_checkpoint_path(bucket_name, prefix),
+        bucket_name,
+        prefix,
+    )
+    if resume and checkpoint.load():
         print(
-            f"Processed batch {i//batch_size + 1}/{(len(tasks) + batch_size - 1)//batch_size}: {sum(results)}/{len(batch)} successful"
+            f"Resuming after {checkpoint.start_after!r} "
+            f"({checkpoint.processed} objects already processed, "
+            f"{len(checkpoint.failed)} failed)"
         )
 
-    print(f"Finished processing bucket: {bucket_name}")
+    queue: "asyncio.Queue[Optional[Tuple[str, Optional[str]]]]" = asyncio.Queue(
+        maxsize=concurrency * 2
+    )
+    started_at = time.monotonic()
+    reporter = asyncio.ensure_future(
+        report_progress(checkpoint, started_at, checkpoint.processed, checkpoint.chunks)
+    )
+
+    try:
+        if retry_failed and checkpoint.failed:
+            failed, checkpoint.failed = checkpoint.failed, []
+            print(f"Retrying {len(failed)} previously failed objects")
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def retry(object_key: str) -> None:
+                async with semaphore:
+                    success, chunks = await process_s3_object(
+                        bucket_name, object_key, skip_unchanged=skip_unchanged
+                    )
+                checkpoint.processed += 1
+                checkpoint.chunks += chunks
+                if not success:
+                    checkpoint.failed.append(object_key)
+
+            await asyncio.gather(*(retry(object_key) for object_key in failed))
+
+        await asyncio.gather(
+            list_objects(
+                bucket_name,
+                prefix,
+                checkpoint.start_after,
+                queue,
+                checkpoint,
+                concurrency,
+                skip_unchanged,
+            ),
+            *(
+                worker(bucket_name, queue, checkpoint, skip_unchanged)
+                for _ in range(concurrency)
+            ),
+        )
+    finally:
+        reporter.cancel()
+        checkpoint.save()
+
+    elapsed = time.monotonic() - started_at
+    print(
+        f"Finished processing bucket: {bucket_name} - {checkpoint.processed} objects "
+        f"({checkpoint.unchanged} unchanged), {checkpoint.chunks} chunks, {len(checkpoint.failed)} failed in {elapsed:.0f}s"
+    )
+    if checkpoint.failed:
+        print(
+            f"Failed objects are listed in {checkpoint.path}; rerun with --retry-failed"
+        )
+
+    cache = get_embedding_cache()
+    if cache is not None:
+        print(f"Embedding cache stats: {cache.stats()}")
+    near_index = get_near_duplicate_index()
+    if near_index is not None:
+        stats = near_index.stats()
+        print(
+            f"Near-duplicate stats: {stats['hits']} of {stats['lookups']} uncached "
+            f"chunks reused a similar chunk's embedding, {stats['entries']} indexed"
+        )
 
 
 if __name__ == "__main__":
@@ -94,7 +391,92 @@ if __name__ == "__main__":
     parser.add_argument(
         "--prefix", default="", help="Optional prefix to filter objects in the bucket"
     )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help="Number of objects processed at the same time",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        default=None,
+        help="Checkpoint manifest path (defaults to .cache/backfill-<bucket>-<prefix hash>.json)",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Ignore any existing checkpoint and start from the beginning",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Reprocess objects that failed in a previous run before resuming",
+    )
+    parser.add_argument(
+        "--reindex-unchanged",
+        action="store_true",
+        help="Download and re-index objects even if their ETag matches the "
+        "version already indexed",
+    )
+    parser.add_argument(
+        "--embedding-cache",
+        default=None,
+        help="Embedding cache file to share with the SQS worker "
+        "(defaults to EMBEDDING_CACHE_PATH)",
+    )
+    parser.add_argument(
+        "--no-embedding-cache",
+        action="store_true",
+        help="Always call OpenAI instead of reusing cached embeddings",
+    )
+    parser.add_argument(
+        "--near-duplicate-threshold",
+        type=float,
+        default=None,
+        help="Reuse the embedding of a chunk whose SimHash shares at least this "
+        "share of bits, e.g. 0.95 (enables NEAR_DUPLICATE_ENABLED)",
+    )
+    parser.add_argument(
+        "--upsert-outbox",
+        default=None,
+        help="Spool vectors to this outbox file and upsert them in the background "
+        "(defaults to UPSERT_OUTBOX_PATH when UPSERT_OUTBOX_ENABLED is set)",
+    )
 
     args = parser.parse_args()
 
-    asyncio.run(process_s3_bucket(args.bucket, args.prefix))
+    if args.no_embedding_cache:
+        configure_embedding_cache(enabled=False)
+    elif args.embedding_cache:
+        configure_embedding_cache(path=args.embedding_cache)
+
+    if args.near_duplicate_threshold is not None:
+        configure_near_duplicate_index(threshold=args.near_duplicate_threshold)
+
+    if args.upsert_outbox:
+        configure_upsert_outbox(path=args.upsert_outbox)
+    else:
+        get_upsert_outbox()
+
+    skip_unchanged = SKIP_UNCHANGED_OBJECTS and not args.reindex_unchanged
+    warn_if_skip_unchanged_inactive(skip_unchanged)
+
+    if METRICS_ENABLED:
+        start_metrics_server()
+
+    try:
+        asyncio.run(
+            process_s3_bucket(
+                args.bucket,
+                args.prefix,
+                concurrency=args.concurrency,
+                checkpoint_path=args.checkpoint,
+                resume=not args.no_resume,
+                retry_failed=args.retry_failed,
+                skip_unchanged=skip_unchanged,
+            )
+        )
+    finally:
+        shutdown_process_pool()
+        # Unsent vectors are kept and replayed by the next run
+        shutdown_upsert_outbox()
@@ -0,0 +1,15 @@
+import os
+
+# SQS accepts at most 10 messages per receive and 10 entries per batch call
+SQS_BATCH_LIMIT = 10
+
+SQS_WAIT_TIME_SECONDS = int(os.getenv("SQS_WAIT_TIME_SECONDS", "10"))
+SQS_VISIBILITY_TIMEOUT = int(os.getenv("SQS_VISIBILITY_TIMEOUT", "300"))
+SQS_HEARTBEAT_INTERVAL = int(os.getenv("SQS_HEARTBEAT_INTERVAL", "60"))
+SQS_MAX_IN_FLIGHT_MESSAGES = int(os.getenv("SQS_MAX_IN_FLIGHT_MESSAGES", "20"))
+SQS_ACK_FLUSH_INTERVAL = float(os.getenv("SQS_ACK_FLUSH_INTERVAL", "1.0"))
+
+# Seconds received messages are held so later events for the same object can
+# be coalesced with them. Off (0) by default so receive latency is unchanged:
+# every batch is dispatched immediately and coalesced only within itself
+SQS_COALESCE_WINDOW = float(os.getenv("SQS_COALESCE_WINDOW_SECONDS", "0"))
@@ -0,0 +1,289 @@
+import asyncio
+import functools
+import signal
+import time
+from typing import Any, Dict, List, Optional
+from .clients import get_sqs_client
+from .metrics import set_gauge, stage
+from .message_processor import (
+    ProcessFileCallback,
+    get_coalescing_stats,
+    process_messages,
+)
+from .sqs_settings import (
+    SQS_ACK_FLUSH_INTERVAL,
+    SQS_BATCH_LIMIT,
+    SQS_COALESCE_WINDOW,
+    SQS_HEARTBEAT_INTERVAL,
+    SQS_MAX_IN_FLIGHT_MESSAGES,
+    SQS_VISIBILITY_TIMEOUT,
+    SQS_WAIT_TIME_SECONDS,
+)
+
+
+class SQSWorker:
+    """
+    Long-running SQS consumer.
+
+    The worker keeps receiving the next batch while earlier batches are still
+    being processed (bounded by max_in_flight), acknowledges finished messages
+    with delete_message_batch, and periodically extends the visibility timeout
+    of everything still in flight so long-running files are not redelivered.
+    With a coalesce window, receive batches are collected for up to that long
+    (or until no more can be received) and dispatched together, so repeated
+    events for one object are processed once.
+    On SIGTERM/SIGINT it stops receiving, drains in-flight work and exits.
+    """
+
+    def __init__(
+        self,
+        queue_url: str,
+        process_file_callback: ProcessFileCallback,
+        max_in_flight: int = SQS_MAX_IN_FLIGHT_MESSAGES,
+        visibility_timeout: int = SQS_VISIBILITY_TIMEOUT,
+        heartbeat_interval: float = SQS_HEARTBEAT_INTERVAL,
+        wait_time_seconds: int = SQS_WAIT_TIME_SECONDS,
+        coalesce_window: float = SQS_COALESCE_WINDOW,
+    ) -> None:
+        self.queue_url = queue_url
+        self.process_file_callback = process_file_callback
+        self.max_in_flight = max(SQS_BATCH_LIMIT, max_in_flight)
+        self.visibility_timeout = visibility_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.wait_time_seconds = wait_time_seconds
+        self.coalesce_window = coalesce_window
+
+        # Receipt handles of messages received but not yet finished
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._pending_acks: List[str] = []
+        # Created by run() so they belong to its event loop
+        self._capacity: asyncio.Condition
+        self._stopping: asyncio.Event
+        self._batches: set = set()
+        # Messages held for the coalesce window, and the timer that dispatches them
+        self._window: List[Dict[str, Any]] = []
+        self._window_timer: Optional[asyncio.Future] = None
+
+        self.received = 0
+        self.succeeded = 0
+        self.failed = 0
+
+    async def _call(self, method: str, **kwargs: Any) -> Dict[str, Any]:
+        """Run a blocking SQS client call without blocking the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(getattr(get_sqs_client(), method), **kwargs)
+        )
+
+    def stop(self) -> None:
+        """Stop receiving new messages; in-flight work is drained."""
+        if not self._stopping.is_set():
+            print("Shutdown requested, draining in-flight messages...")
+            self._stopping.set()
+            asyncio.ensure_future(self._notify_capacity())
+
+    async def run(self) -> None:
+        """Receive and process messages until stop() is called."""
+        loop = asyncio.get_running_loop()
+        self._capacity = asyncio.Condition()
+        self._stopping = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):
+                # Signal handlers are unavailable on some platforms/threads
+                pass
+
+        print(f"Starting SQS worker (max {self.max_in_flight} messages in flight)")
+        started = time.monotonic()
+        heartbeat = asyncio.ensure_future(self._heartbeat_loop())
+        acker = asyncio.ensure_future(self._ack_loop())
+
+        try:
+            await self._receive_loop()
+        finally:
+            self._dispatch_window()
+            if self._batches:
+                await asyncio.gather(*self._batches, return_exceptions=True)
+            heartbeat.cancel()
+            acker.cancel()
+            await asyncio.gather(heartbeat, acker, return_exceptions=True)
+            await self._flush_acks()
+            for sig in (signal.SIGTERM, signal.SIGINT):
+                try:
+                    loop.remove_signal_handler(sig)
+                except (NotImplementedError, RuntimeError):
+                    pass
+
+        stats = get_coalescing_stats()
+        print(
+            f"SQS worker stopped after {time.monotonic() - started:.0f}s: "
+            f"{self.received} received, {self.succeeded} succeeded, "
+            f"{self.failed} failed, {stats['superseded']} of {stats['events']} "
+            f"events coalesced away"
+        )
+
+    async def _receive_loop(self) -> None:
+        while not self._stopping.is_set():
+            # Only prefetch another batch when there is room for it
+            async with self._capacity:
+                await self._capacity.wait_for(
+                    lambda: self._stopping.is_set()
+                    or len(self._in_flight) + SQS_BATCH_LIMIT <= self.max_in_flight
+                )
+            if self._stopping.is_set():
+                break
+
+            try:
+                with stage("receive") as record:
+                    response = await self._call(
+                        "receive_message",
+                        QueueUrl=self.queue_url,
+                        MaxNumberOfMessages=SQS_BATCH_LIMIT,
+                        WaitTimeSeconds=self.wait_time_seconds,
+                        VisibilityTimeout=self.visibility_timeout,
+                    )
+                    record.items = len(response.get("Messages", []))
+            except Exception as e:
+                print(f"Error receiving messages: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            messages = response.get("Messages", [])
+            if not messages:
+                continue
+
+            if self._stopping.is_set():
+                # Received after shutdown began; hand them straight back
+                await self._release(messages)
+                break
+
+            print(f"Received {len(messages)} messages from SQS")
+            self.received += len(messages)
+            for message in messages:
+                self._in_flight[message["ReceiptHandle"]] = message
+            set_gauge("messages_in_flight", len(self._in_flight))
+
+            if self.coalesce_window <= 0:
+                self._start_batch(messages)
+                continue
+
+            self._window.extend(messages)
+            if len(self._in_flight) + SQS_BATCH_LIMIT > self.max_in_flight:
+                # Nothing more can be received, so waiting longer gains nothing
+                self._dispatch_window()
+            elif self._window_timer is None:
+                self._window_timer = asyncio.ensure_future(self._window_elapsed())
+
+    async def _window_elapsed(self) -> None:
+        await asyncio.sleep(self.coalesce_window)
+        self._window_timer = None
+        self._dispatch_window()
+
+    def _dispatch_window(self) -> None:
+        """Process the messages collected in the coalesce window as one batch."""
+        if self._window_timer is not None:
+            self._window_timer.cancel()
+            self._window_timer = None
+        if self._window:
+            messages, self._window = self._window, []
+            self._start_batch(messages)
+
+    def _start_batch(self, messages: List[Dict[str, Any]]) -> None:
+        task = asyncio.ensure_future(self._process_batch(messages))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _process_batch(self, messages: List[Dict[str, Any]]) -> None:
+        def on_result(index: int, success: bool) -> None:
+            receipt_handle = messages[index]["ReceiptHandle"]
+            if success:
+                self.succeeded += 1
+                self._pending_acks.append(receipt_handle)
+            else:
+                # Left unacknowledged so SQS redelivers it after the timeout
+                self.failed += 1
+                self._finish(receipt_handle)
+
+        try:
+            await process_messages(
+                messages, self.process_file_callback, on_result=on_result
+            )
+        except Exception as e:
+            print(f"Error processing batch: {e}")
+            for message in messages:
+                self._finish(message["ReceiptHandle"])
+
+    def _finish(self, receipt_handle: str) -> None:
+        """Stop tracking a message and wake the receiver if it was waiting for room."""
+        if self._in_flight.pop(receipt_handle, None) is not None:
+            set_gauge("messages_in_flight", len(self._in_flight))
+            asyncio.ensure_future(self._notify_capacity())
+
+    async def _notify_capacity(self) -> None:
+        async with self._capacity:
+            self._capacity.notify_all()
+
+    async def _ack_loop(self) -> None:
+        while True:
+            await asyncio.sleep(SQS_ACK_FLUSH_INTERVAL)
+            await self._flush_acks()
+
+    async def _flush_acks(self) -> None:
+        """Delete acknowledged messages in batches of up to 10."""
+        while self._pending_acks:
+            handles = self._pending_acks[:SQS_BATCH_LIMIT]
+            del self._pending_acks[:SQS_BATCH_LIMIT]
+            entries = [
+                {"Id": str(i), "ReceiptHandle": handle}
+                for i, handle in enumerate(handles)
+            ]
+            try:
+                with stage("ack") as record:
+                    record.items = len(entries)
+                    response = await self._call(
+                        "delete_message_batch", QueueUrl=self.queue_url, Entries=entries
+                    )
+                    for failure in response.get("Failed", []):
+                        print(f"Failed to delete message: {failure}")
+                        record.fail(failure.get("Code", "DeleteFailed"))
+            except Exception as e:
+                print(f"Error deleting {len(entries)} messages: {e}")
+            finally:
+                for handle in handles:
+                    self._finish(handle)
+
+    async def _heartbeat_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            acked = set(self._pending_acks)
+            handles = [handle for handle in self._in_flight if handle not in acked]
+            await self._change_visibility(handles, self.visibility_timeout)
+
+    async def _release(self, messages: List[Dict[str, Any]]) -> None:
+        """Make messages visible again immediately for another consumer."""
+        await self._change_visibility([m["ReceiptHandle"] for m in messages], 0)
+
+    async def _change_visibility(self, handles: List[str], timeout: int) -> None:
+        for i in range(0, len(handles), SQS_BATCH_LIMIT):
+            entries = [
+                {"Id": str(j), "ReceiptHandle": handle, "VisibilityTimeout": timeout}
+                for j, handle in enumerate(handles[i : i + SQS_BATCH_LIMIT])
+            ]
+            try:
+                response = await self._call(
+                    "change_message_visibility_batch",
+                    QueueUrl=self.queue_url,
+                    Entries=entries,
+                )
+                for failure in response.get("Failed", []):
+                    print(f"Failed to change message visibility: {failure}")
+            except Exception as e:
+                print(f"Error changing visibility of {len(entries)} messages: {e}")
+
+
+async def run_sqs_worker(
+    queue_url: str, process_file_callback: ProcessFileCallback
+) -> None:
+    """Run a long-lived SQS worker until SIGTERM/SIGINT."""
+    await SQSWorker(queue_url, process_file_callback).run()
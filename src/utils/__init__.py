@@ -1,13 +1,76 @@
-from .document_processor import chunk_documents
+from .document_processor import chunk_documents, iter_chunks
+from .chunk_store import (
+    LocalChunkStore,
+    S3ChunkStore,
+    configure_chunk_store,
+    fetch_chunk_texts,
+    get_chunk_store,
+)
+from .document_manifest import (
+    DocumentManifest,
+    chunk_vector_ids,
+    configure_document_manifest,
+    get_document_manifest,
+)
+from .embedding_cache import (
+    EmbeddingCache,
+    configure_embedding_cache,
+    get_embedding_cache,
+)
+from .embedding_scheduler import (
+    EmbeddingResult,
+    EmbeddingScheduler,
+    get_embedding_scheduler,
+)
+from .near_duplicates import (
+    NearDuplicateIndex,
+    configure_near_duplicate_index,
+    get_near_duplicate_index,
+)
+from .upsert_outbox import (
+    UpsertOutbox,
+    configure_upsert_outbox,
+    get_upsert_outbox,
+    shutdown_upsert_outbox,
+)
 from .embeddings import (
     generate_document_embeddings,
     upsert_embeddings,
+    upsert_embeddings_batch,
     delete_embeddings,
+    list_embedding_ids,
+    fetch_embedding_metadata,
 )
 
 __all__ = [
     "chunk_documents",
+    "iter_chunks",
+    "LocalChunkStore",
+    "S3ChunkStore",
+    "configure_chunk_store",
+    "fetch_chunk_texts",
+    "get_chunk_store",
+    "DocumentManifest",
+    "chunk_vector_ids",
+    "configure_document_manifest",
+    "get_document_manifest",
+    "EmbeddingCache",
+    "configure_embedding_cache",
+    "get_embedding_cache",
+    "EmbeddingResult",
+    "EmbeddingScheduler",
+    "get_embedding_scheduler",
+    "NearDuplicateIndex",
+    "configure_near_duplicate_index",
+    "get_near_duplicate_index",
+    "UpsertOutbox",
+    "configure_upsert_outbox",
+    "get_upsert_outbox",
+    "shutdown_upsert_outbox",
     "generate_document_embeddings",
     "upsert_embeddings",
+    "upsert_embeddings_batch",
     "delete_embeddings",
+    "list_embedding_ids",
+    "fetch_embedding_metadata",
 ]
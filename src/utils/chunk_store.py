@@ -0,0 +1,330 @@
+import json
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+import botocore.exceptions
+from dotenv import load_dotenv
+from src.clients import get_s3_client
+from src.metrics import stage
+from .embeddings import fetch_embedding_metadata
+from .sqlite_store import SQLiteStore, sql_batches
+
+load_dotenv()
+
+DEFAULT_STORE_PATH = ".cache/chunks.sqlite3"
+DEFAULT_S3_PREFIX = "chunks/"
+
+# zlib level used for stored chunk text
+COMPRESSION_LEVEL = 6
+
+# S3 requests made at the same time by one S3ChunkStore call
+S3_CONCURRENCY = int(os.getenv("CHUNK_STORE_S3_CONCURRENCY", "16"))
+
+# Consecutive chunks of an object stored together in one S3 object
+S3_PACK_SIZE = int(os.getenv("CHUNK_STORE_S3_PACK_SIZE", "128"))
+
+# Vector IDs are "{object_key}-chunk-{index}"
+_VECTOR_ID_RE = re.compile(r"(.*)-chunk-(\d+)", re.DOTALL)
+
+# S3 deletes at most 1000 keys per request
+_S3_DELETE_BATCH = 1000
+
+
+def _compress(text: str) -> bytes:
+    return zlib.compress(text.encode("utf-8"), COMPRESSION_LEVEL)
+
+
+def _decompress(blob: bytes) -> str:
+    return zlib.decompress(blob).decode("utf-8")
+
+
+class LocalChunkStore(SQLiteStore):
+    """
+    Chunk text keyed by vector ID, zlib-compressed in a local SQLite file.
+
+    The file is node-local: when workers run on several hosts, each host only
+    sees the text it wrote, so use the s3 store there.
+    """
+
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        super().__init__(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id TEXT PRIMARY KEY, object_key TEXT NOT NULL, text BLOB NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_object ON chunks (object_key)"
+        )
+        self._conn.commit()
+
+    def put_many(self, object_key: str, texts: Dict[str, str]) -> None:
+        """
+        Store the text of an object's chunks by vector ID.
+
+        Raises sqlite3.Error if they could not be written.
+        """
+        with stage("chunk_store", op="put", backend="local") as record:
+            rows = [(vid, object_key, _compress(text)) for vid, text in texts.items()]
+            record.items = len(rows)
+            record.bytes = sum(len(blob) for _, _, blob in rows)
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (id, object_key, text) "
+                    "VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._conn.commit()
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Return the stored text of each vector ID that has one."""
+        ids = list(dict.fromkeys(ids))
+        found = {}
+        with stage("chunk_store", op="get", backend="local") as record:
+            with self._lock:
+                for batch, placeholders in sql_batches(ids):
+                    rows = self._conn.execute(
+                        f"SELECT id, text FROM chunks WHERE id IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for vector_id, blob in rows:
+                        found[vector_id] = _decompress(blob)
+            record.items = len(found)
+        return found
+
+    def delete_ids(self, ids: Iterable[str]) -> None:
+        ids = list(ids)
+        with self._lock:
+            for batch, placeholders in sql_batches(ids):
+                self._conn.execute(
+                    f"DELETE FROM chunks WHERE id IN ({placeholders})", batch
+                )
+            self._conn.commit()
+
+    def delete_object(self, object_key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks WHERE object_key = ?", (object_key,))
+            self._conn.commit()
+
+
+class S3ChunkStore:
+    """
+    Chunk text keyed by vector ID, packed into zlib-compressed S3 objects.
+
+    An object's chunks are stored in packs of S3_PACK_SIZE consecutive chunk
+    indices, pack n at "{prefix}{object_key}-chunks-{n}" holding a JSON map
+    of vector ID to text. A batch of chunks is one request per pack it
+    touches rather than one per chunk, and a streamed document's batches
+    each fill one or two packs. Writes and deletes read and rewrite the
+    packs they touch, so they rely on one document being indexed by one
+    worker at a time, as the SQS worker's per-key ordering ensures. Packs
+    are read, written and deleted with up to S3_CONCURRENCY requests at a
+    time.
+    """
+
+    def __init__(self, bucket: str, prefix: str = DEFAULT_S3_PREFIX):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, S3_CONCURRENCY), thread_name_prefix="chunk-store"
+        )
+
+    def _pack_key(self, object_key: str, pack: int) -> str:
+        return f"{self.prefix}{object_key}-chunks-{pack}"
+
+    def _by_pack(self, ids: Iterable[str]) -> Dict[str, List[str]]:
+        """Group vector IDs by the key of the pack that holds them."""
+        packs: Dict[str, List[str]] = {}
+        for vector_id in ids:
+            match = _VECTOR_ID_RE.fullmatch(vector_id)
+            if match is None:
+                continue
+            key = self._pack_key(match[1], int(match[2]) // S3_PACK_SIZE)
+            packs.setdefault(key, []).append(vector_id)
+        return packs
+
+    def _read_pack(self, key: str) -> Dict[str, str]:
+        try:
+            response = get_s3_client().get_object(Bucket=self.bucket, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return {}
+            raise
+        body = response["Body"]
+        try:
+            texts: Dict[str, str] = json.loads(_decompress(body.read()))
+        finally:
+            body.close()
+        return texts
+
+    def _write_pack(self, key: str, texts: Dict[str, str]) -> int:
+        if not texts:
+            get_s3_client().delete_object(Bucket=self.bucket, Key=key)
+            return 0
+        blob = _compress(json.dumps(texts))
+        get_s3_client().put_object(Bucket=self.bucket, Key=key, Body=blob)
+        return len(blob)
+
+    def _run(
+        self,
+        fn: Callable[[str, List[str]], Any],
+        items: Iterable[Tuple[str, List[str]]],
+    ) -> list:
+        # Raise the first error only once every request has finished
+        futures = [self._executor.submit(fn, *item) for item in items]
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def put_many(self, object_key: str, texts: Dict[str, str]) -> None:
+        """
+        Store the text of an object's chunks by vector ID.
+
+        Raises the first S3 error once every write has finished.
+        """
+
+        def _put(key: str, ids: List[str]) -> int:
+            pack = self._read_pack(key)
+            pack.update((vector_id, texts[vector_id]) for vector_id in ids)
+            return self._write_pack(key, pack)
+
+        with stage("chunk_store", op="put", backend="s3") as record:
+            sizes = self._run(_put, self._by_pack(texts).items())
+            record.items = len(texts)
+            record.bytes = sum(sizes)
+
+    def get_many(self, ids: Iterable[str]) -> Dict[str, str]:
+        """Return the stored text of each vector ID that has one."""
+
+        def _get(key: str, ids: List[str]) -> Dict[str, str]:
+            pack = self._read_pack(key)
+            return {
+                vector_id: pack[vector_id] for vector_id in ids if vector_id in pack
+            }
+
+        found: Dict[str, str] = {}
+        with stage("chunk_store", op="get", backend="s3") as record:
+            packs = self._by_pack(dict.fromkeys(ids))
+            for texts in self._run(_get, packs.items()):
+                found.update(texts)
+            record.items = len(found)
+        return found
+
+    def delete_ids(self, ids: Iterable[str]) -> None:
+        def _delete(key: str, ids: List[str]) -> None:
+            pack = self._read_pack(key)
+            if pack:
+                for vector_id in ids:
+                    pack.pop(vector_id, None)
+                self._write_pack(key, pack)
+
+        self._run(_delete, self._by_pack(dict.fromkeys(ids)).items())
+
+    def delete_object(self, object_key: str) -> None:
+        # The listing prefix also matches other objects whose key starts with
+        # this one's (e.g. "a.txt-chunks-1.txt"), so keep exact pack keys only
+        prefix = f"{self.prefix}{object_key}-chunks-"
+        pack_key = re.compile(re.escape(prefix) + r"\d+")
+        paginator = get_s3_client().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            keys = [
+                obj["Key"]
+                for obj in page.get("Contents", [])
+                if pack_key.fullmatch(obj["Key"])
+            ]
+            self._delete_keys(keys)
+
+    def _delete_keys(self, keys: List[str]) -> None:
+        for i in range(0, len(keys), _S3_DELETE_BATCH):
+            response = get_s3_client().delete_objects(
+                Bucket=self.bucket,
+                Delete={
+                    "Objects": [{"Key": key} for key in keys[i : i + _S3_DELETE_BATCH]],
+                    "Quiet": True,
+                },
+            )
+            for error in response.get("Errors", []):
+                print(f"Failed to delete chunk text {error.get('Key')}: {error}")
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+
+ChunkStore = Union[LocalChunkStore, S3ChunkStore]
+
+_store: Optional[ChunkStore] = None
+_store_configured = False
+
+
+def configure_chunk_store(
+    backend: Optional[str] = None,
+    path: Optional[str] = None,
+    bucket: Optional[str] = None,
+    prefix: Optional[str] = None,
+) -> Optional[ChunkStore]:
+    """
+    Configure where chunk text is kept instead of Pinecone metadata.
+
+    Args:
+        backend: "local", "s3", or "metadata" to keep the text in each
+            vector's metadata; defaults to CHUNK_STORE
+        path: SQLite file for the local store; defaults to CHUNK_STORE_PATH
+        bucket: Bucket for the S3 store; defaults to CHUNK_STORE_BUCKET
+        prefix: Key prefix for the S3 store; defaults to CHUNK_STORE_PREFIX
+
+    Returns:
+        The configured store, or None when text stays in metadata
+    """
+    global _store, _store_configured
+    if _store is not None:
+        _store.close()
+    _store_configured = True
+    _store = None
+
+    backend = (backend or os.environ.get("CHUNK_STORE", "metadata")).lower()
+    if backend == "local":
+        _store = LocalChunkStore(
+            path=path or os.environ.get("CHUNK_STORE_PATH", DEFAULT_STORE_PATH)
+        )
+    elif backend == "s3":
+        bucket = bucket or os.getenv("CHUNK_STORE_BUCKET")
+        if not bucket:
+            raise ValueError("CHUNK_STORE_BUCKET must be set for the s3 chunk store")
+        _store = S3ChunkStore(
+            bucket,
+            prefix=prefix or os.environ.get("CHUNK_STORE_PREFIX", DEFAULT_S3_PREFIX),
+        )
+    elif backend != "metadata":
+        raise ValueError(f"Unknown chunk store backend: {backend}")
+    return _store
+
+
+def get_chunk_store() -> Optional[ChunkStore]:
+    """Return the shared store, creating it from the environment on first use."""
+    if not _store_configured:
+        configure_chunk_store()
+    return _store
+
+
+def fetch_chunk_texts(ids: List[str]) -> Dict[str, str]:
+    """
+    Look up the text of chunks by vector ID, e.g. for query results.
+
+    Text is read from the chunk store when one is configured; chunks it
+    doesn't have, such as those indexed before it was enabled, fall back to
+    the chunk_text field of their Pinecone metadata.
+
+    Returns:
+        Dict mapping each found vector ID to its chunk text
+    """
+    store = get_chunk_store()
+    texts = store.get_many(ids) if store is not None else {}
+    missing = [vector_id for vector_id in ids if vector_id not in texts]
+    if missing:
+        for vector_id, metadata in fetch_embedding_metadata(missing).items():
+            if "chunk_text" in metadata:
+                texts[vector_id] = metadata["chunk_text"]
+    return texts
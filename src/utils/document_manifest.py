@@ -0,0 +1,174 @@
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from .sqlite_store import SQLiteStore, sql_batches
+
+load_dotenv()
+
+DEFAULT_MANIFEST_PATH = ".cache/manifest.sqlite3"
+
+
+def chunk_vector_ids(object_key: str, chunk_count: int) -> List[str]:
+    """Return the vector IDs of chunks 0..chunk_count-1 of an object."""
+    return [f"{object_key}-chunk-{idx}" for idx in range(chunk_count)]
+
+
+class DocumentManifest(SQLiteStore):
+    """
+    Local record of how many chunks each indexed object has in Pinecone.
+
+    Vector IDs are "{object_key}-chunk-{i}", so a stored chunk count gives the
+    exact set of IDs to delete without listing the index. The stored count is
+    kept an upper bound of the chunks that may exist: it is raised before new
+    chunks are written and only lowered once stale chunks have been deleted.
+    A deleted object keeps an entry with a count of 0, so a later create of
+    the same key is known to have nothing to clean up.
+
+    Separately, the ETag and size of the object version whose chunks are
+    fully indexed are recorded, so unchanged objects can be skipped before
+    they are downloaded. A version is forgotten as soon as its object is
+    re-indexed or deleted, and only recorded again once indexing succeeds.
+
+    The file is local to one host: with workers on several hosts, each would
+    miss chunks the others wrote and leave orphaned vectors behind, so it is
+    off by default and only meant for deployments where every writer shares
+    the file.
+    """
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_PATH):
+        super().__init__(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "bucket TEXT NOT NULL, object_key TEXT NOT NULL, "
+            "chunk_count INTEGER NOT NULL, updated_at REAL NOT NULL, "
+            "PRIMARY KEY (bucket, object_key))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS versions ("
+            "bucket TEXT NOT NULL, object_key TEXT NOT NULL, etag TEXT NOT NULL, "
+            "size INTEGER, indexed_at REAL NOT NULL, "
+            "PRIMARY KEY (bucket, object_key))"
+        )
+        self._conn.commit()
+
+    def get_chunk_count(self, bucket: str, object_key: str) -> Optional[int]:
+        """Return the recorded chunk count, or None if the object is unknown."""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT chunk_count FROM documents "
+                    "WHERE bucket = ? AND object_key = ?",
+                    (bucket, object_key),
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading document manifest {self.path}: {e}")
+            return None
+        return None if row is None else row[0]
+
+    def set_chunk_count(self, bucket: str, object_key: str, chunk_count: int) -> None:
+        """Record the exact number of chunks an object has in the index."""
+        self._write(
+            "INSERT INTO documents (bucket, object_key, chunk_count, updated_at) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (bucket, object_key) DO UPDATE SET "
+            "chunk_count = excluded.chunk_count, updated_at = excluded.updated_at",
+            (bucket, object_key, chunk_count, time.time()),
+        )
+
+    def raise_chunk_count(self, bucket: str, object_key: str, chunk_count: int) -> None:
+        """Record that an object may have up to chunk_count chunks."""
+        self._write(
+            "INSERT INTO documents (bucket, object_key, chunk_count, updated_at) "
+            "VALUES (?, ?, ?, ?) ON CONFLICT (bucket, object_key) DO UPDATE SET "
+            "chunk_count = max(chunk_count, excluded.chunk_count), "
+            "updated_at = excluded.updated_at",
+            (bucket, object_key, chunk_count, time.time()),
+        )
+
+    def get_indexed_etags(
+        self, bucket: str, object_keys: Iterable[str]
+    ) -> Dict[str, str]:
+        """Return the ETag of the indexed version of each known object, by key."""
+        object_keys = list(object_keys)
+        found: Dict[str, str] = {}
+        try:
+            with self._lock:
+                for batch, placeholders in sql_batches(object_keys):
+                    rows = self._conn.execute(
+                        "SELECT object_key, etag FROM versions "
+                        f"WHERE bucket = ? AND object_key IN ({placeholders})",
+                        [bucket, *batch],
+                    ).fetchall()
+                    found.update(rows)
+        except sqlite3.Error as e:
+            print(f"Error reading document manifest {self.path}: {e}")
+        return found
+
+    def get_indexed_etag(self, bucket: str, object_key: str) -> Optional[str]:
+        """Return the ETag of the object's indexed version, or None if unknown."""
+        return self.get_indexed_etags(bucket, [object_key]).get(object_key)
+
+    def record_indexed(
+        self, bucket: str, object_key: str, etag: str, size: Optional[int] = None
+    ) -> None:
+        """Record that the object version with this ETag is fully indexed."""
+        self._write(
+            "INSERT OR REPLACE INTO versions "
+            "(bucket, object_key, etag, size, indexed_at) VALUES (?, ?, ?, ?, ?)",
+            (bucket, object_key, etag, size, time.time()),
+        )
+
+    def forget_indexed(self, bucket: str, object_key: str) -> None:
+        """Forget the indexed version before the object's chunks change."""
+        self._write(
+            "DELETE FROM versions WHERE bucket = ? AND object_key = ?",
+            (bucket, object_key),
+        )
+
+    def _write(self, sql: str, params: tuple) -> None:
+        try:
+            with self._lock:
+                self._conn.execute(sql, params)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing document manifest {self.path}: {e}")
+
+
+_manifest: Optional[DocumentManifest] = None
+_manifest_configured = False
+
+
+def configure_document_manifest(
+    path: Optional[str] = None, enabled: bool = True
+) -> Optional[DocumentManifest]:
+    """
+    Configure the process-wide document manifest.
+
+    Args:
+        path: SQLite file to use; defaults to DOCUMENT_MANIFEST_PATH
+        enabled: Set to False to always fall back to listing the index
+
+    Returns:
+        The configured manifest, or None when it is disabled
+    """
+    global _manifest, _manifest_configured
+    if _manifest is not None:
+        _manifest.close()
+    _manifest_configured = True
+    _manifest = None
+    if not enabled:
+        return None
+
+    _manifest = DocumentManifest(
+        path=path or os.environ.get("DOCUMENT_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+    )
+    return _manifest
+
+
+def get_document_manifest() -> Optional[DocumentManifest]:
+    """Return the shared manifest, creating it from the environment on first use."""
+    if not _manifest_configured:
+        enabled = os.getenv("DOCUMENT_MANIFEST_ENABLED", "false").lower() == "true"
+        configure_document_manifest(enabled=enabled)
+    return _manifest
@@ -1,44 +1,115 @@
-import spacy
-from langchain.schema import Document
+import itertools
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
 
-nlp = spacy.load("en_core_web_sm")
+# Number of documents tokenized per nlp.pipe batch
+CHUNK_BATCH_SIZE = int(os.getenv("CHUNK_BATCH_SIZE", "32"))
 
+# Metadata flag on Documents a loader has already sized to the chunk budget
+# (e.g. table row groups); chunk_documents passes them through unchanged
+PRECHUNKED = "prechunked"
 
-def clean_text(text):
+_nlp: Any = None
+_nlp_lock = threading.Lock()
+
+
+def get_nlp() -> Any:
+    """Load the spaCy pipeline on first use and return the shared instance."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+
+            # Chunking only needs tokens and sentence boundaries, so skip the
+            # statistical components and use the rule-based sentencizer
+            nlp = spacy.load(
+                "en_core_web_sm",
+                exclude=[
+                    "tok2vec",
+                    "tagger",
+                    "parser",
+                    "attribute_ruler",
+                    "lemmatizer",
+                    "ner",
+                ],
+            )
+            nlp.add_pipe("sentencizer")
+            # The tokenizer alone is cheap, so allow very long documents
+            nlp.max_length = int(os.getenv("SPACY_MAX_LENGTH", "20000000"))
+            _nlp = nlp
+        return _nlp
+
+
+def __getattr__(name: str) -> Any:
+    # Keep the old module-level nlp name working, loaded lazily
+    if name == "nlp":
+        return get_nlp()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def clean_text(text: str) -> str:
     """Clean and normalize text using spaCy."""
-    doc = nlp(text)
-    return " ".join(token.text for token in doc)
+    doc = get_nlp()(text)
+    return " ".join(token.text for token in doc if not token.is_space)
 
 
-def chunk_documents(docs, chunk_size=700, overlap_ratio=0.3):
+def _sentence_tokens(spacy_doc: Any) -> Iterator[List[str]]:
+    """Yield the non-whitespace token texts of each sentence in a parsed document."""
+    for sent in spacy_doc.sents:
+        tokens = [token.text for token in sent if not token.is_space]
+        if tokens:
+            yield tokens
+
+
+def chunk_documents(
+    docs: Iterable[Document],
+    chunk_size: int = 700,
+    overlap_ratio: float = 0.3,
+    batch_size: Optional[int] = None,
+) -> List[Document]:
     """
     Splits each Document's page_content into fixed-size token chunks using spaCy sentence segmentation.
     Applies an overlap between consecutive chunks for context preservation.
+
+    Each document is tokenized exactly once, with documents batched through
+    nlp.pipe; sentence boundaries and token counts come from that single parse.
+    Documents flagged PRECHUNKED are kept as they are and never parsed.
     """
+    docs = list(docs)
+    if all(doc.metadata.get(PRECHUNKED) for doc in docs):
+        return docs
+
+    overlap_size = int(chunk_size * overlap_ratio)
+    spacy_docs = get_nlp().pipe(
+        (doc.page_content for doc in docs if not doc.metadata.get(PRECHUNKED)),
+        batch_size=batch_size or CHUNK_BATCH_SIZE,
+    )
+
     all_chunks = []
     for doc in docs:
-        cleaned_content = clean_text(doc.page_content)
-        spacy_doc = nlp(cleaned_content)
-        sentences = [sent.text.strip() for sent in spacy_doc.sents if sent.text.strip()]
+        if doc.metadata.get(PRECHUNKED):
+            all_chunks.append(doc)
+            continue
 
+        spacy_doc = next(spacy_docs)
         chunks = []
-        current_chunk = []
+        current_chunk: List[str] = []
         current_tokens = 0
-        overlap_size = int(chunk_size * overlap_ratio)
 
-        for sent in sentences:
-            # Use spaCy tokenization for word count
-            sent_tokens = [token.text for token in nlp(sent)]
+        for sent_tokens in _sentence_tokens(spacy_doc):
             sent_len = len(sent_tokens)
 
             if current_tokens + sent_len > chunk_size and current_chunk:
                 # Finish the current chunk and apply overlap
                 chunks.append(" ".join(current_chunk))
-                current_chunk = (
-                    current_chunk[-overlap_size:]
-                    if overlap_size < len(current_chunk)
-                    else current_chunk
-                )
+                if overlap_size == 0:
+                    # Not current_chunk[-0:], which is the whole chunk and
+                    # made every chunk repeat all of the ones before it
+                    current_chunk = []
+                elif overlap_size < len(current_chunk):
+                    current_chunk = current_chunk[-overlap_size:]
                 current_tokens = len(current_chunk)
 
             current_chunk.extend(sent_tokens)
@@ -56,3 +127,77 @@ def chunk_documents(docs, chunk_size=700, overlap_ratio=0.3):
             )
             all_chunks.append(chunk_doc)
     return all_chunks
+
+
+def iter_chunks(
+    docs: Iterable[Document],
+    chunk_size: int = 700,
+    overlap_ratio: float = 0.3,
+    batch_size: Optional[int] = None,
+    carry: Optional[Dict[str, Any]] = None,
+) -> Iterator[Document]:
+    """
+    Chunk a stream of Documents as one continuous text, yielding chunks as they fill.
+
+    Unlike chunk_documents, the chunk being built and its overlap carry across
+    document boundaries, so consecutive pages of a PDF are chunked as if they
+    were one document. docs is consumed lazily, one nlp.pipe batch at a time,
+    so only the pages being tokenized and the current chunk are held in
+    memory. Each chunk copies the metadata of the document in which its new
+    (non-overlap) text starts.
+
+    To chunk a document in several calls (e.g. page ranges in separate
+    processes), pass the same carry dict to each: the unfinished last chunk
+    is left in it instead of being yielded, and the next call continues from
+    it. Yield carry_chunk(carry) after the last call.
+    """
+    overlap_size = int(chunk_size * overlap_ratio)
+    docs, texts = itertools.tee(docs)
+    spacy_docs = get_nlp().pipe(
+        (doc.page_content for doc in texts), batch_size=batch_size or CHUNK_BATCH_SIZE
+    )
+
+    current_chunk: List[str] = list(carry["tokens"]) if carry else []
+    current_tokens = len(current_chunk)
+    current_metadata: Optional[Dict[str, Any]] = (
+        carry.get("metadata") if carry else None
+    )
+    for doc, spacy_doc in zip(docs, spacy_docs):
+        for sent_tokens in _sentence_tokens(spacy_doc):
+            sent_len = len(sent_tokens)
+
+            if current_tokens + sent_len > chunk_size and current_chunk:
+                yield Document(
+                    page_content=" ".join(current_chunk),
+                    metadata=dict(current_metadata or {}),
+                )
+                if overlap_size == 0:
+                    # Not current_chunk[-0:], which is the whole chunk and
+                    # made every chunk repeat all of the ones before it
+                    current_chunk = []
+                elif overlap_size < len(current_chunk):
+                    current_chunk = current_chunk[-overlap_size:]
+                current_tokens = len(current_chunk)
+                current_metadata = None
+
+            if current_metadata is None:
+                current_metadata = doc.metadata
+            current_chunk.extend(sent_tokens)
+            current_tokens += sent_len
+
+    if carry is not None:
+        carry["tokens"] = current_chunk
+        carry["metadata"] = current_metadata
+    elif current_chunk:
+        yield Document(
+            page_content=" ".join(current_chunk), metadata=dict(current_metadata or {})
+        )
+
+
+def carry_chunk(carry: Optional[Dict[str, Any]]) -> Optional[Document]:
+    """Return the last chunk left in an iter_chunks carry, or None if it is empty."""
+    if not carry or not carry.get("tokens"):
+        return None
+    return Document(
+        page_content=" ".join(carry["tokens"]), metadata=carry["metadata"].copy()
+    )
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, Optional
+import numpy as np
+from dotenv import load_dotenv
+from .sqlite_store import SQLiteStore, sql_batches
+
+load_dotenv()
+
+DEFAULT_CACHE_PATH = ".cache/embeddings.sqlite3"
+DEFAULT_MAX_ENTRIES = 500_000  # ~3 GB at 1536 float32 dimensions
+
+
+class EmbeddingCache(SQLiteStore):
+    """
+    Persistent, content-addressed embedding cache backed by SQLite.
+
+    Entries are keyed by a hash of (model, dimensions, text) and stored as
+    float32 blobs, in a file the SQS worker and the bucket backfill script
+    can share. When the cache grows past max_entries the least recently used
+    entries are evicted.
+    """
+
+    def __init__(
+        self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Entries at the last count and rows written since; other processes
+        # sharing the file are only seen when the count is refreshed
+        self._count: Optional[int] = None
+        self._written = 0
+        self._recount_every = max(1, max_entries // 100)
+
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def key(model: str, dimensions: int, text: str) -> str:
+        """Build the cache key for a text embedded with a given model."""
+        digest = hashlib.sha256()
+        digest.update(f"{model}\0{dimensions}\0".encode("utf-8"))
+        digest.update(text.encode("utf-8"))
+        return digest.hexdigest()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Look up cached embeddings, returning only the keys that were found."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        try:
+            with self._lock:
+                for batch, placeholders in sql_batches(keys):
+                    rows = self._conn.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for key, blob in rows:
+                        found[key] = np.frombuffer(blob, dtype="<f4")
+
+                    hit_keys = [row[0] for row in rows]
+                    if hit_keys:
+                        self._conn.execute(
+                            "UPDATE embeddings SET last_used = ? WHERE key IN "
+                            f"({','.join('?' * len(hit_keys))})",
+                            [time.time(), *hit_keys],
+                        )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error reading embedding cache {self.path}: {e}")
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, np.ndarray]) -> None:
+        """Store embeddings and evict least recently used entries if needed."""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype="<f4").tobytes(), now)
+            for key, vector in items.items()
+        ]
+        try:
+            with self._lock:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) "
+                    "VALUES (?, ?, ?)",
+                    rows,
+                )
+                self._evict(len(rows))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing embedding cache {self.path}: {e}")
+
+    def _evict(self, written: int) -> None:
+        """
+        Trim the cache to 90% of max_entries once it exceeds the limit.
+
+        Entries are only counted when the last count plus the rows written
+        since could exceed the limit, and then at most once per 1% of
+        max_entries written, so the cache may overshoot by that much.
+        """
+        self._written += written
+        if self._count is not None and (
+            self._count + self._written <= self.max_entries
+            or self._written < self._recount_every
+        ):
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        self._count = count
+        self._written = 0
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+            (excess,),
+        )
+        self._count = count - excess
+        print(f"Evicted {excess} entries from embedding cache {self.path}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return hit/miss counters for this process and the current entry count."""
+        with self._lock:
+            (entries,) = self._conn.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_cache: Optional[EmbeddingCache] = None
+_cache_configured = False
+
+
+def configure_embedding_cache(
+    path: Optional[str] = None,
+    max_entries: Optional[int] = None,
+    enabled: bool = True,
+) -> Optional[EmbeddingCache]:
+    """
+    Configure the process-wide embedding cache.
+
+    Args:
+        path: SQLite file to use; defaults to EMBEDDING_CACHE_PATH
+        max_entries: Eviction threshold; defaults to EMBEDDING_CACHE_MAX_ENTRIES
+        enabled: Set to False to disable caching entirely
+
+    Returns:
+        The configured cache, or None when caching is disabled
+    """
+    global _cache, _cache_configured
+    if _cache is not None:
+        _cache.close()
+    _cache_configured = True
+    _cache = None
+    if not enabled:
+        return None
+
+    _cache = EmbeddingCache(
+        path=path or os.environ.get("EMBEDDING_CACHE_PATH", DEFAULT_CACHE_PATH),
+        max_entries=max_entries
+        or int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))),
+    )
+    return _cache
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the shared embedding cache, creating it from the environment on first use."""
+    if not _cache_configured:
+        enabled = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+        configure_embedding_cache(enabled=enabled)
+    return _cache
@@ -0,0 +1,365 @@
+import asyncio
+import base64
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, List, Optional, Set, Tuple, Union
+import numpy as np
+from dotenv import load_dotenv
+from src.adaptive_limiter import AdaptiveLimiter, get_adaptive_limiter
+from src.clients.openai_embeddings import (
+    EMBEDDING_DIMENSIONS,
+    EMBEDDING_MODEL,
+    get_openai_async_client,
+)
+from src.metrics import inc, stage
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+load_dotenv()
+
+# Hard limits of the OpenAI embeddings endpoint
+MAX_TOKENS_PER_INPUT = 8191
+MAX_INPUTS_PER_REQUEST = 2048
+MAX_TOKENS_PER_REQUEST = 300_000
+
+EMBEDDING_RPM = int(os.getenv("OPENAI_EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = int(os.getenv("OPENAI_EMBEDDING_TPM", "1000000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("OPENAI_EMBEDDING_MAX_RETRIES", "6"))
+EMBEDDING_REQUEST_INPUTS = int(os.getenv("OPENAI_EMBEDDING_REQUEST_INPUTS", "512"))
+EMBEDDING_REQUEST_TOKENS = int(os.getenv("OPENAI_EMBEDDING_REQUEST_TOKENS", "100000"))
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at rate_per_minute.
+
+    A rate of 0 disables limiting. Requests larger than the bucket are capped
+    at its capacity so they can still proceed once it is full.
+    """
+
+    def __init__(self, rate_per_minute: int):
+        self.capacity = float(rate_per_minute)
+        self.tokens = self.capacity
+        self.rate = self.capacity / 60.0
+        self.updated = time.monotonic()
+        # Lock and the event loop it belongs to; asyncio locks can't be
+        # shared across loops (e.g. successive asyncio.run calls)
+        self._lock: Optional[Tuple[asyncio.AbstractEventLoop, asyncio.Lock]] = None
+
+    def _loop_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._lock[0] is not loop:
+            self._lock = (loop, asyncio.Lock())
+        return self._lock[1]
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        if self.capacity <= 0:
+            return
+        amount = min(amount, self.capacity)
+
+        # Waiters are served in FIFO order so large requests are not starved
+        async with self._loop_lock():
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+@dataclass
+class EmbeddingResult:
+    """
+    Embeddings aligned to the input texts, with an error message per failed input.
+
+    embeddings is one contiguous float32 matrix with a row per input; rows of
+    failed inputs are left as zeros.
+    """
+
+    embeddings: np.ndarray = field(
+        default_factory=lambda: np.zeros((0, 0), dtype=np.float32)
+    )
+    errors: List[Optional[str]] = field(default_factory=list)
+
+    @property
+    def failed_indices(self) -> List[int]:
+        return [i for i, error in enumerate(self.errors) if error is not None]
+
+    def __len__(self) -> int:
+        return len(self.embeddings)
+
+
+def decode_embedding(embedding: Union[str, List[float]]) -> np.ndarray:
+    """Decode a base64 float32 embedding (or a plain list of floats) to an array."""
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype="<f4")
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def _is_retryable(error: Exception) -> bool:
+    from openai import APIConnectionError, APIStatusError, RateLimitError
+
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    return isinstance(error, APIStatusError) and error.status_code >= 500
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the server-suggested delay from a rate-limit response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _merge_windows(
+    parts: EmbeddingResult,
+    token_counts: List[int],
+    owners: List[int],
+    sent: List[int],
+    result: EmbeddingResult,
+) -> None:
+    """
+    Fill result from the embeddings of inputs that include token windows.
+
+    A text sent as windows gets their average weighted by token count,
+    scaled back to unit length like any other embedding; it fails if any of
+    its windows failed.
+    """
+    windowed = set()
+    for j in sent:
+        row = owners[j]
+        if parts.errors[j] is not None:
+            result.errors[row] = parts.errors[j]
+        if j == row:
+            result.embeddings[row] = parts.embeddings[j]
+        else:
+            result.embeddings[row] += token_counts[j] * parts.embeddings[j]
+            windowed.add(row)
+    for row in windowed:
+        norm = np.linalg.norm(result.embeddings[row])
+        if result.errors[row] is not None or not norm:
+            result.embeddings[row] = 0
+        else:
+            result.embeddings[row] /= norm
+
+
+class EmbeddingScheduler:
+    """
+    Concurrent, rate-limited client for the OpenAI embeddings endpoint.
+
+    Inputs are token-counted and packed into requests that stay under the
+    per-request input and token limits; a text over the per-input limit is
+    sent as token windows whose embeddings are averaged. Requests run
+    concurrently under RPM and TPM token buckets, as many at once as the
+    adaptive "openai" limiter allows, and are retried with jittered
+    exponential backoff on rate limits, 5xx responses and connection errors.
+    Embeddings are requested base64-encoded and decoded straight into one
+    float32 matrix whose rows follow the input order; inputs that could not
+    be embedded carry an error.
+    """
+
+    def __init__(
+        self,
+        client: "AsyncOpenAI",
+        model: str,
+        dimensions: int,
+        rpm: int = EMBEDDING_RPM,
+        tpm: int = EMBEDDING_TPM,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        max_request_inputs: int = EMBEDDING_REQUEST_INPUTS,
+        max_request_tokens: int = EMBEDDING_REQUEST_TOKENS,
+        encoding: Any = None,
+        limiter: Optional[AdaptiveLimiter] = None,
+    ) -> None:
+        self.client = client
+        self.model = model
+        self.dimensions = dimensions
+        self.max_retries = max(0, max_retries)
+        self.max_request_inputs = min(max_request_inputs, MAX_INPUTS_PER_REQUEST)
+        self.max_request_tokens = min(max_request_tokens, MAX_TOKENS_PER_REQUEST)
+        self.request_limiter = TokenBucket(rpm)
+        self.token_limiter = TokenBucket(tpm)
+        self.limiter = limiter or get_adaptive_limiter("openai")
+
+        # Any tokenizer with encode_ordinary_batch; defaults to the model's
+        self.encoding = encoding
+        if self.encoding is None:
+            import tiktoken
+
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        return [len(tokens) for tokens in self.encoding.encode_ordinary_batch(texts)]
+
+    def _pack(self, indices: List[int], token_counts: List[int]) -> List[List[int]]:
+        """Group input indices into requests that respect the per-request limits."""
+        requests = []
+        current: List[int] = []
+        current_tokens = 0
+        for i in indices:
+            if current and (
+                len(current) >= self.max_request_inputs
+                or current_tokens + token_counts[i] > self.max_request_tokens
+            ):
+                requests.append(current)
+                current = []
+                current_tokens = 0
+            current.append(i)
+            current_tokens += token_counts[i]
+        if current:
+            requests.append(current)
+        return requests
+
+    async def embed(self, texts: List[str]) -> EmbeddingResult:
+        """Embed texts, returning embeddings and errors aligned to the input order."""
+        result = EmbeddingResult(
+            embeddings=np.zeros((len(texts), self.dimensions), dtype=np.float32),
+            errors=[None] * len(texts),
+        )
+        if not texts:
+            return result
+
+        # Inputs sent to the API: the texts themselves, then token windows of
+        # texts too long to send whole, with the text each input belongs to
+        tokenized = self.encoding.encode_ordinary_batch(texts)
+        inputs: List[Union[str, List[int]]] = list(texts)
+        token_counts = [len(tokens) for tokens in tokenized]
+        owners = list(range(len(texts)))
+        send: List[int] = []
+        windows: List[int] = []
+        for i, tokens in enumerate(tokenized):
+            if not tokens:
+                result.errors[i] = "empty input"
+            elif len(tokens) <= MAX_TOKENS_PER_INPUT:
+                send.append(i)
+            else:
+                # Like the OpenAIEmbeddings client, embed consecutive windows
+                # of the tokens and average them
+                for start in range(0, len(tokens), MAX_TOKENS_PER_INPUT):
+                    window = list(tokens[start : start + MAX_TOKENS_PER_INPUT])
+                    windows.append(len(inputs))
+                    inputs.append(window)
+                    token_counts.append(len(window))
+                    owners.append(i)
+        del tokenized
+
+        parts = result
+        if len(inputs) > len(texts):
+            parts = EmbeddingResult(
+                embeddings=np.zeros((len(inputs), self.dimensions), dtype=np.float32),
+                errors=[None] * len(inputs),
+            )
+
+        # A request's inputs must be all strings or all token arrays
+        requests = self._pack(send, token_counts) + self._pack(windows, token_counts)
+        send += windows
+        received: Set[int] = set()
+        await asyncio.gather(
+            *(
+                self._embed_request(inputs, token_counts, indices, parts, received)
+                for indices in requests
+            )
+        )
+
+        for j in send:
+            if j not in received and parts.errors[j] is None:
+                parts.errors[j] = "missing from embeddings response"
+        if parts is not result:
+            _merge_windows(parts, token_counts, owners, send, result)
+        return result
+
+    async def _embed_request(
+        self,
+        inputs: List[Union[str, List[int]]],
+        token_counts: List[int],
+        indices: List[int],
+        result: EmbeddingResult,
+        received: Set[int],
+    ) -> None:
+        from openai import BadRequestError
+
+        request_tokens = sum(token_counts[i] for i in indices)
+        # All strings or all token arrays; see embed()
+        batch: Any = [inputs[i] for i in indices]
+        error: Optional[Exception] = None
+
+        for attempt in range(self.max_retries + 1):
+            await self.request_limiter.acquire(1)
+            await self.token_limiter.acquire(request_tokens)
+            try:
+                async with self.limiter.slot(size=request_tokens):
+                    with stage("embed_request") as record:
+                        record.items = len(indices)
+                        record.tokens = request_tokens
+                        response = await self.client.embeddings.create(
+                            model=self.model,
+                            dimensions=self.dimensions,
+                            input=batch,
+                            encoding_format="base64",
+                        )
+                for item in response.data:
+                    row = indices[item.index]
+                    result.embeddings[row] = decode_embedding(item.embedding)
+                    received.add(row)
+                return
+
+            except BadRequestError as e:
+                if len(indices) > 1:
+                    # Split the request to isolate the input(s) that were rejected
+                    middle = len(indices) // 2
+                    await asyncio.gather(
+                        self._embed_request(
+                            inputs, token_counts, indices[:middle], result, received
+                        ),
+                        self._embed_request(
+                            inputs, token_counts, indices[middle:], result, received
+                        ),
+                    )
+                    return
+                error = e
+
+            except Exception as e:
+                error = e
+                if _is_retryable(e) and attempt < self.max_retries:
+                    delay = _retry_after(e) or min(60.0, 2.0**attempt)
+                    delay *= random.uniform(0.5, 1.5)
+                    inc("embedding_retries_total", error=type(e).__name__)
+                    print(
+                        f"Embedding request for {len(indices)} inputs failed "
+                        f"({type(e).__name__}), retrying in {delay:.1f}s"
+                    )
+                    await asyncio.sleep(delay)
+                    continue
+
+            break
+
+        print(f"Failed to embed {len(indices)} inputs: {error}")
+        for i in indices:
+            result.errors[i] = f"{type(error).__name__}: {error}"
+
+
+_scheduler: Optional[EmbeddingScheduler] = None
+
+
+def get_embedding_scheduler() -> EmbeddingScheduler:
+    """Return the process-wide scheduler so all documents share one set of limits."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = EmbeddingScheduler(
+            get_openai_async_client(), EMBEDDING_MODEL, EMBEDDING_DIMENSIONS
+        )
+    return _scheduler
@@ -1,43 +1,184 @@
-from typing import List
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
 from dotenv import load_dotenv
-from src.clients.openai_embeddings import openai_embeddings_client
-from src.clients.pinecone_client import pinecone_index
+from src.clients.openai_embeddings import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+from src.adaptive_limiter import throttle_reason
+from src.clients.pinecone_client import (
+    call_pinecone_index,
+    submit_pinecone_task,
+    get_pinecone_index,
+)
+from src.metrics import inc, stage
+from .embedding_cache import get_embedding_cache
+from .embedding_scheduler import EmbeddingResult, get_embedding_scheduler
+from .near_duplicates import get_near_duplicate_index
 
 load_dotenv()
 
+# Pinecone rejects upsert requests larger than 2 MB or with more than 1000 vectors
+PINECONE_MAX_REQUEST_BYTES = 2 * 1024 * 1024
+PINECONE_MAX_BATCH_VECTORS = 1000
 
-async def generate_document_embeddings(texts: List[str]) -> List[List[float]]:
-    """Generate embeddings using OpenAI API."""
+# Fetch requests pass IDs in the query string, so keep them small
+FETCH_BATCH_SIZE = 100
+
+# Floats are JSON-encoded on the REST transport, roughly 20 bytes each
+_BYTES_PER_VALUE = 20
+
+UPSERT_BATCH_SIZE = int(os.getenv("PINECONE_UPSERT_BATCH_SIZE", "100"))
+UPSERT_CONCURRENCY = int(os.getenv("PINECONE_UPSERT_CONCURRENCY", "4"))
+
+# Backed-off retries of an upsert batch Pinecone rejected with a 429 or 5xx
+UPSERT_THROTTLE_RETRIES = int(os.getenv("PINECONE_THROTTLE_RETRIES", "4"))
+
+
+async def generate_document_embeddings(texts: List[str]) -> EmbeddingResult:
+    """
+    Generate embeddings using OpenAI API, reusing cached embeddings when possible.
+
+    Returns a float32 matrix with a row per text; inputs that failed have an
+    error set (and a zero row), so callers can keep the chunks that succeeded.
+    """
+    with stage("embed") as record:
+        record.chunks = len(texts)
+        result = await _generate_document_embeddings(texts)
+        if result.failed_indices:
+            # Errors read "ErrorClass: message", or describe an invalid input
+            error = result.errors[result.failed_indices[0]] or ""
+            error_class = error.split(":", 1)[0]
+            record.fail(error_class if error_class.isidentifier() else "InvalidInput")
+        return result
+
+
+async def _generate_document_embeddings(texts: List[str]) -> EmbeddingResult:
     try:
+        cache = get_embedding_cache()
+        scheduler = get_embedding_scheduler()
+        if cache is None:
+            result = await scheduler.embed(texts)
+            print(
+                f"Successfully generated {len(texts) - len(result.failed_indices)} "
+                f"of {len(texts)} embeddings"
+            )
+            return result
 
-        response = openai_embeddings_client.embed_documents(texts)
+        loop = asyncio.get_running_loop()
+        keys = [
+            cache.key(EMBEDDING_MODEL, EMBEDDING_DIMENSIONS, text) for text in texts
+        ]
+        cached = await loop.run_in_executor(None, cache.get_many, keys)
+        embeddings = np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32)
+        errors: List[Optional[str]] = [None] * len(texts)
 
-        print(f"Successfully generated {len(response)} embeddings")
-        return response
+        # Embed each distinct uncached text only once
+        missing: Dict[str, Tuple[str, List[int]]] = {}
+        for row, (key, text) in enumerate(zip(keys, texts)):
+            if key in cached:
+                embeddings[row] = cached[key]
+            else:
+                missing.setdefault(key, (text, []))[1].append(row)
+        inc(
+            "embedding_cache_hits_total",
+            len(texts) - sum(len(r) for _, r in missing.values()),
+        )
+        inc("embedding_cache_misses_total", len(missing))
+
+        # Near-identical text (boilerplate with a changed name or date) reuses
+        # the cached embedding of a chunk embedded before
+        near_duplicates = 0
+        near_index = get_near_duplicate_index()
+        model = f"{EMBEDDING_MODEL}:{EMBEDDING_DIMENSIONS}"
+        if near_index is not None and missing:
+            entries = list(missing.items())
+            matches = await loop.run_in_executor(
+                None,
+                near_index.find_many,
+                model,
+                [text for _, (text, _) in entries],
+            )
+            reused: Dict[str, np.ndarray] = {}
+            if matches:
+                reused = await loop.run_in_executor(
+                    None, cache.get_many, set(matches.values())
+                )
+            for i, match in matches.items():
+                if match in reused:
+                    key, (_, rows) = entries[i]
+                    embeddings[rows] = reused[match]
+                    del missing[key]
+                    near_duplicates += len(rows)
+            inc("embedding_near_duplicate_hits_total", near_duplicates)
+
+        failed = 0
+        if missing:
+            generated = await scheduler.embed([text for text, _ in missing.values()])
+            new_embeddings: Dict[str, np.ndarray] = {}
+            for i, (key, (_, rows)) in enumerate(missing.items()):
+                if generated.errors[i] is None:
+                    embeddings[rows] = generated.embeddings[i]
+                    new_embeddings[key] = generated.embeddings[i]
+                else:
+                    failed += 1
+                    for row in rows:
+                        errors[row] = generated.errors[i]
+            await loop.run_in_executor(None, cache.put_many, new_embeddings)
+            if near_index is not None:
+                await loop.run_in_executor(
+                    None,
+                    near_index.add_many,
+                    model,
+                    {key: missing[key][0] for key in new_embeddings},
+                )
+
+        print(
+            f"Successfully generated {len(missing) - failed} embeddings "
+            f"({len(texts) - sum(len(rows) for _, rows in missing.values())} of "
+            f"{len(texts)} served from cache, {near_duplicates} of them as near "
+            f"duplicates, {failed} failed)"
+        )
+        return EmbeddingResult(embeddings=embeddings, errors=errors)
     except Exception as e:
         print(f"Error generating embeddings: {e}")
         import traceback
 
         traceback.print_exc()
-        return []
+        return EmbeddingResult(
+            embeddings=np.zeros((len(texts), EMBEDDING_DIMENSIONS), dtype=np.float32),
+            errors=[f"{type(e).__name__}: {e}"] * len(texts),
+        )
+
 
+def to_pinecone_vector(vector: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a vector record's float32 values to the plain list Pinecone expects."""
+    values = vector["values"]
+    if isinstance(values, np.ndarray):
+        return {**vector, "values": values.tolist()}
+    return vector
 
-def upsert_embeddings(id: str, vector: list, metadata: dict):
+
+def upsert_embeddings(id: str, vector: list, metadata: dict) -> bool:
     """
     Upsert a vector embedding into Pinecone index.
 
     Args:
         id: Unique identifier for the vector
-        vector: The embedding vector
+        vector: The embedding vector (list of floats or float32 array)
         metadata: Additional metadata to store with the vector
 
     Returns:
-        None
+        bool: True if the upsert succeeded, False otherwise
     """
     try:
         # Upsert the vector to Pinecone
-        pinecone_index.upsert(
-            vectors=[{"id": id, "values": vector, "metadata": metadata}]
+        get_pinecone_index().upsert(
+            vectors=[
+                to_pinecone_vector({"id": id, "values": vector, "metadata": metadata})
+            ]
         )
 
         return True
@@ -47,36 +188,265 @@ def upsert_embeddings(id: str, vector: list, metadata: dict):
         return False
 
 
-def delete_embeddings(id_prefix: str = None, filter: dict = None):
+def _estimate_vector_bytes(vector: Dict[str, Any]) -> int:
+    """Estimate the serialized size of a single vector record."""
+    return (
+        len(vector["id"])
+        + _BYTES_PER_VALUE * len(vector["values"])
+        + len(json.dumps(vector.get("metadata", {})))
+    )
+
+
+def pack_vector_batches(
+    vectors: List[Dict[str, Any]],
+    max_vectors: int = UPSERT_BATCH_SIZE,
+    max_bytes: int = PINECONE_MAX_REQUEST_BYTES,
+) -> List[List[Dict[str, Any]]]:
+    """
+    Pack vector records into batches that respect Pinecone's request limits.
+
+    Args:
+        vectors: Records with "id", "values" and optional "metadata"
+        max_vectors: Maximum number of vectors per batch
+        max_bytes: Maximum estimated request size per batch
+
+    Returns:
+        List of batches, in input order
+    """
+    max_vectors = max(1, min(max_vectors, PINECONE_MAX_BATCH_VECTORS))
+    # Leave headroom for the request envelope
+    budget = int(max_bytes * 0.9)
+
+    batches = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+    for vector in vectors:
+        size = _estimate_vector_bytes(vector)
+        if current and (len(current) >= max_vectors or current_bytes + size > budget):
+            batches.append(current)
+            current = []
+            current_bytes = 0
+        current.append(vector)
+        current_bytes += size
+
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _throttle_delay(
+    error: BaseException, attempt: int, batch: List[Dict[str, Any]]
+) -> Optional[float]:
+    """Return how long to back off before retrying a throttled batch, or None."""
+    if not throttle_reason(error) or attempt >= UPSERT_THROTTLE_RETRIES:
+        return None
+    delay = min(30.0, 2.0**attempt) * random.uniform(0.5, 1.5)
+    print(
+        f"Upsert of {len(batch)} embeddings throttled "
+        f"({type(error).__name__}), retrying in {delay:.1f}s"
+    )
+    return delay
+
+
+async def upsert_embeddings_batch(
+    vectors: List[Dict[str, Any]],
+    max_concurrency: int = UPSERT_CONCURRENCY,
+    batch_size: int = UPSERT_BATCH_SIZE,
+) -> Dict[str, bool]:
+    """
+    Upsert many vectors into Pinecone using size-bounded, concurrent batches.
+
+    Values may be float32 arrays; they are converted to lists one batch at a
+    time, right before each request, so the full document is never expanded.
+
+    Args:
+        vectors: Records with "id", "values" and "metadata"
+        max_concurrency: Maximum number of batches in flight at once
+        batch_size: Maximum number of vectors per upsert request
+
+    Returns:
+        Dict mapping each vector ID to whether its batch was upserted
+    """
+    batches = pack_vector_batches(vectors, max_vectors=batch_size)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _upsert(batch: List[Dict[str, Any]]) -> Dict[str, bool]:
+        success = False
+        async with semaphore:
+            for attempt in range(UPSERT_THROTTLE_RETRIES + 1):
+                try:
+                    with stage("upsert") as record:
+                        record.items = len(batch)
+                        await call_pinecone_index(
+                            "upsert",
+                            vectors=[to_pinecone_vector(vector) for vector in batch],
+                        )
+                    success = True
+                    break
+                except Exception as e:
+                    delay = _throttle_delay(e, attempt, batch)
+                    if delay is not None:
+                        await asyncio.sleep(delay)
+                        continue
+                    print(
+                        f"Error upserting batch of {len(batch)} embeddings "
+                        f"starting at {batch[0]['id']}: {e}"
+                    )
+                    break
+        return {vector["id"]: success for vector in batch}
+
+    results = {}
+    for batch_result in await asyncio.gather(*(_upsert(b) for b in batches)):
+        results.update(batch_result)
+    return results
+
+
+def upsert_vectors(
+    vectors: List[Dict[str, Any]], batch_size: int = UPSERT_BATCH_SIZE
+) -> Dict[str, bool]:
     """
-    Delete embeddings from Pinecone index by ID prefix or metadata filter.
+    Blocking counterpart of upsert_embeddings_batch, for use outside the event loop.
+
+    Batches are sent in parallel on the Pinecone pool, as many at a time as
+    the adaptive limiter allows. Batches rejected with a 429 or 5xx are
+    resubmitted after a backoff, like upsert_embeddings_batch does; the wait
+    happens in the calling thread so no pool thread sleeps.
+
+    Returns:
+        Dict mapping each vector ID to whether its batch was upserted
+    """
+
+    def _upsert(batch: List[Dict[str, Any]]) -> None:
+        with stage("upsert") as record:
+            record.items = len(batch)
+            get_pinecone_index().upsert(
+                vectors=[to_pinecone_vector(vector) for vector in batch]
+            )
+
+    pending = pack_vector_batches(vectors, max_vectors=batch_size)
+    results: Dict[str, bool] = {}
+    for attempt in range(UPSERT_THROTTLE_RETRIES + 1):
+        futures = [submit_pinecone_task(_upsert, batch) for batch in pending]
+        throttled = []
+        backoff = 0.0
+        for batch, future in zip(pending, futures):
+            error = future.exception()
+            if error is not None:
+                delay = _throttle_delay(error, attempt, batch)
+                if delay is not None:
+                    throttled.append(batch)
+                    backoff = max(backoff, delay)
+                    continue
+                print(
+                    f"Error upserting batch of {len(batch)} embeddings "
+                    f"starting at {batch[0]['id']}: {error}"
+                )
+            results.update({vector["id"]: error is None for vector in batch})
+        if not throttled:
+            break
+        time.sleep(backoff)
+        pending = throttled
+    return results
+
+
+def list_embedding_ids(id_prefix: str) -> List[str]:
+    """
+    List the IDs of all vectors in the Pinecone index that start with a prefix.
+
+    Args:
+        id_prefix: Prefix of IDs to list (e.g., "document123-chunk-")
+
+    Returns:
+        List of matching vector IDs
+    """
+    ids = []
+    for page in get_pinecone_index().list(prefix=id_prefix, namespace=""):
+        ids.extend(page)
+    return ids
+
+
+def fetch_embedding_metadata(ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch the stored metadata for vectors in the Pinecone index.
+
+    Args:
+        ids: Vector IDs to fetch; IDs that do not exist are omitted from the result
+
+    Returns:
+        Dict mapping each found vector ID to its metadata
+    """
+    metadata = {}
+    for i in range(0, len(ids), FETCH_BATCH_SIZE):
+        response = get_pinecone_index().fetch(
+            ids=ids[i : i + FETCH_BATCH_SIZE], namespace=""
+        )
+        for vector_id, vector in response.vectors.items():
+            metadata[vector_id] = vector.metadata or {}
+    return metadata
+
+
+def _delete_id_batches(id_batches: Iterable[Sequence[str]], selector: str) -> None:
+    """Delete batches of IDs in parallel on the Pinecone pool."""
+    index = get_pinecone_index()
+    with stage("delete", selector=selector) as record:
+        futures = []
+        for ids in id_batches:
+            if ids:
+                record.items += len(ids)
+                futures.append(
+                    submit_pinecone_task(index.delete, ids=list(ids), namespace="")
+                )
+        # Raise the first failure only after every request has finished
+        errors = [future.exception() for future in futures]
+        for error in errors:
+            if error is not None:
+                raise error
+
+
+def delete_embeddings(
+    id_prefix: Optional[str] = None,
+    filter: Optional[dict] = None,
+    ids: Optional[List[str]] = None,
+) -> bool:
+    """
+    Delete embeddings from Pinecone index by ID prefix, metadata filter or exact IDs.
 
     Args:
         id_prefix: Prefix of IDs to delete (e.g., "document123-chunk-")
         filter: Metadata filter to select vectors to delete
+        ids: Exact vector IDs to delete
 
     Returns:
         bool: True if deletion was successful, False otherwise
     """
     try:
-        if id_prefix:
-            # Delete by ID prefix
+        if ids:
+            # Delete by exact IDs
+            print(f"Deleting {len(ids)} embeddings by ID")
+            _delete_id_batches(
+                (
+                    ids[i : i + PINECONE_MAX_BATCH_VECTORS]
+                    for i in range(0, len(ids), PINECONE_MAX_BATCH_VECTORS)
+                ),
+                "ids",
+            )
+            return True
+        elif id_prefix:
+            # Delete by ID prefix, deleting each listed page while the next is fetched
             print(f"Deleting embeddings with ID prefix: {id_prefix}")
-            for ids in pinecone_index.list(prefix=id_prefix, namespace=""):
-                pinecone_index.delete(
-                    ids=ids,
-                    namespace="",
-                )
+            _delete_id_batches(
+                get_pinecone_index().list(prefix=id_prefix, namespace=""), "prefix"
+            )
             return True
         elif filter:
             # Delete by metadata filter
             print(f"Deleting embeddings with filter: {filter}")
-            pinecone_index.delete(
+            get_pinecone_index().delete(
                 delete_all=False, ids=None, namespace="", filter=filter
             )
             return True
         else:
-            print("Error: Either id_prefix or filter must be provided")
+            print("Error: One of ids, id_prefix or filter must be provided")
             return False
     except Exception as e:
         print(f"Error deleting embeddings: {e}")
@@ -0,0 +1,298 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from dotenv import load_dotenv
+from .sqlite_store import SQLiteStore
+
+load_dotenv()
+
+DEFAULT_INDEX_PATH = ".cache/near_duplicates.sqlite3"
+DEFAULT_MAX_ENTRIES = 500_000
+
+# Fraction of the 64 SimHash bits two chunks must share to count as duplicates
+DEFAULT_THRESHOLD = 0.95
+
+# Chunks shorter than this many words are only ever matched exactly
+MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", "20"))
+
+# Words per shingle hashed into the SimHash
+SHINGLE_WORDS = 3
+
+# More bands allow lower thresholds but make every band less selective
+MAX_BANDS = 16
+
+_WORD_RE = re.compile(r"\w+")
+_BITS = np.arange(64, dtype=np.uint64)
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def simhash(words: List[str]) -> int:
+    """Return the 64-bit SimHash of a text's word shingles."""
+    if len(words) < SHINGLE_WORDS:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_WORDS])
+            for i in range(len(words) - SHINGLE_WORDS + 1)
+        ]
+    hashes = np.array(
+        [
+            int.from_bytes(
+                hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little"
+            )
+            for s in shingles
+        ],
+        dtype=np.uint64,
+    )
+    bits = (hashes[:, None] >> _BITS) & np.uint64(1)
+    weights = bits.sum(axis=0).astype(np.int64) * 2 - len(shingles)
+    return int(sum(1 << int(bit) for bit in np.flatnonzero(weights > 0)))
+
+
+def _signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class NearDuplicateIndex(SQLiteStore):
+    """
+    Persistent SimHash index of embedded chunks, for reusing near-identical ones.
+
+    Each chunk embedded under an embedding cache key is recorded with the
+    SimHash of its word shingles. A new chunk whose SimHash differs in at most
+    max_distance of the 64 bits (set by threshold) maps to the recorded key,
+    whose cached embedding it can reuse instead of calling OpenAI. Hashes are
+    split into max_distance + 1 bands, so any match shares at least one band
+    exactly and lookups stay indexed. Entries are scoped by model, so one
+    model's embedding is never reused for another. The oldest entries are
+    dropped past max_entries.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_INDEX_PATH,
+        threshold: float = DEFAULT_THRESHOLD,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.max_distance = max(0, min(int((1 - threshold) * 64), MAX_BANDS - 1))
+        self.bands = self.max_distance + 1
+        self.hits = 0
+        self.lookups = 0
+        # Entries at the last count and rows written since; other processes
+        # sharing the file are only seen when the count is refreshed
+        self._count: Optional[int] = None
+        self._written = 0
+        self._recount_every = max(1, max_entries // 100)
+
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, simhash INTEGER NOT NULL, "
+            "added REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_added ON entries (added)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS bands ("
+            "band INTEGER NOT NULL, value INTEGER NOT NULL, key TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS bands_value ON bands (band, value)"
+        )
+        # Replacing and evicting entries deletes their bands by key
+        self._conn.execute("CREATE INDEX IF NOT EXISTS bands_key ON bands (key)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)"
+        )
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE name = 'bands'"
+        ).fetchone()
+        if row is None or int(row[0]) != self.bands:
+            self._rebuild_bands()
+        self._conn.commit()
+
+    def _band_values(self, value: int) -> List[Tuple[int, int]]:
+        """Split a hash into (band, value) pairs of roughly equal width."""
+        bounds = [64 * i // self.bands for i in range(self.bands + 1)]
+        return [
+            (band, (value >> start) & ((1 << (end - start)) - 1))
+            for band, (start, end) in enumerate(zip(bounds, bounds[1:]))
+        ]
+
+    def _rebuild_bands(self) -> None:
+        """Re-split every stored hash after the threshold changed."""
+        self._conn.execute("DELETE FROM bands")
+        rows = self._conn.execute("SELECT key, simhash FROM entries").fetchall()
+        self._conn.executemany(
+            "INSERT INTO bands (band, value, key) VALUES (?, ?, ?)",
+            [
+                (band, value, key)
+                for key, signed in rows
+                for band, value in self._band_values(signed % (1 << 64))
+            ],
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('bands', ?)",
+            (str(self.bands),),
+        )
+
+    def find_many(self, model: str, texts: Iterable[str]) -> Dict[int, str]:
+        """
+        Find a recorded near-duplicate for each text.
+
+        Returns:
+            Dict mapping the position of each text that has one to the cache
+            key of its closest recorded near-duplicate
+        """
+        found = {}
+        try:
+            with self._lock:
+                for i, text in enumerate(texts):
+                    words = _words(text)
+                    if len(words) < MIN_WORDS:
+                        continue
+                    self.lookups += 1
+                    value = simhash(words)
+                    pairs = self._band_values(value)
+                    rows = self._conn.execute(
+                        "SELECT DISTINCT e.key, e.simhash FROM bands b "
+                        "JOIN entries e ON e.key = b.key WHERE e.model = ? AND ("
+                        + " OR ".join(["(b.band = ? AND b.value = ?)"] * len(pairs))
+                        + ")",
+                        [model, *(x for pair in pairs for x in pair)],
+                    ).fetchall()
+                    best = None
+                    for key, signed in rows:
+                        distance = bin(value ^ (signed % (1 << 64))).count("1")
+                        if distance <= self.max_distance and (
+                            best is None or distance < best[0]
+                        ):
+                            best = (distance, key)
+                    if best is not None:
+                        found[i] = best[1]
+        except sqlite3.Error as e:
+            print(f"Error reading near-duplicate index {self.path}: {e}")
+
+        self.hits += len(found)
+        return found
+
+    def add_many(self, model: str, items: Dict[str, str]) -> None:
+        """Record texts, keyed by the cache key their embedding is stored under."""
+        rows = []
+        for key, text in items.items():
+            words = _words(text)
+            if len(words) >= MIN_WORDS:
+                rows.append((key, simhash(words)))
+        if not rows:
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                keys = [(key,) for key, _ in rows]
+                self._conn.executemany("DELETE FROM bands WHERE key = ?", keys)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, model, simhash, added) "
+                    "VALUES (?, ?, ?, ?)",
+                    [(key, model, _signed(value), now) for key, value in rows],
+                )
+                self._conn.executemany(
+                    "INSERT INTO bands (band, value, key) VALUES (?, ?, ?)",
+                    [
+                        (band, band_value, key)
+                        for key, value in rows
+                        for band, band_value in self._band_values(value)
+                    ],
+                )
+                self._evict(len(rows))
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing near-duplicate index {self.path}: {e}")
+
+    def _evict(self, written: int) -> None:
+        """
+        Trim the index to 90% of max_entries once it exceeds the limit.
+
+        Entries are counted as in EmbeddingCache._evict: only when the last
+        count plus the rows written since could exceed the limit, and then at
+        most once per 1% of max_entries written.
+        """
+        self._written += written
+        if self._count is not None and (
+            self._count + self._written <= self.max_entries
+            or self._written < self._recount_every
+        ):
+            return
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        self._count = count
+        self._written = 0
+        if count <= self.max_entries:
+            return
+        excess = count - int(self.max_entries * 0.9)
+        oldest = "SELECT key FROM entries ORDER BY added LIMIT ?"
+        self._conn.execute(f"DELETE FROM bands WHERE key IN ({oldest})", (excess,))
+        self._conn.execute(f"DELETE FROM entries WHERE key IN ({oldest})", (excess,))
+        self._count = count - excess
+        print(f"Evicted {excess} entries from near-duplicate index {self.path}")
+
+    def stats(self) -> Dict[str, int]:
+        """Return lookup/hit counters for this process and the current entry count."""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        return {"lookups": self.lookups, "hits": self.hits, "entries": entries}
+
+
+_index: Optional[NearDuplicateIndex] = None
+_index_configured = False
+
+
+def configure_near_duplicate_index(
+    path: Optional[str] = None,
+    threshold: Optional[float] = None,
+    enabled: bool = True,
+) -> Optional[NearDuplicateIndex]:
+    """
+    Configure the process-wide near-duplicate index.
+
+    Args:
+        path: SQLite file to use; defaults to NEAR_DUPLICATE_PATH
+        threshold: Share of SimHash bits that must match; defaults to
+            NEAR_DUPLICATE_THRESHOLD
+        enabled: Set to False to only reuse embeddings of identical text
+
+    Returns:
+        The configured index, or None when it is disabled
+    """
+    global _index, _index_configured
+    if _index is not None:
+        _index.close()
+    _index_configured = True
+    _index = None
+    if not enabled:
+        return None
+
+    _index = NearDuplicateIndex(
+        path=path or os.environ.get("NEAR_DUPLICATE_PATH", DEFAULT_INDEX_PATH),
+        threshold=threshold
+        or float(os.getenv("NEAR_DUPLICATE_THRESHOLD", str(DEFAULT_THRESHOLD))),
+        max_entries=int(
+            os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", str(DEFAULT_MAX_ENTRIES))
+        ),
+    )
+    return _index
+
+
+def get_near_duplicate_index() -> Optional[NearDuplicateIndex]:
+    """Return the shared index, creating it from the environment on first use."""
+    if not _index_configured:
+        enabled = os.getenv("NEAR_DUPLICATE_ENABLED", "false").lower() == "true"
+        configure_near_duplicate_index(enabled=enabled)
+    return _index
@@ -0,0 +1,45 @@
+import os
+import sqlite3
+import threading
+from typing import Iterator, List, Sequence, Tuple, TypeVar
+
+# SQLite limits the number of bound parameters per statement
+SQL_BATCH = 500
+
+T = TypeVar("T")
+
+
+def sql_batches(
+    items: Sequence[T], size: int = SQL_BATCH
+) -> Iterator[Tuple[List[T], str]]:
+    """Yield items in batches small enough to bind, with a "?,?,..." for each."""
+    for i in range(0, len(items), size):
+        batch = list(items[i : i + size])
+        yield batch, ",".join("?" * len(batch))
+
+
+class SQLiteStore:
+    """
+    Base of the local stores kept in one SQLite file.
+
+    The database runs in WAL mode, so several processes (the SQS worker and
+    the bucket backfill script) can read and write one file at the same
+    time. Within a process the connection is shared by all threads and every
+    use of it holds _lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,388 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+from src.metrics import inc, set_gauge
+from .document_manifest import get_document_manifest
+from .embeddings import upsert_vectors
+from .sqlite_store import SQLiteStore, sql_batches
+
+load_dotenv()
+
+DEFAULT_OUTBOX_PATH = ".cache/outbox.sqlite3"
+
+# Vectors read from the outbox and sent to Pinecone per flush
+FLUSH_VECTORS = int(os.getenv("UPSERT_OUTBOX_FLUSH_VECTORS", "1000"))
+
+# Seconds the flusher sleeps when nothing is ready to send
+FLUSH_INTERVAL = float(os.getenv("UPSERT_OUTBOX_FLUSH_INTERVAL", "1.0"))
+
+# Seconds a shutting down process waits for the outbox to drain
+DRAIN_TIMEOUT = float(os.getenv("UPSERT_OUTBOX_DRAIN_TIMEOUT", "30"))
+
+# Longest wait, in seconds, before a vector that keeps failing is sent again
+MAX_RETRY_DELAY = 300
+
+# Failed upserts after which a vector is moved to the dead_letter table;
+# 0 retries forever
+MAX_ATTEMPTS = int(os.getenv("UPSERT_OUTBOX_MAX_ATTEMPTS", "20"))
+
+
+class UpsertOutbox(SQLiteStore):
+    """
+    Durable, local write-ahead queue of vectors waiting to be upserted to Pinecone.
+
+    Callers spool computed vectors with put_many and move on; a background
+    thread drains the outbox to Pinecone in large batches. A vector is only
+    removed once its upsert succeeds; failed vectors are retried with
+    exponential backoff, so embeddings that were paid for survive Pinecone
+    outages and restarts. Anything left over from a previous run is sent as
+    soon as the flusher starts.
+
+    A vector that still fails after max_attempts upserts (e.g. one Pinecone
+    rejects) is moved to the dead_letter table and logged instead of being
+    retried forever. Its message was acknowledged when it was spooled, so
+    the object's indexed version is forgotten in the document manifest to
+    have the next event or backfill index it again.
+
+    Rows are keyed by vector ID, so spooling an ID again replaces its pending
+    vector and only the latest one is sent. discard_ids and discard_object
+    remove pending vectors before their IDs are deleted from the index and
+    wait for a flush in progress, so a delete can't be undone by a late
+    upsert. That guarantee holds within one process, although the file
+    itself can be shared.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_OUTBOX_PATH,
+        flush_vectors: int = FLUSH_VECTORS,
+        flush_interval: float = FLUSH_INTERVAL,
+        max_attempts: int = MAX_ATTEMPTS,
+    ):
+        super().__init__(path)
+        self.flush_vectors = max(1, flush_vectors)
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        # Held while a batch is being sent, so discards wait for it to land
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL UNIQUE, "
+            "bucket TEXT NOT NULL, object_key TEXT NOT NULL, "
+            "vector BLOB NOT NULL, metadata TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_object ON outbox (bucket, object_key)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS dead_letter ("
+            "id TEXT PRIMARY KEY, bucket TEXT NOT NULL, object_key TEXT NOT NULL, "
+            "vector BLOB NOT NULL, metadata TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def put_many(self, vectors: List[Dict[str, Any]]) -> None:
+        """
+        Durably spool vector records ("id", "values", "metadata") for upsert.
+
+        Raises sqlite3.Error if they could not be written, so the caller can
+        treat the vectors as not stored.
+        """
+        if not vectors:
+            return
+        now = time.time()
+        rows = [
+            (
+                vector["id"],
+                vector["metadata"].get("bucketName", ""),
+                vector["metadata"].get("objectKey", ""),
+                np.asarray(vector["values"], dtype="<f4").tobytes(),
+                json.dumps(vector["metadata"]),
+                now,
+            )
+            for vector in vectors
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO outbox "
+                "(id, bucket, object_key, vector, metadata, next_attempt) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+        inc("upsert_outbox_spooled_total", len(rows))
+        self._wake.set()
+
+    def pending_metadata(self, ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """Return the metadata of vectors still waiting in the outbox, by ID."""
+        ids = list(ids)
+        found = {}
+        try:
+            with self._lock:
+                for batch, placeholders in sql_batches(ids):
+                    rows = self._conn.execute(
+                        f"SELECT id, metadata FROM outbox WHERE id IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                    for vector_id, metadata in rows:
+                        found[vector_id] = json.loads(metadata)
+        except sqlite3.Error as e:
+            print(f"Error reading upsert outbox {self.path}: {e}")
+        return found
+
+    def pending_ids(self, bucket: str, object_key: str) -> List[str]:
+        """Return the IDs of an object's vectors still waiting in the outbox."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM outbox WHERE bucket = ? AND object_key = ?",
+                (bucket, object_key),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def discard_ids(self, ids: Iterable[str]) -> None:
+        """Drop pending vectors with these IDs, waiting for any flush in progress."""
+        ids = list(ids)
+        with self._flush_lock, self._lock:
+            for batch, placeholders in sql_batches(ids):
+                self._conn.execute(
+                    f"DELETE FROM outbox WHERE id IN ({placeholders})", batch
+                )
+            self._conn.commit()
+
+    def discard_object(self, bucket: str, object_key: str) -> None:
+        """Drop every pending vector of an object, waiting for any flush in progress."""
+        with self._flush_lock, self._lock:
+            self._conn.execute(
+                "DELETE FROM outbox WHERE bucket = ? AND object_key = ?",
+                (bucket, object_key),
+            )
+            self._conn.commit()
+
+    def pending_count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()
+        return int(count)
+
+    def dead_letter_count(self) -> int:
+        with self._lock:
+            (count,) = self._conn.execute("SELECT COUNT(*) FROM dead_letter").fetchone()
+        return int(count)
+
+    def flush(self) -> int:
+        """
+        Send one batch of the vectors that are due to Pinecone.
+
+        Returns:
+            How many vectors were sent successfully
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seq, id, vector, metadata, attempts FROM outbox "
+                    "WHERE next_attempt <= ? ORDER BY seq LIMIT ?",
+                    (time.time(), self.flush_vectors),
+                ).fetchall()
+            if not rows:
+                return 0
+
+            vectors = [
+                {
+                    "id": vector_id,
+                    "values": np.frombuffer(blob, dtype="<f4"),
+                    "metadata": json.loads(metadata),
+                }
+                for _, vector_id, blob, metadata, _ in rows
+            ]
+            error = None
+            try:
+                results = upsert_vectors(vectors)
+            except Exception as e:
+                print(f"Error flushing {len(vectors)} vectors from upsert outbox: {e}")
+                results = {}
+                error = str(e)
+
+            # Rows are removed by seq, so a vector spooled again meanwhile stays
+            sent = [seq for seq, vector_id, *_ in rows if results.get(vector_id)]
+            failed = [
+                (attempts, seq)
+                for seq, vector_id, _, _, attempts in rows
+                if not results.get(vector_id)
+            ]
+            dead = [
+                seq
+                for attempts, seq in failed
+                if self.max_attempts and attempts + 1 >= self.max_attempts
+            ]
+            dead_seqs = set(dead)
+            retried = [
+                (attempts, seq) for attempts, seq in failed if seq not in dead_seqs
+            ]
+            now = time.time()
+            dead_objects = set()
+            with self._lock:
+                for batch, placeholders in sql_batches(dead):
+                    dead_objects.update(
+                        self._conn.execute(
+                            "SELECT bucket, object_key FROM outbox "
+                            f"WHERE seq IN ({placeholders})",
+                            batch,
+                        ).fetchall()
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO dead_letter (id, bucket, object_key, "
+                        "vector, metadata, attempts, error, failed_at) "
+                        "SELECT id, bucket, object_key, vector, metadata, "
+                        f"attempts + 1, ?, ? FROM outbox WHERE seq IN ({placeholders})",
+                        [error, now, *batch],
+                    )
+                for done in (sent, dead):
+                    for batch, placeholders in sql_batches(done):
+                        self._conn.execute(
+                            f"DELETE FROM outbox WHERE seq IN ({placeholders})", batch
+                        )
+                self._conn.executemany(
+                    "UPDATE outbox SET attempts = attempts + 1, next_attempt = ? "
+                    "WHERE seq = ?",
+                    [
+                        (now + min(2**attempts, MAX_RETRY_DELAY), seq)
+                        for attempts, seq in retried
+                    ],
+                )
+                self._conn.commit()
+
+        inc("upsert_outbox_flushed_total", len(sent))
+        if retried:
+            inc("upsert_outbox_retries_total", len(retried))
+            print(f"Upsert outbox: {len(retried)} vectors failed, will retry")
+        if dead:
+            inc("upsert_outbox_dead_letter_total", len(dead))
+            self._dead_lettered(len(dead), dead_objects)
+        return len(sent)
+
+    def _dead_lettered(self, count: int, objects: Iterable[tuple]) -> None:
+        print(
+            f"Upsert outbox: moved {count} vectors to dead_letter in {self.path} "
+            f"after {self.max_attempts} attempts; objects: "
+            + ", ".join(
+                f"{bucket}/{object_key}" for bucket, object_key in sorted(objects)
+            )
+        )
+        manifest = get_document_manifest()
+        if manifest is not None:
+            for bucket, object_key in objects:
+                manifest.forget_indexed(bucket, object_key)
+
+    def start(self) -> None:
+        """Start the background flusher, which first replays any leftover vectors."""
+        if self._thread is not None:
+            return
+        pending = self.pending_count()
+        if pending:
+            print(f"Replaying {pending} vectors left in upsert outbox {self.path}")
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="upsert-outbox", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                sent = self.flush()
+                set_gauge("upsert_outbox_pending", self.pending_count())
+            except sqlite3.Error as e:
+                print(f"Error flushing upsert outbox {self.path}: {e}")
+                sent = 0
+            if not sent:
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until the outbox is empty or timeout seconds pass.
+
+        Returns:
+            True if every vector was sent
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending_count():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            if self._thread is None:
+                self.flush()
+            time.sleep(0.1)
+        return True
+
+    def close(self) -> None:
+        """Stop the flusher; unsent vectors stay on disk for the next run."""
+        if self._thread is not None:
+            self._stopping.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+        super().close()
+
+
+_outbox: Optional[UpsertOutbox] = None
+_outbox_configured = False
+
+
+def configure_upsert_outbox(
+    path: Optional[str] = None, enabled: bool = True
+) -> Optional[UpsertOutbox]:
+    """
+    Configure the process-wide upsert outbox and start its flusher.
+
+    Args:
+        path: SQLite file to use; defaults to UPSERT_OUTBOX_PATH
+        enabled: Set to False to upsert straight to Pinecone instead
+
+    Returns:
+        The configured outbox, or None when it is disabled
+    """
+    global _outbox, _outbox_configured
+    if _outbox is not None:
+        _outbox.close()
+    _outbox_configured = True
+    _outbox = None
+    if not enabled:
+        return None
+
+    _outbox = UpsertOutbox(
+        path=path or os.environ.get("UPSERT_OUTBOX_PATH", DEFAULT_OUTBOX_PATH)
+    )
+    _outbox.start()
+    return _outbox
+
+
+def get_upsert_outbox() -> Optional[UpsertOutbox]:
+    """Return the shared outbox, creating it from the environment on first use."""
+    if not _outbox_configured:
+        enabled = os.getenv("UPSERT_OUTBOX_ENABLED", "false").lower() == "true"
+        configure_upsert_outbox(enabled=enabled)
+    return _outbox
+
+
+def shutdown_upsert_outbox(timeout: Optional[float] = DRAIN_TIMEOUT) -> None:
+    """Give the outbox up to timeout seconds to drain, then stop its flusher."""
+    global _outbox
+    if _outbox is None:
+        return
+    if not _outbox.drain(timeout):
+        print(
+            f"{_outbox.pending_count()} vectors left in upsert outbox "
+            f"{_outbox.path}; they are sent on the next start"
+        )
+    _outbox.close()
+    _outbox = None
@@ -0,0 +1,29 @@
+import time
+from .clients import (
+    get_openai_async_client,
+    get_pinecone_index,
+    get_s3_client,
+    get_sqs_client,
+)
+from .utils.document_processor import get_nlp
+
+
+def prewarm(models: bool = True, clients: bool = True) -> None:
+    """
+    Eagerly load everything that is otherwise initialized on first use.
+
+    Use this when a slower start is preferable to a slow first message, e.g.
+    before a worker starts taking traffic.
+    """
+    start = time.perf_counter()
+    if models:
+        get_nlp()
+        # Importing the loaders' parsers up front avoids a stall on the first file
+        import pandas  # noqa: F401
+        import pymupdf  # noqa: F401
+    if clients:
+        get_s3_client()
+        get_sqs_client()
+        get_openai_async_client()
+        get_pinecone_index()
+    print(f"Pre-warmed models and clients in {time.perf_counter() - start:.2f}s")
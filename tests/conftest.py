@@ -0,0 +1,99 @@
+import os
+from typing import Any
+import pytest
+
+BUCKET = "test-bucket"
+
+
+def pytest_configure(config):
+    # Read when src is first imported, during collection: keep CPU-bound work
+    # in threads and metrics off
+    os.environ.setdefault("PROCESS_POOL_WORKERS", "0")
+    os.environ.setdefault("METRICS_ENABLED", "false")
+
+
+@pytest.fixture(scope="session", autouse=True)
+def blank_nlp():
+    """Chunk with a blank English pipeline so tests don't need en_core_web_sm."""
+    import spacy
+    from src.utils import document_processor
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe("sentencizer")
+    document_processor._nlp = nlp
+    yield nlp
+
+
+class Pipeline:
+    """The fakes and local stores one test runs the pipeline against."""
+
+    def __init__(self, root):
+        from src.benchmarks.fakes import (
+            FakeAsyncOpenAI,
+            FakePineconeIndex,
+            InMemorySQS,
+            LocalS3Client,
+            ServiceProfile,
+        )
+
+        self.root = root
+        self.s3 = LocalS3Client(str(root / "s3"))
+        self.sqs = InMemorySQS()
+        # Stands in for AsyncOpenAI
+        self.openai: Any = FakeAsyncOpenAI(ServiceProfile(latency=0))
+        self.index = FakePineconeIndex(ServiceProfile(latency=0))
+        os.makedirs(root / "s3" / BUCKET, exist_ok=True)
+
+    def write(self, key: str, text: str) -> dict:
+        """Store an object and return the file_info of an event for it."""
+        with open(self.root / "s3" / BUCKET / key, "w") as f:
+            f.write(text)
+        return {"bucket_name": BUCKET, "object_key": key}
+
+    @property
+    def embedded(self) -> int:
+        """Texts sent to the embeddings endpoint so far."""
+        return int(self.openai.embeddings.recorder.items)
+
+    def ids(self, key: str):
+        return sorted(vid for vid in self.index.vectors if vid.startswith(key))
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """Wire the pipeline to fresh fakes, with its local stores under tmp_path."""
+    from src.benchmarks.fakes import WhitespaceEncoding, install_fakes
+    from src.clients import openai_embeddings
+    from src.clients.openai_embeddings import EMBEDDING_DIMENSIONS, EMBEDDING_MODEL
+    from src.utils import (
+        configure_chunk_store,
+        configure_document_manifest,
+        configure_embedding_cache,
+        configure_near_duplicate_index,
+        configure_upsert_outbox,
+        embedding_scheduler,
+    )
+
+    fakes = Pipeline(tmp_path)
+    install_fakes(s3=fakes.s3, sqs=fakes.sqs, index=fakes.index)
+    # Build the scheduler here rather than in install_fakes, which would try
+    # to download the tiktoken encoding
+    monkeypatch.setattr(openai_embeddings, "_async_client", fakes.openai)
+    monkeypatch.setattr(
+        embedding_scheduler,
+        "_scheduler",
+        embedding_scheduler.EmbeddingScheduler(
+            fakes.openai,
+            EMBEDDING_MODEL,
+            EMBEDDING_DIMENSIONS,
+            encoding=WhitespaceEncoding(),
+        ),
+    )
+
+    configure_embedding_cache(enabled=False)
+    configure_near_duplicate_index(enabled=False)
+    configure_upsert_outbox(enabled=False)
+    configure_chunk_store("metadata")
+    configure_document_manifest(path=str(tmp_path / "manifest.sqlite3"))
+    yield fakes
+    configure_document_manifest(enabled=False)
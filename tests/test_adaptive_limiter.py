@@ -0,0 +1,112 @@
+import asyncio
+import threading
+from src.adaptive_limiter import AdaptiveLimiter, throttle_reason
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def saturate(limiter: AdaptiveLimiter) -> None:
+    limiter._in_flight = limiter.limit
+
+
+def test_async_waiters_are_granted_in_fifo_order():
+    limiter = AdaptiveLimiter("test", 1, 1, adaptive=False)
+    order = []
+
+    async def worker(name):
+        async with limiter.slot():
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def run():
+        await limiter.acquire()
+        tasks = [asyncio.ensure_future(worker(i)) for i in range(5)]
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+
+    assert order == [0, 1, 2, 3, 4]
+    assert limiter.in_flight == 0
+
+
+def test_async_waiters_are_served_before_threads():
+    limiter = AdaptiveLimiter("test", 1, 1, adaptive=False)
+    order = []
+
+    def thread_call():
+        with limiter.sync_slot():
+            order.append("thread")
+
+    async def run():
+        await limiter.acquire()
+        thread = threading.Thread(target=thread_call)
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        thread.start()
+        await asyncio.sleep(0.05)
+        limiter.release()
+        await waiter
+        order.append("coroutine")
+        limiter.release()
+        await asyncio.get_running_loop().run_in_executor(None, thread.join)
+
+    asyncio.run(run())
+
+    assert order == ["coroutine", "thread"]
+
+
+def test_limit_grows_only_while_saturated():
+    limiter = AdaptiveLimiter("test", 2, 10)
+
+    for _ in range(4):
+        limiter._in_flight = 1
+        limiter.release(latency=0.1)
+    assert limiter.limit == 2
+
+    for _ in range(10):
+        saturate(limiter)
+        limiter.release(latency=0.1)
+    assert limiter.limit > 2
+
+
+def test_throttling_cuts_the_limit_once_per_cooldown():
+    limiter = AdaptiveLimiter("test", 8, 16, cooldown=60)
+
+    for _ in range(3):
+        limiter._in_flight = 1
+        limiter.release(error=StatusError(429))
+
+    assert limiter.limit == 4
+    assert limiter.throttle_events == 3
+
+
+def test_latency_spikes_are_judged_per_size():
+    limiter = AdaptiveLimiter("test", 8, 16, cooldown=0, latency_spike_factor=3)
+    for _ in range(20):
+        limiter._in_flight = 1
+        limiter.release(latency=0.1, size=1000)
+
+    # Ten times the tokens in eight times the time is no spike
+    limiter._in_flight = 1
+    limiter.release(latency=0.8, size=10000)
+    assert limiter.throttle_events == 0
+
+    limiter._in_flight = 1
+    limiter.release(latency=0.8, size=1000)
+    assert limiter.throttle_events == 1
+    assert limiter.limit == 4
+
+
+def test_throttle_reason():
+    assert throttle_reason(StatusError(429)) == "rate_limit"
+    assert throttle_reason(StatusError(503)) == "server_error"
+    assert throttle_reason(StatusError(400)) is None
+    assert throttle_reason(Exception("StatusCode.RESOURCE_EXHAUSTED")) == (
+        "server_error"
+    )
@@ -0,0 +1,76 @@
+import asyncio
+import json
+from src.scripts.generate_bucket_embeddings import (
+    BackfillCheckpoint,
+    process_s3_bucket,
+)
+
+BUCKET = "test-bucket"
+
+
+def backfill(checkpoint_path, **kwargs) -> None:
+    asyncio.run(
+        process_s3_bucket(
+            BUCKET,
+            concurrency=2,
+            checkpoint_path=checkpoint_path,
+            skip_unchanged=False,
+            **kwargs,
+        )
+    )
+
+
+def saved(checkpoint_path) -> dict:
+    with open(checkpoint_path) as f:
+        state: dict = json.load(f)
+    return state
+
+
+def test_watermark_advances_only_past_finished_keys(tmp_path):
+    checkpoint = BackfillCheckpoint(str(tmp_path / "cp.json"), BUCKET, "")
+    for key in ("a", "b", "c"):
+        checkpoint.started(key)
+
+    checkpoint.finished("b", True, 1)
+    assert checkpoint.start_after == ""
+    checkpoint.finished("a", False, 0)
+    assert checkpoint.start_after == "b"
+    checkpoint.save()
+
+    resumed = BackfillCheckpoint(str(tmp_path / "cp.json"), BUCKET, "")
+    assert resumed.load()
+    assert (resumed.start_after, resumed.failed, resumed.processed) == ("b", ["a"], 2)
+
+
+def test_resumed_run_skips_keys_already_done(pipeline, tmp_path):
+    checkpoint_path = str(tmp_path / "cp.json")
+    for name in ("a", "b", "c"):
+        pipeline.write(f"{name}.txt", f"Document {name} talks about {name}.")
+    backfill(checkpoint_path)
+    assert saved(checkpoint_path)["start_after"] == "c.txt"
+    embedded = pipeline.embedded
+
+    # a.txt changes, but it sorts before the watermark; d.txt is new
+    pipeline.write("a.txt", "Document a now talks about something else.")
+    pipeline.write("d.txt", "Document d talks about d.")
+    backfill(checkpoint_path)
+
+    assert pipeline.embedded - embedded == 1
+    assert pipeline.ids("d.txt") == ["d.txt-chunk-0"]
+    assert saved(checkpoint_path)["start_after"] == "d.txt"
+
+
+def test_failed_keys_are_retried_on_request(pipeline, tmp_path):
+    checkpoint_path = str(tmp_path / "cp.json")
+    pipeline.write("a.txt", "Document a talks about a.")
+    checkpoint = BackfillCheckpoint(checkpoint_path, BUCKET, "")
+    checkpoint.start_after = "a.txt"
+    checkpoint.failed = ["a.txt"]
+    checkpoint.save()
+
+    backfill(checkpoint_path)
+    assert pipeline.ids("a.txt") == []
+
+    backfill(checkpoint_path, retry_failed=True)
+    assert pipeline.ids("a.txt") == ["a.txt-chunk-0"]
+    assert saved(checkpoint_path)["failed"] == []
@@ -0,0 +1,121 @@
+import pytest
+from src.utils import chunk_store
+from src.utils.chunk_store import (
+    ChunkStore,
+    LocalChunkStore,
+    S3ChunkStore,
+    fetch_chunk_texts,
+)
+
+BUCKET = "test-bucket"
+
+
+def texts(object_key: str, count: int):
+    return {f"{object_key}-chunk-{i}": f"Text of chunk {i}." for i in range(count)}
+
+
+@pytest.fixture(params=["local", "s3"])
+def store(request, pipeline, tmp_path, monkeypatch):
+    """Each chunk store backend, with S3 packs of four chunks."""
+    monkeypatch.setattr(chunk_store, "S3_PACK_SIZE", 4)
+    store: ChunkStore
+    if request.param == "local":
+        store = LocalChunkStore(path=str(tmp_path / "chunks.sqlite3"))
+    else:
+        store = S3ChunkStore(BUCKET, prefix="chunks/")
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    store.put_many("doc.txt", texts("doc.txt", 10))
+
+    found = store.get_many(["doc.txt-chunk-9", "doc.txt-chunk-0", "other-chunk-0"])
+
+    assert found == {
+        "doc.txt-chunk-0": "Text of chunk 0.",
+        "doc.txt-chunk-9": "Text of chunk 9.",
+    }
+
+
+def test_writes_replace_only_the_given_chunks(store):
+    store.put_many("doc.txt", texts("doc.txt", 10))
+    store.put_many("doc.txt", {"doc.txt-chunk-5": "Rewritten."})
+
+    found = store.get_many(texts("doc.txt", 10))
+
+    assert len(found) == 10
+    assert found["doc.txt-chunk-5"] == "Rewritten."
+    assert found["doc.txt-chunk-4"] == "Text of chunk 4."
+
+
+def test_delete_ids_removes_exactly_those_chunks(store):
+    store.put_many("doc.txt", texts("doc.txt", 10))
+
+    store.delete_ids(["doc.txt-chunk-2", "doc.txt-chunk-5", "doc.txt-chunk-99"])
+
+    remaining = set(store.get_many(texts("doc.txt", 10)))
+    assert remaining == set(texts("doc.txt", 10)) - {
+        "doc.txt-chunk-2",
+        "doc.txt-chunk-5",
+    }
+
+
+def test_delete_object_keeps_objects_sharing_its_prefix(store):
+    store.put_many("a.txt", texts("a.txt", 6))
+    # Its pack keys start with the listing prefix of a.txt's packs
+    store.put_many("a.txt-chunks-1.txt", texts("a.txt-chunks-1.txt", 2))
+
+    store.delete_object("a.txt")
+
+    assert store.get_many(texts("a.txt", 6)) == {}
+    assert store.get_many(texts("a.txt-chunks-1.txt", 2)) == texts(
+        "a.txt-chunks-1.txt", 2
+    )
+
+
+def test_s3_chunks_are_packed_by_index(pipeline, monkeypatch):
+    monkeypatch.setattr(chunk_store, "S3_PACK_SIZE", 4)
+    store = S3ChunkStore(BUCKET, prefix="chunks/")
+    store.put_many("doc.txt", texts("doc.txt", 10))
+
+    assert pipeline.s3.keys(BUCKET, "chunks/") == [
+        "chunks/doc.txt-chunks-0",
+        "chunks/doc.txt-chunks-1",
+        "chunks/doc.txt-chunks-2",
+    ]
+
+    # Emptying a pack deletes it
+    store.delete_ids(["doc.txt-chunk-8", "doc.txt-chunk-9"])
+    assert pipeline.s3.keys(BUCKET, "chunks/") == [
+        "chunks/doc.txt-chunks-0",
+        "chunks/doc.txt-chunks-1",
+    ]
+    store.close()
+
+
+def test_fetch_falls_back_to_metadata(pipeline, tmp_path):
+    pipeline.index.upsert(
+        [
+            {
+                "id": "old.txt-chunk-0",
+                "values": [0.0],
+                "metadata": {"chunk_text": "Indexed before the store."},
+            }
+        ]
+    )
+    store = chunk_store.configure_chunk_store(
+        "local", path=str(tmp_path / "chunks.sqlite3")
+    )
+    assert store is not None
+    try:
+        store.put_many("doc.txt", texts("doc.txt", 1))
+
+        found = fetch_chunk_texts(["doc.txt-chunk-0", "old.txt-chunk-0"])
+    finally:
+        chunk_store.configure_chunk_store("metadata")
+
+    assert found == {
+        "doc.txt-chunk-0": "Text of chunk 0.",
+        "old.txt-chunk-0": "Indexed before the store.",
+    }
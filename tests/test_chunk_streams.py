@@ -0,0 +1,151 @@
+import asyncio
+import os
+import pytest
+from src import document_loaders, file_processor
+from src.document_handler import process_file_event
+from src.document_loaders import iter_pdf_pages, load_csv, open_pdf
+from src.file_processor import (
+    ChunkStream,
+    PdfChunkStream,
+    _pdf_page_count,
+    _write_temp_file,
+    download_and_process_file,
+)
+from src.utils import iter_chunks
+
+CREATED = "s3:ObjectCreated:Put"
+
+
+def csv_text(rows: int) -> str:
+    lines = ["id,name,notes"]
+    lines += [f"{i},name {i},some notes about row {i}" for i in range(rows)]
+    return "\n".join(lines) + "\n"
+
+
+def pdf_bytes(pages: int) -> bytes:
+    import pymupdf
+
+    pdf = pymupdf.open()
+    for number in range(pages):
+        page = pdf.new_page()
+        page.insert_text((72, 72), f"Page {number} has a sentence. " * 6)
+    content: bytes = pdf.tobytes()
+    return content
+
+
+async def collect(stream):
+    chunks = []
+    try:
+        async for batch in stream:
+            chunks.extend(batch)
+    finally:
+        await stream.aclose()
+    return chunks
+
+
+def test_chunk_stream_requires_produce():
+    with pytest.raises(TypeError):
+        ChunkStream({})  # type: ignore[abstract]
+
+
+def test_pdf_stream_matches_chunking_the_whole_document(monkeypatch):
+    monkeypatch.setattr(document_loaders, "PDF_PAGES_PER_PARSE", 3)
+    content = pdf_bytes(40)
+    path = _write_temp_file(content, ".pdf")
+    stream = PdfChunkStream(path, _pdf_page_count(content), {"source": "s3://b/k"}, 2)
+
+    streamed = asyncio.run(collect(stream))
+
+    pdf = open_pdf(content)
+    expected = list(iter_chunks(iter_pdf_pages(pdf)))
+    pdf.close()
+    assert [doc.page_content for doc in streamed] == [
+        doc.page_content for doc in expected
+    ]
+    assert [doc.metadata["page"] for doc in streamed] == [
+        doc.metadata["page"] for doc in expected
+    ]
+    assert all(doc.metadata["source"] == "s3://b/k" for doc in streamed)
+    assert stream.chunk_count == len(streamed)
+
+
+@pytest.fixture
+def temp_files(monkeypatch):
+    """Record the temporary files written for streamed PDFs."""
+    written = []
+
+    def write(content, suffix):
+        path = _write_temp_file(content, suffix)
+        written.append(path)
+        return path
+
+    monkeypatch.setattr(file_processor, "_write_temp_file", write)
+    monkeypatch.setattr(file_processor, "PDF_STREAM_MIN_PAGES", 20)
+    return written
+
+
+def test_short_pdf_is_loaded_without_a_temp_file(pipeline, temp_files):
+    path = pipeline.root / "s3" / "test-bucket" / "short.pdf"
+    path.write_bytes(pdf_bytes(5))
+    file_info = {"bucket_name": "test-bucket", "object_key": "short.pdf"}
+
+    docs, success = asyncio.run(download_and_process_file(file_info, stream=True))
+
+    assert success and isinstance(docs, list) and len(docs) == 5
+    assert temp_files == []
+
+
+def test_long_pdf_is_streamed_from_a_temp_file(pipeline, temp_files):
+    path = pipeline.root / "s3" / "test-bucket" / "long.pdf"
+    path.write_bytes(pdf_bytes(25))
+    file_info = {"bucket_name": "test-bucket", "object_key": "long.pdf"}
+
+    docs, success = asyncio.run(download_and_process_file(file_info, stream=True))
+
+    assert success and isinstance(docs, PdfChunkStream)
+    assert docs.page_count == 25 and len(temp_files) == 1
+    asyncio.run(collect(docs))
+    assert not os.path.exists(temp_files[0])
+
+
+@pytest.fixture
+def stream_tables(monkeypatch):
+    monkeypatch.setattr(file_processor, "TABLE_STREAM_MIN_BYTES", 1000)
+    monkeypatch.setattr(file_processor, "TABLE_STREAM_BATCH_CHUNKS", 3)
+
+
+def test_large_csv_is_streamed_in_row_groups(pipeline, stream_tables):
+    file_info = pipeline.write("table.csv", csv_text(2000))
+
+    docs, success = asyncio.run(download_and_process_file(file_info, stream=True))
+
+    assert success
+    assert isinstance(docs, file_processor.TableChunkStream)
+    streamed = asyncio.run(collect(docs))
+    with open(pipeline.root / "s3" / "test-bucket" / "table.csv", "rb") as f:
+        expected = load_csv(f)
+    assert [doc.page_content for doc in streamed] == [
+        doc.page_content for doc in expected
+    ]
+    assert file_info["etag"]
+
+
+def test_small_csv_is_loaded_whole(pipeline, stream_tables):
+    file_info = pipeline.write("table.csv", csv_text(5))
+
+    docs, success = asyncio.run(download_and_process_file(file_info, stream=True))
+
+    assert success and isinstance(docs, list)
+
+
+def test_streamed_table_shrink_deletes_trailing_chunks(pipeline, stream_tables):
+    file_info = pipeline.write("table.csv", csv_text(2000))
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+    before = len(pipeline.ids("table.csv"))
+
+    pipeline.write("table.csv", csv_text(1000))
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+
+    after = pipeline.ids("table.csv")
+    assert 0 < len(after) < before
+    assert after == sorted(f"table.csv-chunk-{i}" for i in range(len(after)))
@@ -0,0 +1,56 @@
+from langchain_core.documents import Document
+from src.utils.document_processor import chunk_documents
+
+
+def sentences(start: int, end: int) -> str:
+    return " ".join(f"Sentence {i} has six tokens ." for i in range(start, end))
+
+
+def tokens(chunk: Document):
+    return chunk.page_content.split(" ")
+
+
+def test_chunks_end_at_sentence_boundaries_within_the_size():
+    chunks = chunk_documents([Document(page_content=sentences(0, 100))], 50, 0.0)
+
+    assert len(chunks) > 1
+    assert all(len(tokens(chunk)) <= 50 for chunk in chunks)
+    assert all(chunk.page_content.endswith(".") for chunk in chunks)
+
+
+def test_consecutive_chunks_overlap():
+    chunks = chunk_documents([Document(page_content=sentences(0, 100))], 50, 0.2)
+
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert tokens(chunk)[:10] == tokens(previous)[-10:]
+
+
+def test_zero_overlap_never_repeats_text():
+    text = sentences(0, 100)
+
+    chunks = chunk_documents([Document(page_content=text)], 50, 0.0)
+
+    assert " ".join(chunk.page_content for chunk in chunks) == text
+
+
+def test_whitespace_is_not_emitted():
+    chunks = chunk_documents([Document(page_content="One  two.\n\n\tThree four.  ")])
+
+    assert [chunk.page_content for chunk in chunks] == ["One two . Three four ."]
+
+
+def test_batched_documents_chunk_as_if_alone():
+    docs = [
+        Document(page_content=sentences(0, 40 + i * 7), metadata={"page": i})
+        for i in range(5)
+    ]
+
+    batched = chunk_documents(docs, 50, 0.2, batch_size=2)
+
+    alone = [chunk for doc in docs for chunk in chunk_documents([doc], 50, 0.2)]
+    assert [(c.page_content, c.metadata) for c in batched] == [
+        (c.page_content, c.metadata) for c in alone
+    ]
+    # Metadata is copied, not shared with the source document
+    batched[0].metadata["page"] = 99
+    assert docs[0].metadata["page"] == 0
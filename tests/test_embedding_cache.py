@@ -0,0 +1,72 @@
+import numpy as np
+from src.utils.embedding_cache import EmbeddingCache
+
+
+def vector(seed: int) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal(4).astype("<f4")
+
+
+def test_hits_and_misses(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    key = EmbeddingCache.key("model", 4, "hello")
+    other = EmbeddingCache.key("model", 4, "world")
+
+    assert cache.get_many([key]) == {}
+    cache.put_many({key: vector(1)})
+    found = cache.get_many([key, other])
+
+    assert list(found) == [key]
+    np.testing.assert_array_equal(found[key], vector(1))
+    assert cache.stats() == {"hits": 1, "misses": 2, "entries": 1}
+
+
+def test_key_depends_on_model_dimensions_and_text():
+    keys = {
+        EmbeddingCache.key("model", 4, "hello"),
+        EmbeddingCache.key("model", 8, "hello"),
+        EmbeddingCache.key("other", 4, "hello"),
+        EmbeddingCache.key("model", 4, "hello!"),
+    }
+    assert len(keys) == 4
+
+
+def test_is_shared_through_the_file(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    key = EmbeddingCache.key("model", 4, "hello")
+    EmbeddingCache(path=path).put_many({key: vector(1)})
+
+    assert list(EmbeddingCache(path=path).get_many([key])) == [key]
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=100)
+    keys = [f"key-{i}" for i in range(100)]
+    cache.put_many({key: vector(i) for i, key in enumerate(keys)})
+    # Touch the first ten so they are the most recently used
+    cache.get_many(keys[:10])
+
+    cache.put_many({f"new-{i}": vector(i) for i in range(10)})
+
+    entries = cache.stats()["entries"]
+    assert entries <= 100
+    assert set(cache.get_many(keys[:10])) == set(keys[:10])
+    assert len(cache.get_many(keys[10:])) < 90
+
+
+def test_counts_entries_only_near_the_limit(tmp_path, monkeypatch):
+    cache = EmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=1000)
+    counts = []
+    original = cache._evict
+
+    def evict(written):
+        before = cache._count
+        original(written)
+        if cache._count is not before:
+            counts.append(cache._count)
+
+    monkeypatch.setattr(cache, "_evict", evict)
+    for i in range(50):
+        cache.put_many({f"key-{i}": vector(i)})
+
+    # Counted once to learn the size, then skipped while far from the limit
+    assert len(counts) == 1
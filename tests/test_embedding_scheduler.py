@@ -0,0 +1,201 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any
+import numpy as np
+import pytest
+from src.adaptive_limiter import AdaptiveLimiter
+from src.benchmarks.fakes import (
+    FakeAsyncOpenAI,
+    FakeEmbeddings,
+    ServiceProfile,
+    _openai_error,
+)
+from src.utils import embedding_scheduler
+from src.utils.embedding_scheduler import EmbeddingScheduler, TokenBucket
+
+
+class WordEncoding:
+    """One token per whitespace-separated word."""
+
+    def encode_ordinary_batch(self, texts):
+        return [text.split() for text in texts]
+
+
+def make_scheduler(client: Any = None, **kwargs: Any) -> EmbeddingScheduler:
+    client = client or FakeAsyncOpenAI(ServiceProfile(latency=0))
+    return EmbeddingScheduler(
+        client,
+        "text-embedding-3-small",
+        8,
+        rpm=0,
+        tpm=0,
+        encoding=WordEncoding(),
+        limiter=AdaptiveLimiter("test", 4, 4),
+        **kwargs,
+    )
+
+
+def test_pack_respects_input_and_token_limits():
+    scheduler = make_scheduler(max_request_inputs=3, max_request_tokens=10)
+    token_counts = [4, 4, 4, 1, 1, 1, 1, 9]
+
+    requests = scheduler._pack(list(range(len(token_counts))), token_counts)
+
+    assert [i for request in requests for i in request] == list(range(8))
+    for request in requests:
+        assert len(request) <= 3
+        assert sum(token_counts[i] for i in request) <= 10
+    assert requests == [[0, 1], [2, 3, 4], [5, 6], [7]]
+
+
+def test_embed_keeps_input_order_and_flags_invalid_inputs():
+    scheduler = make_scheduler(max_request_inputs=2)
+    texts = ["alpha beta", "", "gamma", "delta epsilon", "zeta"]
+
+    result = asyncio.run(scheduler.embed(texts))
+
+    assert result.errors[1] == "empty input"
+    assert result.failed_indices == [1]
+    for i in (0, 2, 3, 4):
+        expected = FakeEmbeddings.vector(texts[i], 8)
+        np.testing.assert_array_equal(result.embeddings[i], expected)
+
+
+class FlakyEmbeddings:
+    """Fails the first `failures` requests with a 429, then succeeds."""
+
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.calls = 0
+        self._ok = FakeAsyncOpenAI(ServiceProfile(latency=0)).embeddings
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise _openai_error(429, "Rate limit reached for requests")
+        return await self._ok.create(**kwargs)
+
+
+def test_retries_rate_limits_with_jittered_backoff(monkeypatch):
+    delays = []
+
+    async def fake_sleep(delay):
+        # The fake service also sleeps, for its zero latency
+        if delay:
+            delays.append(delay)
+
+    monkeypatch.setattr(embedding_scheduler.asyncio, "sleep", fake_sleep)
+    embeddings = FlakyEmbeddings(failures=3)
+    scheduler = make_scheduler(SimpleNamespace(embeddings=embeddings), max_retries=5)
+
+    result = asyncio.run(scheduler.embed(["one two three"]))
+
+    assert result.failed_indices == []
+    assert embeddings.calls == 4
+    # The 429s carry retry-after: 1, jittered by a factor of 0.5 to 1.5
+    assert len(delays) == 3
+    assert all(0.5 <= delay <= 1.5 for delay in delays)
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    async def fake_sleep(delay):
+        pass
+
+    monkeypatch.setattr(embedding_scheduler.asyncio, "sleep", fake_sleep)
+    embeddings = FlakyEmbeddings(failures=10)
+    scheduler = make_scheduler(SimpleNamespace(embeddings=embeddings), max_retries=2)
+
+    result = asyncio.run(scheduler.embed(["one", "two"]))
+
+    assert embeddings.calls == 3
+    assert result.failed_indices == [0, 1]
+    assert str(result.errors[0]).startswith("RateLimitError")
+
+
+def test_token_bucket_works_across_event_loops():
+    bucket = TokenBucket(6000)
+
+    async def take():
+        await asyncio.gather(*(bucket.acquire(1) for _ in range(5)))
+
+    # The scheduler is process-wide, so its buckets outlive an event loop
+    asyncio.run(take())
+    asyncio.run(take())
+
+    assert bucket.tokens == pytest.approx(5990, abs=1)
+
+
+class IdEncoding:
+    """One token per word, with the word's position as its ID."""
+
+    def encode_ordinary_batch(self, texts):
+        return [list(range(len(text.split()))) for text in texts]
+
+
+def test_oversized_inputs_average_their_token_windows():
+    scheduler = make_scheduler()
+    scheduler.encoding = IdEncoding()
+    texts = ["short text", " ".join(["word"] * 9000)]
+
+    result = asyncio.run(scheduler.embed(texts))
+
+    assert result.failed_indices == []
+    vector = FakeEmbeddings.vector
+    np.testing.assert_array_equal(result.embeddings[0], vector(texts[0], 8))
+    # Windows of 8191 and 809 tokens, averaged by length and renormalized
+    expected = 8191 * vector(list(range(8191)), 8) + 809 * vector(
+        list(range(8191, 9000)), 8
+    )
+    expected /= np.linalg.norm(expected)
+    np.testing.assert_allclose(result.embeddings[1], expected, rtol=1e-5)
+    assert np.linalg.norm(result.embeddings[1]) == pytest.approx(1.0)
+
+
+def test_windows_are_not_sent_with_text_inputs(monkeypatch):
+    client = FakeAsyncOpenAI(ServiceProfile(latency=0))
+    requests = []
+    create = client.embeddings.create
+
+    async def record(**kwargs):
+        requests.append([isinstance(item, str) for item in kwargs["input"]])
+        return await create(**kwargs)
+
+    monkeypatch.setattr(client.embeddings, "create", record)
+    scheduler = make_scheduler(client)
+    scheduler.encoding = IdEncoding()
+
+    result = asyncio.run(
+        scheduler.embed(["short text", " ".join(["word"] * 9000), "more text"])
+    )
+
+    assert result.failed_indices == []
+    assert sorted(requests) == [[False, False], [True, True]]
+
+
+def test_oversized_input_fails_if_a_window_fails(monkeypatch):
+    async def fake_sleep(delay):
+        pass
+
+    monkeypatch.setattr(embedding_scheduler.asyncio, "sleep", fake_sleep)
+    # Only the first window's request fails
+    embeddings = FlakyEmbeddings(failures=1)
+    scheduler = make_scheduler(
+        SimpleNamespace(embeddings=embeddings), max_retries=0, max_request_inputs=1
+    )
+    scheduler.encoding = IdEncoding()
+
+    result = asyncio.run(scheduler.embed(["word " * 9000]))
+
+    assert embeddings.calls == 2
+    assert result.failed_indices == [0]
+    assert not result.embeddings[0].any()
+
+
+def test_a_document_over_the_input_limit_is_indexed(pipeline):
+    from src.document_handler import process_file_event
+
+    # One sentence far over 8191 tokens, so it is chunked as a single chunk
+    file_info = pipeline.write("long.txt", " ".join(["word"] * 9000))
+
+    assert asyncio.run(process_file_event(file_info, "s3:ObjectCreated:Put"))
+    assert pipeline.ids("long.txt") == ["long.txt-chunk-0"]
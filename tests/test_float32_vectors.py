@@ -0,0 +1,46 @@
+import asyncio
+import base64
+import numpy as np
+from src.utils.embedding_scheduler import decode_embedding
+from src.utils.embeddings import generate_document_embeddings, to_pinecone_vector
+
+
+def test_base64_round_trips_to_the_same_float32_values():
+    vector = np.random.default_rng(0).standard_normal(1536).astype("<f4")
+    encoded = base64.b64encode(vector.tobytes()).decode("ascii")
+
+    decoded = decode_embedding(encoded)
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, vector)
+
+
+def test_float_lists_decode_to_float32():
+    decoded = decode_embedding([0.25, -1.5, 3.0])
+
+    assert decoded.dtype == np.float32
+    np.testing.assert_array_equal(decoded, [0.25, -1.5, 3.0])
+
+
+def test_pinecone_vectors_get_plain_lists_of_the_same_values():
+    values = np.array([0.1, -0.2, 0.3], dtype=np.float32)
+    record = {"id": "doc-chunk-0", "values": values, "metadata": {"a": 1}}
+
+    converted = to_pinecone_vector(record)
+
+    assert isinstance(converted["values"], list)
+    assert np.array_equal(np.asarray(converted["values"], dtype=np.float32), values)
+    assert converted["metadata"] == {"a": 1}
+    # Records that already hold lists pass through untouched
+    assert to_pinecone_vector(converted) is converted
+
+
+def test_embeddings_arrive_as_one_float32_matrix(pipeline):
+    texts = ["alpha beta", "gamma delta", "epsilon"]
+
+    result = asyncio.run(generate_document_embeddings(texts))
+
+    assert result.embeddings.dtype == np.float32
+    assert result.embeddings.shape == (3, 1536)
+    expected = pipeline.openai.embeddings.vector(texts[1], 1536)
+    np.testing.assert_array_equal(result.embeddings[1], expected)
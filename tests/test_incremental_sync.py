@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from src.document_handler import process_file_event
+from src.utils import configure_document_manifest, get_document_manifest
+
+CREATED = "s3:ObjectCreated:Put"
+
+
+def sentences(start: int, end: int) -> str:
+    return " ".join(
+        f"Sentence number {i} is about topic {i} of the report."
+        for i in range(start, end)
+    )
+
+
+def index_file(pipeline, key: str, text: str) -> None:
+    file_info = pipeline.write(key, text)
+    assert asyncio.run(process_file_event(file_info, CREATED))
+
+
+@pytest.fixture(params=["manifest", "no-manifest"])
+def synced(request, pipeline):
+    """Run each test with and without the document manifest."""
+    if request.param == "no-manifest":
+        configure_document_manifest(enabled=False)
+    return pipeline
+
+
+def test_unchanged_document_is_not_reembedded(synced):
+    index_file(synced, "doc.txt", sentences(0, 300))
+    embedded = synced.embedded
+
+    # A new ETag, but the same chunks
+    index_file(synced, "doc.txt", sentences(0, 300) + " ")
+
+    assert synced.embedded == embedded
+
+
+def test_shrink_deletes_trailing_chunks(synced):
+    index_file(synced, "doc.txt", sentences(0, 300))
+    before = len(synced.ids("doc.txt"))
+
+    index_file(synced, "doc.txt", sentences(0, 60))
+
+    after = synced.ids("doc.txt")
+    assert 0 < len(after) < before
+    assert after == sorted(f"doc.txt-chunk-{i}" for i in range(len(after)))
+    manifest = get_document_manifest()
+    if manifest is not None:
+        assert manifest.get_chunk_count("test-bucket", "doc.txt") == len(after)
+
+
+def test_grow_embeds_only_new_chunks(synced):
+    index_file(synced, "doc.txt", sentences(0, 200))
+    before = len(synced.ids("doc.txt"))
+    embedded = synced.embedded
+
+    index_file(synced, "doc.txt", sentences(0, 400))
+
+    after = len(synced.ids("doc.txt"))
+    assert after > before
+    # The old last chunk was partial and now continues; earlier ones are kept
+    assert synced.embedded - embedded == after - (before - 1)
+
+
+def test_tail_change_reembeds_last_chunk_only(synced):
+    index_file(synced, "doc.txt", sentences(0, 300))
+    ids = synced.ids("doc.txt")
+    embedded = synced.embedded
+
+    index_file(synced, "doc.txt", sentences(0, 299) + " The ending changed.")
+
+    assert synced.ids("doc.txt") == ids
+    assert synced.embedded - embedded == 1
+
+
+def test_delete_event_removes_every_chunk(synced):
+    index_file(synced, "doc.txt", sentences(0, 300))
+    file_info = {"bucket_name": "test-bucket", "object_key": "doc.txt"}
+
+    assert asyncio.run(process_file_event(file_info, "s3:ObjectRemoved:Delete"))
+
+    assert synced.ids("doc.txt") == []
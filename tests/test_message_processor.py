@@ -0,0 +1,140 @@
+import asyncio
+import json
+from typing import Any, List, Optional, Tuple
+import pytest
+from src import message_processor
+from src.message_processor import coalesce_file_events, process_messages
+
+CREATED = "s3:ObjectCreated:Put"
+REMOVED = "s3:ObjectRemoved:Delete"
+
+
+def message(key: str, event_type: str = CREATED, message_id: Optional[str] = None):
+    return {
+        "MessageId": message_id or f"{key}:{event_type}",
+        "Body": json.dumps({"bucket": "bucket", "key": key, "eventType": event_type}),
+    }
+
+
+@pytest.fixture(autouse=True)
+def small_lane(monkeypatch):
+    """Classify every event as small without asking S3 for its size."""
+
+    async def classify(file_info):
+        return "small"
+
+    monkeypatch.setattr(message_processor, "classify_file_event", classify)
+
+
+class Recorder:
+    """Processing callback that records calls and how many run at once."""
+
+    def __init__(self, delay: float = 0.0, result: Any = True):
+        self.delay = delay
+        self.result = result
+        self.calls: List[Tuple[str, str]] = []
+        self.in_flight = 0
+        self.peak = 0
+
+    async def __call__(self, file_info, event_type):
+        self.calls.append((file_info["object_key"], event_type))
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+            return self.result
+        finally:
+            self.in_flight -= 1
+
+
+def test_events_for_one_object_run_in_arrival_order():
+    callback = Recorder(delay=0.01)
+    messages = [
+        message("a", CREATED, "1"),
+        message("a", REMOVED, "2"),
+        message("a", CREATED, "3"),
+    ]
+
+    asyncio.run(process_messages(messages, callback, coalesce=False))
+
+    assert callback.calls == [("a", CREATED), ("a", REMOVED), ("a", CREATED)]
+    assert callback.peak == 1
+
+
+def test_unparseable_messages_fail():
+    results = asyncio.run(
+        process_messages([{"MessageId": "x", "Body": "not json"}], Recorder())
+    )
+    assert results == [False]
+
+
+def test_concurrency_is_bounded():
+    callback = Recorder(delay=0.02)
+
+    results = asyncio.run(
+        process_messages([message(f"a{i}") for i in range(10)], callback, 4)
+    )
+
+    assert results == [True] * 10
+    assert callback.peak == 4
+
+
+def test_concurrent_batches_share_the_concurrency_limit():
+    callback = Recorder(delay=0.02)
+
+    async def two_batches():
+        await asyncio.gather(
+            process_messages([message(f"a{i}") for i in range(8)], callback, 3),
+            process_messages([message(f"b{i}") for i in range(8)], callback, 3),
+        )
+
+    asyncio.run(two_batches())
+
+    assert len(callback.calls) == 16
+    assert callback.peak == 3
+
+
+def test_size_requests_are_bounded(monkeypatch):
+    sizing = Recorder(delay=0.02, result="small")
+
+    async def classify(file_info):
+        return await sizing(file_info, file_info["event_type"])
+
+    monkeypatch.setattr(message_processor, "classify_file_event", classify)
+
+    asyncio.run(process_messages([message(f"a{i}") for i in range(10)], Recorder(), 3))
+
+    assert len(sizing.calls) == 10
+    assert sizing.peak == 3
+
+
+def test_coalesce_keeps_the_last_event_per_object():
+    file_infos = [
+        (0, {"bucket_name": "b", "object_key": "a", "event_type": CREATED}),
+        (1, {"bucket_name": "b", "object_key": "c", "event_type": CREATED}),
+        (2, {"bucket_name": "b", "object_key": "a", "event_type": REMOVED}),
+        (3, {"bucket_name": "b", "object_key": "a", "event_type": CREATED}),
+    ]
+
+    operations = coalesce_file_events(file_infos)
+
+    assert [(index, superseded) for index, _, superseded in operations] == [
+        (1, []),
+        (3, [0, 2]),
+    ]
+
+
+def test_superseded_messages_share_the_result():
+    callback = Recorder()
+    messages = [message("a"), message("a", REMOVED), message("b")]
+    acked = []
+
+    results = asyncio.run(
+        process_messages(
+            messages, callback, on_result=lambda i, ok: acked.append((i, ok))
+        )
+    )
+
+    assert sorted(callback.calls) == [("a", REMOVED), ("b", CREATED)]
+    assert results == [True, True, True]
+    assert sorted(acked) == [(0, True), (1, True), (2, True)]
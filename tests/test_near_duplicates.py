@@ -0,0 +1,58 @@
+import pytest
+from src.utils.near_duplicates import NearDuplicateIndex, _words, simhash
+
+BASE = " ".join(f"Sentence {i} of the shared policy text." for i in range(8))
+
+
+def edited(distance: int) -> str:
+    """Return BASE with one word changed so its SimHash is `distance` bits off."""
+    words = _words(BASE)
+    target = simhash(words)
+    for k in range(1000):
+        changed = list(words)
+        changed[k % len(words)] = f"edited{k}"
+        if bin(simhash(changed) ^ target).count("1") == distance:
+            return " ".join(changed)
+    raise AssertionError(f"no single-word edit is {distance} bits away")
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"), threshold=0.95)
+    yield index
+    index.close()
+
+
+def test_match_at_the_threshold(index):
+    assert index.max_distance == 3
+    index.add_many("model", {"base-key": BASE})
+
+    found = index.find_many("model", [BASE, edited(index.max_distance)])
+
+    assert found == {0: "base-key", 1: "base-key"}
+    assert index.stats() == {"lookups": 2, "hits": 2, "entries": 1}
+
+
+def test_no_match_past_the_threshold(index):
+    index.add_many("model", {"base-key": BASE})
+
+    assert index.find_many("model", [edited(index.max_distance + 1)]) == {}
+
+
+def test_matches_are_scoped_by_model_and_skip_short_texts(index):
+    index.add_many("model", {"base-key": BASE, "short-key": "Too short to match."})
+
+    assert index.find_many("other-model", [BASE]) == {}
+    assert index.find_many("model", ["Too short to match."]) == {}
+    assert index.stats()["entries"] == 1
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    index = NearDuplicateIndex(path=str(tmp_path / "near.sqlite3"), max_entries=10)
+    for i in range(12):
+        index.add_many("model", {f"key-{i}": f"Document {i}. {BASE}"})
+
+    # The 11th entry trims the index to 9, the 12th brings it back to 10
+    keys = {key for (key,) in index._conn.execute("SELECT key FROM entries")}
+    assert keys == {f"key-{i}" for i in range(2, 12)}
+    index.close()
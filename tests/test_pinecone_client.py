@@ -0,0 +1,79 @@
+import asyncio
+import sys
+import threading
+import types
+from typing import Any
+import pytest
+from src.clients import pinecone_client
+from src.utils.embeddings import delete_embeddings
+
+
+class RecordingClient:
+    def __init__(self, api_key=None):
+        self.api_key = api_key
+
+    def Index(self, name, pool_threads=None):
+        return types.SimpleNamespace(name=name, pool_threads=pool_threads)
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    """Let each test build the client and index from scratch."""
+    monkeypatch.setattr(pinecone_client, "_client", None)
+    monkeypatch.setattr(pinecone_client, "_index", None)
+    monkeypatch.setenv("PINECONE_INDEX", "test-index")
+
+
+def test_grpc_transport_uses_the_grpc_client(fresh_client, monkeypatch):
+    grpc: Any = types.ModuleType("pinecone.grpc")
+    grpc.PineconeGRPC = RecordingClient
+    monkeypatch.setitem(sys.modules, "pinecone.grpc", grpc)
+    monkeypatch.setattr(pinecone_client, "PINECONE_TRANSPORT", "grpc")
+    monkeypatch.setattr(pinecone_client, "PINECONE_POOL_SIZE", 7)
+
+    index = pinecone_client.get_pinecone_index()
+
+    assert isinstance(pinecone_client.get_pinecone_client(), RecordingClient)
+    assert (index.name, index.pool_threads) == ("test-index", 7)
+
+
+def test_unknown_transport_is_rejected(fresh_client, monkeypatch):
+    monkeypatch.setattr(pinecone_client, "PINECONE_TRANSPORT", "carrier-pigeon")
+
+    with pytest.raises(ValueError, match="PINECONE_TRANSPORT"):
+        pinecone_client.get_pinecone_client()
+
+
+def test_async_index_calls_run_on_the_pinecone_pool(pipeline):
+    threads = []
+
+    def describe_index_stats(**kwargs):
+        threads.append(threading.current_thread().name)
+        return {"total_vector_count": 0}
+
+    pipeline.index.describe_index_stats = describe_index_stats
+
+    assert asyncio.run(pinecone_client.call_pinecone_index("describe_index_stats"))
+    assert threads[0].startswith("pinecone")
+
+
+def test_large_deletes_are_split_into_parallel_batches(pipeline):
+    ids = [f"doc.txt-chunk-{i}" for i in range(2500)]
+    pipeline.index.vectors.update({vid: {"id": vid} for vid in ids})
+    pipeline.index.vectors["other.txt-chunk-0"] = {"id": "other.txt-chunk-0"}
+
+    # The index rejects deletes of more than 1000 IDs
+    assert delete_embeddings(ids=ids)
+
+    assert list(pipeline.index.vectors) == ["other.txt-chunk-0"]
+    assert pipeline.index.recorder.requests == 3
+
+
+def test_prefix_deletes_remove_every_listed_page(pipeline):
+    ids = [f"doc.txt-chunk-{i}" for i in range(250)]
+    pipeline.index.vectors.update({vid: {"id": vid} for vid in ids})
+    pipeline.index.vectors["other.txt-chunk-0"] = {"id": "other.txt-chunk-0"}
+
+    assert delete_embeddings(id_prefix="doc.txt-chunk-")
+
+    assert list(pipeline.index.vectors) == ["other.txt-chunk-0"]
@@ -0,0 +1,80 @@
+import asyncio
+from src.document_handler import process_file_event
+from src.file_processor import (
+    download_and_process_file,
+    warn_if_skip_unchanged_inactive,
+)
+from src.utils import configure_document_manifest, get_document_manifest
+
+CREATED = "s3:ObjectCreated:Put"
+TEXT = "The quarterly report covers revenue. It also covers costs. " * 20
+
+
+def test_indexed_etag_from_listing_skips_the_download(pipeline):
+    file_info = pipeline.write("doc.txt", TEXT)
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+    gets = pipeline.s3.gets
+    etag = pipeline.s3.head_object(Bucket="test-bucket", Key="doc.txt")["ETag"]
+
+    file_info = {**file_info, "etag": etag}
+    docs, success = asyncio.run(download_and_process_file(file_info))
+
+    assert (docs, success) == ([], True)
+    assert file_info["unchanged"]
+    assert pipeline.s3.gets == gets
+
+
+def test_unchanged_object_is_not_downloaded_again(pipeline):
+    file_info = pipeline.write("doc.txt", TEXT)
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+    gets = pipeline.s3.gets
+    embedded = pipeline.embedded
+
+    # No ETag in the event: the conditional GET answers 304 Not Modified
+    event = dict(file_info)
+    assert asyncio.run(process_file_event(event, CREATED))
+
+    assert event["unchanged"]
+    assert pipeline.s3.gets == gets
+    assert pipeline.embedded == embedded
+
+
+def test_changed_object_is_downloaded_and_recorded(pipeline):
+    file_info = pipeline.write("doc.txt", TEXT)
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+    gets = pipeline.s3.gets
+
+    pipeline.write("doc.txt", TEXT + " A new closing sentence.")
+    event = dict(file_info)
+    assert asyncio.run(process_file_event(event, CREATED))
+
+    assert not event.get("unchanged")
+    assert pipeline.s3.gets == gets + 1
+    etag = pipeline.s3.head_object(Bucket="test-bucket", Key="doc.txt")["ETag"]
+    manifest = get_document_manifest()
+    assert manifest is not None
+    assert manifest.get_indexed_etag("test-bucket", "doc.txt") == etag
+
+
+def test_skip_unchanged_can_be_turned_off(pipeline):
+    file_info = pipeline.write("doc.txt", TEXT)
+    assert asyncio.run(process_file_event(dict(file_info), CREATED))
+    gets = pipeline.s3.gets
+
+    docs, success = asyncio.run(
+        download_and_process_file(dict(file_info), skip_unchanged=False)
+    )
+
+    assert success and docs
+    assert pipeline.s3.gets == gets + 1
+
+
+def test_warns_when_the_manifest_is_off(pipeline, capsys):
+    warn_if_skip_unchanged_inactive(True)
+    assert capsys.readouterr().out == ""
+
+    configure_document_manifest(enabled=False)
+    warn_if_skip_unchanged_inactive(False)
+    assert capsys.readouterr().out == ""
+    warn_if_skip_unchanged_inactive(True)
+    assert "DOCUMENT_MANIFEST_ENABLED" in capsys.readouterr().out
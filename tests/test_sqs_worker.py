@@ -0,0 +1,125 @@
+import asyncio
+import json
+import pytest
+from src import message_processor
+from src.benchmarks.fakes import InMemorySQS
+from src.clients import aws
+from src.sqs_worker import SQSWorker
+
+QUEUE_URL = "queue"
+
+
+@pytest.fixture
+def sqs(monkeypatch):
+    async def classify(file_info):
+        return "small"
+
+    queue = InMemorySQS()
+    monkeypatch.setitem(aws._clients, "sqs", queue)
+    monkeypatch.setattr(message_processor, "classify_file_event", classify)
+    return queue
+
+
+def send(sqs: InMemorySQS, key: str) -> None:
+    body = {"bucket": "bucket", "key": key, "eventType": "s3:ObjectCreated:Put"}
+    sqs.send_message(QueueUrl=QUEUE_URL, MessageBody=json.dumps(body))
+
+
+def run_until(worker: SQSWorker, done) -> None:
+    """Run the worker until done() is true, then stop it and wait for the drain."""
+
+    async def main():
+        task = asyncio.ensure_future(worker.run())
+        while not done():
+            await asyncio.sleep(0.01)
+        worker.stop()
+        await task
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+
+def test_only_successful_messages_are_acknowledged(sqs):
+    calls = []
+
+    async def callback(file_info, event_type):
+        calls.append(file_info["object_key"])
+        return file_info["object_key"] != "bad.txt"
+
+    send(sqs, "ok.txt")
+    send(sqs, "bad.txt")
+    worker = SQSWorker(QUEUE_URL, callback, wait_time_seconds=1)
+
+    run_until(worker, lambda: worker.succeeded + worker.failed == 2)
+
+    assert sorted(calls) == ["bad.txt", "ok.txt"]
+    assert sqs.deleted == 1
+    # The failed message stays in the queue for redelivery
+    remaining = [json.loads(m["Body"])["key"] for m in sqs._messages.values()]
+    assert remaining == ["bad.txt"]
+
+
+def test_heartbeat_keeps_long_messages_invisible(sqs):
+    calls = []
+
+    async def callback(file_info, event_type):
+        calls.append(file_info["object_key"])
+        # Outlasts the visibility timeout several times over
+        await asyncio.sleep(1.5)
+        return True
+
+    send(sqs, "slow.txt")
+    worker = SQSWorker(
+        QUEUE_URL,
+        callback,
+        visibility_timeout=1,
+        heartbeat_interval=0.2,
+        wait_time_seconds=1,
+    )
+
+    run_until(worker, lambda: worker.succeeded == 1)
+
+    assert calls == ["slow.txt"]
+    assert sqs.redelivered == 0
+    assert len(sqs) == 0
+
+
+def test_stop_drains_in_flight_messages(sqs):
+    started = asyncio.Event()
+
+    async def callback(file_info, event_type):
+        started.set()
+        await asyncio.sleep(0.3)
+        return True
+
+    send(sqs, "a.txt")
+    worker = SQSWorker(QUEUE_URL, callback, wait_time_seconds=1)
+
+    async def main():
+        task = asyncio.ensure_future(worker.run())
+        await started.wait()
+        worker.stop()
+        await task
+
+    asyncio.run(asyncio.wait_for(main(), timeout=10))
+
+    # Stopping waited for the message to finish and acknowledged it
+    assert worker.succeeded == 1
+    assert sqs.deleted == 1
+
+
+def test_receiving_pauses_while_at_the_in_flight_limit(sqs):
+    peak = []
+
+    async def callback(file_info, event_type):
+        peak.append(len(worker._in_flight))
+        await asyncio.sleep(0.05)
+        return True
+
+    for i in range(30):
+        send(sqs, f"{i}.txt")
+    worker = SQSWorker(QUEUE_URL, callback, max_in_flight=10, wait_time_seconds=1)
+
+    run_until(worker, lambda: worker.succeeded == 30)
+
+    assert max(peak) <= 10
+    assert sqs.deleted == 30
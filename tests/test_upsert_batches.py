@@ -0,0 +1,121 @@
+import asyncio
+from types import SimpleNamespace
+from typing import List
+import numpy as np
+from langchain_core.documents import Document
+from src.benchmarks.fakes import PineconeServiceError
+from src.embedding_manager import generate_and_upsert_embeddings
+from src.utils.embeddings import (
+    PINECONE_MAX_BATCH_VECTORS,
+    pack_vector_batches,
+    upsert_embeddings_batch,
+    upsert_vectors,
+)
+from src.utils import embeddings
+
+
+def vectors(count: int, text: str = "chunk"):
+    return [
+        {
+            "id": f"doc.txt-chunk-{i}",
+            "values": np.zeros(8, dtype=np.float32),
+            "metadata": {"chunk_text": text},
+        }
+        for i in range(count)
+    ]
+
+
+def reject_once(index, failing_id: str, status: int = 400):
+    """Make the index reject the first upsert that contains failing_id."""
+    upsert = index.upsert
+    calls = []
+
+    def flaky_upsert(vectors, **kwargs):
+        ids = [vector["id"] for vector in vectors]
+        calls.append(ids)
+        if failing_id in ids and sum(failing_id in c for c in calls) == 1:
+            raise PineconeServiceError(status, "Rejected")
+        return upsert(vectors, **kwargs)
+
+    index.upsert = flaky_upsert
+    return calls
+
+
+def test_batches_keep_order_and_respect_the_vector_limit():
+    batches = pack_vector_batches(vectors(250), max_vectors=100)
+
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert [v["id"] for batch in batches for v in batch] == [
+        v["id"] for v in vectors(250)
+    ]
+
+
+def test_batch_size_is_capped_at_the_pinecone_limit():
+    batches = pack_vector_batches(vectors(2500), max_vectors=5000)
+
+    assert max(len(batch) for batch in batches) == PINECONE_MAX_BATCH_VECTORS
+
+
+def test_batches_respect_the_request_size_limit():
+    # Each record is about 10 KB, so 100 of them need more than one request
+    big = vectors(100, text="x" * 10000)
+
+    batches = pack_vector_batches(big, max_vectors=100, max_bytes=200 * 1024)
+
+    assert len(batches) > 1
+    assert all(len(batch) <= 18 for batch in batches)
+    assert sum(len(batch) for batch in batches) == 100
+
+
+def test_a_single_oversized_record_still_gets_a_batch():
+    batches = pack_vector_batches(vectors(2, text="x" * 5000), max_bytes=1000)
+
+    assert [len(batch) for batch in batches] == [1, 1]
+
+
+def test_upsert_reports_each_vector(pipeline):
+    reject_once(pipeline.index, "doc.txt-chunk-3")
+
+    results = asyncio.run(upsert_embeddings_batch(vectors(10), batch_size=4))
+
+    # Only the batch holding chunk 3 failed
+    assert [i for i in range(10) if not results[f"doc.txt-chunk-{i}"]] == [0, 1, 2, 3]
+    assert len(pipeline.index) == 6
+
+
+def test_failed_batches_are_retried_alone(pipeline):
+    calls = reject_once(pipeline.index, "doc.txt-chunk-120")
+    docs = [Document(page_content=f"Chunk number {i}.") for i in range(150)]
+    file_info = {"bucket_name": "test-bucket", "object_key": "doc.txt"}
+
+    assert asyncio.run(generate_and_upsert_embeddings(docs, file_info))
+
+    assert len(pipeline.index) == 150
+    # Every batch once, then a retry of only the one that failed
+    failed = [ids for ids in calls if "doc.txt-chunk-120" in ids]
+    assert len(failed) == 2 and failed[0] == failed[1] == calls[-1]
+    assert sum(len(ids) for ids in calls) == 150 + len(failed[0])
+
+
+def test_blocking_upsert_retries_throttled_batches(pipeline, monkeypatch):
+    sleeps: List[float] = []
+    monkeypatch.setattr(embeddings, "time", SimpleNamespace(sleep=sleeps.append))
+    calls = reject_once(pipeline.index, "doc.txt-chunk-5", status=429)
+
+    results = upsert_vectors(vectors(10), batch_size=4)
+
+    assert all(results.values()) and len(pipeline.index) == 10
+    # Only the throttled batch is sent again, after one backoff
+    assert len(calls) == 4 and calls[-1] == calls[1]
+    assert len(sleeps) == 1
+
+
+def test_blocking_upsert_does_not_retry_rejected_batches(pipeline, monkeypatch):
+    sleeps: List[float] = []
+    monkeypatch.setattr(embeddings, "time", SimpleNamespace(sleep=sleeps.append))
+    calls = reject_once(pipeline.index, "doc.txt-chunk-5")
+
+    results = upsert_vectors(vectors(10), batch_size=4)
+
+    assert [i for i in range(10) if not results[f"doc.txt-chunk-{i}"]] == [4, 5, 6, 7]
+    assert len(calls) == 3 and sleeps == []
@@ -0,0 +1,125 @@
+import time
+import pytest
+from src.utils import upsert_outbox
+from src.utils.upsert_outbox import UpsertOutbox
+
+
+def vectors(*ids):
+    return [
+        {
+            "id": vector_id,
+            "values": [float(i), 1.0],
+            "metadata": {"bucketName": "bucket", "objectKey": "doc.txt"},
+        }
+        for i, vector_id in enumerate(ids)
+    ]
+
+
+class FakeUpsert:
+    """Stands in for upsert_vectors, failing the IDs in `failing`."""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.sent = []
+
+    def __call__(self, batch):
+        self.sent.append([vector["id"] for vector in batch])
+        return {vector["id"]: vector["id"] not in self.failing for vector in batch}
+
+
+@pytest.fixture
+def outbox(tmp_path):
+    box = UpsertOutbox(path=str(tmp_path / "outbox.sqlite3"), max_attempts=3)
+    yield box
+    box.close()
+
+
+def make_due(outbox):
+    with outbox._lock:
+        outbox._conn.execute("UPDATE outbox SET next_attempt = 0")
+        outbox._conn.commit()
+
+
+def test_flush_sends_and_removes_vectors(outbox, monkeypatch):
+    upsert = FakeUpsert()
+    monkeypatch.setattr(upsert_outbox, "upsert_vectors", upsert)
+    outbox.put_many(vectors("a", "b"))
+
+    assert outbox.flush() == 2
+
+    assert upsert.sent == [["a", "b"]]
+    assert outbox.pending_count() == 0
+
+
+def test_spooling_an_id_again_replaces_it(outbox, monkeypatch):
+    upsert = FakeUpsert()
+    monkeypatch.setattr(upsert_outbox, "upsert_vectors", upsert)
+    outbox.put_many(vectors("a"))
+    outbox.put_many(vectors("a"))
+
+    outbox.flush()
+
+    assert upsert.sent == [["a"]]
+
+
+def test_failed_vectors_are_retried_with_backoff(outbox, monkeypatch):
+    upsert = FakeUpsert(failing={"b"})
+    monkeypatch.setattr(upsert_outbox, "upsert_vectors", upsert)
+    outbox.put_many(vectors("a", "b"))
+
+    assert outbox.flush() == 1
+
+    assert outbox.pending_ids("bucket", "doc.txt") == ["b"]
+    # Not due again until its backoff has passed
+    assert outbox.flush() == 0
+    attempts, next_attempt = outbox._conn.execute(
+        "SELECT attempts, next_attempt FROM outbox WHERE id = 'b'"
+    ).fetchone()
+    assert attempts == 1
+    assert next_attempt > time.time()
+
+    upsert.failing.clear()
+    make_due(outbox)
+    assert outbox.flush() == 1
+    assert outbox.pending_count() == 0
+
+
+def test_moves_vectors_to_dead_letter_after_max_attempts(outbox, monkeypatch):
+    monkeypatch.setattr(upsert_outbox, "upsert_vectors", FakeUpsert(failing={"b"}))
+    outbox.put_many(vectors("a", "b"))
+
+    for _ in range(outbox.max_attempts):
+        make_due(outbox)
+        outbox.flush()
+
+    assert outbox.pending_count() == 0
+    assert outbox.dead_letter_count() == 1
+    vector_id, attempts = outbox._conn.execute(
+        "SELECT id, attempts FROM dead_letter"
+    ).fetchone()
+    assert (vector_id, attempts) == ("b", 3)
+
+
+def test_discard_drops_pending_vectors(outbox):
+    outbox.put_many(vectors("a", "b"))
+
+    outbox.discard_ids(["a"])
+    assert outbox.pending_ids("bucket", "doc.txt") == ["b"]
+    outbox.discard_object("bucket", "doc.txt")
+    assert outbox.pending_count() == 0
+
+
+def test_leftover_vectors_are_sent_after_a_restart(tmp_path, monkeypatch):
+    upsert = FakeUpsert()
+    monkeypatch.setattr(upsert_outbox, "upsert_vectors", upsert)
+    path = str(tmp_path / "outbox.sqlite3")
+    first = UpsertOutbox(path=path)
+    first.put_many(vectors("a"))
+    first.close()
+
+    second = UpsertOutbox(path=path)
+    try:
+        assert second.drain(timeout=5)
+    finally:
+        second.close()
+    assert upsert.sent == [["a"]]